@@ -1,73 +1,355 @@
-from fastapi import APIRouter, HTTPException
-from app.models.food_truck import SearchRequest, SearchResponse, SearchType
+import asyncio
+from fastapi import APIRouter, Header, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+from app.models.food_truck import (
+    SearchRequest, SearchResponse, BatchSearchRequest, BatchSearchResponse, CacheStatsResponse, WorkerPoolStatsResponse,
+    StreamFormat
+)
 from app.dataloader.food_truck_loader import data_loader
-from app.utils.search_utils import (
-    search_by_name, 
-    search_by_street, 
-    search_by_proximity, 
-    apply_status_filter
+from app.utils.search_utils import SearchHits, execute_search, execute_batch, materialize, result_limit, validate_search
+from app.utils.result_cache import ResultCache, request_cache_key
+from app.utils.pagination import encode_cursor, decode_cursor
+from app.utils.profiling import SearchProfile, profile_stage, profiling, record_step
+from app.utils.worker_pool import WorkerPool, PoolSaturatedError
+from app import config
+from app.utils.mappers import (
+    convert_to_food_trucks,
+    create_search_metadata,
+    serialize_food_truck,
+    assemble_search_response,
+    assemble_batch_response,
+    stream_search_response,
+    stream_ndjson,
+    failed_search_response
 )
-from app.utils.mappers import convert_to_food_trucks, create_search_metadata
 
 router = APIRouter()
 
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+STREAM_RETRY_SECONDS = 0.05  # Wait before a streamed body part retries a saturated worker pool
+
+# Search results (row hits) of repeated queries, dropped whenever a new snapshot is published
+result_cache = ResultCache(config.SEARCH_CACHE_MAX_ENTRIES, config.SEARCH_CACHE_TTL_SECONDS)
+
+# Result orderings of searches being paged through with cursors, kept for a short time-to-live
+ordering_cache = ResultCache(config.SEARCH_CURSOR_MAX_ENTRIES, config.SEARCH_CURSOR_TTL_SECONDS)
+
+# Searches run here rather than on the event loop; excess load is rejected with 503
+search_pool = WorkerPool(config.SEARCH_WORKERS, config.SEARCH_QUEUE_DEPTH, name="search")
+
 @router.post("/search", response_model=SearchResponse, tags=["Search"])
-async def search_food_trucks(search_request: SearchRequest):
+async def search_food_trucks(search_request: SearchRequest, stream: Optional[StreamFormat] = None,
+                             accept: Optional[str] = Header(None)):
     """
     Search for food trucks by name, street, or proximity
     
     - **query_type**: Type of search (name, street, or proximity)
     - **applicant**: Business name for name search
+    - **fuzzy**: Name search also matches names with typos, ranked by similarity
     - **street**: Street name for street search  
     - **latitude**: Latitude for proximity search
     - **longitude**: Longitude for proximity search
+    - **radius_km**: Optional radius for proximity search; returns every truck within it
     - **status**: Optional status filter
     - **limit**: Maximum number of results (default: 10, max: 100)
+    - **max_results**: Maximum number of results for radius search (default and max: 1000)
+    - **cursor**: `metadata.next_cursor` of the previous page; send it with the same search to get the next page
+    - **explain**: Run the search even if its result is cached and return its plan (indexes and partitions
+      used, candidates left after each step) and stage timings in `metadata.explain`
+    
+    With `?stream=ndjson` (or `Accept: application/x-ndjson`) or `?stream=json` every result, up to
+    `SEARCH_STREAM_MAX_RESULTS`, is streamed as one FoodTruck per line or as a chunked SearchResponse;
+    `limit` and `max_results` do not apply.
     """
     try:
-        # Get data from loader with auto-reload
-        df = data_loader.get_data()
-        if not data_loader.is_data_available():
+        # Pin one snapshot (data plus precomputed search structures) for the whole request
+        snapshot = data_loader.get_snapshot()
+        if snapshot is None or not data_loader.is_data_available():
             raise HTTPException(status_code=500, detail="Data not available")
         
-        # Perform search based on query type
-        if search_request.query_type == SearchType.NAME:
-            filtered_df = search_by_name(df, search_request.applicant, search_request.status)
-        elif search_request.query_type == SearchType.STREET:
-            filtered_df = search_by_street(df, search_request.street, search_request.status)
-        elif search_request.query_type == SearchType.PROXIMITY:
-            filtered_df = search_by_proximity(df, search_request.latitude, search_request.longitude, search_request.status)
+        if stream is None and accept and NDJSON_MEDIA_TYPE in accept:
+            stream = StreamFormat.NDJSON
+        if stream is not None:
+            return await search_pool.run(_stream_search, snapshot, search_request, stream)
         
-        # Limit results - different defaults based on search type
-        if search_request.query_type == SearchType.PROXIMITY:
-            limit = search_request.limit or 5  # Default 5 for proximity search
-        else:
-            limit = search_request.limit or 10  # Default 10 for name/street search
-        filtered_df = filtered_df.head(limit)
+        # Search on the worker pool so the event loop stays free for other requests
+        return await search_pool.run(_search, snapshot, search_request)
         
-        # Convert to FoodTruck objects
-        results = convert_to_food_trucks(filtered_df)
+    except PoolSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _search(snapshot, search_request: SearchRequest):
+    """Run one search and build its response; executed on the worker pool"""
+    validate_search(search_request)
+    
+    # Limit results - different defaults based on search type
+    limit = result_limit(search_request)
+    
+    # Explained searches collect their plan and timings in a profile active for this thread only
+    profile = SearchProfile() if search_request.explain else None
+    with profiling(profile):
+        if search_request.cursor is not None:
+            hits, offset, next_cursor = _cursor_page(snapshot, search_request, limit)
+        else:
+            # Run the search on row positions unless the same normalized request was answered recently
+            # (explained searches always run); only the returned rows are materialized
+            cache_key = request_cache_key(search_request, limit, config.SEARCH_CACHE_COORDINATE_PRECISION)
+            hits = None if profile is not None else result_cache.get(snapshot, cache_key)
+            if hits is None:
+                hits = execute_search(snapshot, search_request, limit)
+                result_cache.put(snapshot, cache_key, hits)
+            offset, next_cursor = 0, _first_page_cursor(snapshot, search_request, limit, hits)
         
         # Create metadata
-        metadata = create_search_metadata(
-            search_request.query_type,
-            search_request.status,
-            limit,
-            search_request.latitude,
-            search_request.longitude
-        )
-        metadata["total_results"] = len(results)
+        metadata = _request_metadata(search_request, limit)
+        metadata["total_results"] = len(hits.rows)
+        metadata["offset"] = offset
+        metadata["next_cursor"] = next_cursor
+        message = f"Search completed successfully. Found {len(hits.rows)} results."
         
-        return SearchResponse(
-            success=True,
-            message=f"Search completed successfully. Found {len(results)} results.",
-            data=results,
-            metadata=metadata
-        )
+        # Assemble the body from the snapshot's pre-serialized trucks when all of them have one
+        with profile_stage('materialize'):
+            fragments = snapshot.truck_fragments(hits.rows)
+        if fragments is not None:
+            with profile_stage('serialize'):
+                body = assemble_search_response(message, fragments, metadata)
+            if profile is not None:
+                # The timings are only complete once the body is built, so build it again with them
+                metadata["explain"] = profile.to_dict()
+                body = assemble_search_response(message, fragments, metadata)
+            return Response(content=body, media_type="application/json")
         
+        # Convert to FoodTruck objects
+        with profile_stage('materialize'):
+            results = convert_to_food_trucks(materialize(snapshot, hits))
+        if profile is not None:
+            metadata["explain"] = profile.to_dict()  # Serialized by FastAPI after the search
+    
+    return SearchResponse(
+        success=True,
+        message=message,
+        data=results,
+        metadata=metadata
+    )
+
+def _stream_search(snapshot, search_request: SearchRequest, stream: StreamFormat) -> StreamingResponse:
+    """
+    Run a search for every result and stream them; executed on the worker pool.
+    
+    Only the search (on row positions) runs here. Results are serialized block by block while
+    the body is sent, so the first bytes go out right after the search and memory stays bounded
+    by one block however many results there are. Each block is also serialized on the worker
+    pool (see _pooled_body). Streamed results bypass the result cache.
+    """
+    validate_search(search_request)
+    limit = config.SEARCH_STREAM_MAX_RESULTS
+    if search_request.cursor is not None:
+        hits, offset, next_cursor = _cursor_page(snapshot, search_request, limit)
+    else:
+        hits = execute_search(snapshot, search_request, limit)
+        offset, next_cursor = 0, _first_page_cursor(snapshot, search_request, limit, hits)
+    blocks = _fragment_blocks(snapshot, hits)
+    
+    if stream == StreamFormat.NDJSON:
+        headers = {"X-Total-Results": str(len(hits.rows))}
+        if next_cursor is not None:
+            headers["X-Next-Cursor"] = next_cursor
+        return StreamingResponse(_pooled_body(stream_ndjson(blocks)), media_type=NDJSON_MEDIA_TYPE, headers=headers)
+    
+    metadata = _request_metadata(search_request, limit)
+    metadata["total_results"] = len(hits.rows)
+    metadata["offset"] = offset
+    metadata["next_cursor"] = next_cursor
+    message = f"Search completed successfully. Found {len(hits.rows)} results."
+    return StreamingResponse(_pooled_body(stream_search_response(message, blocks, metadata)), media_type="application/json")
+
+async def _pooled_body(body: Iterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Produce the parts of a streamed body on the worker pool, one job per part.
+    
+    Parts are serialized while the body is sent, so this keeps that work within the pool's
+    limit instead of Starlette's threadpool. The response has already started by then, so a
+    part that finds the pool saturated waits and retries rather than failing the response.
+    """
+    while True:
+        try:
+            part = await search_pool.run(next, body, None)
+        except PoolSaturatedError:
+            await asyncio.sleep(STREAM_RETRY_SECONDS)
+            continue
+        if part is None:
+            return
+        yield part
+
+def _hit_fragments(snapshot, hits: SearchHits) -> List[bytes]:
+    """Serialized FoodTruck JSON of hits, rendered through the models where no fragment is cached"""
+    fragments = snapshot.truck_fragments(hits.rows)
+    if fragments is None:
+        fragments = [serialize_food_truck(food_truck) for food_truck in convert_to_food_trucks(materialize(snapshot, hits))]
+    return fragments
+
+def _fragment_blocks(snapshot, hits: SearchHits) -> Iterator[List[bytes]]:
+    """Serialized FoodTruck JSON of hits, SEARCH_STREAM_BLOCK_ROWS at a time"""
+    block_rows = max(1, config.SEARCH_STREAM_BLOCK_ROWS)
+    for start in range(0, len(hits.rows), block_rows):
+        yield _hit_fragments(snapshot, hits.page(start, block_rows))
+
+def _ordering_key(search_request: SearchRequest) -> tuple:
+    """Normalized key of the whole result ordering a search's pages are cut from"""
+    return request_cache_key(search_request, config.SEARCH_CURSOR_MAX_RESULTS, config.SEARCH_CACHE_COORDINATE_PRECISION)
+
+def _first_page_cursor(snapshot, search_request: SearchRequest, limit: int, hits: SearchHits) -> Optional[str]:
+    """
+    Cursor of the page after a first page, or None if the search has no further results.
+    
+    The first page is searched for only limit results, so a full page always gets a cursor
+    (its next page may turn out to be empty).
+    """
+    if len(hits.rows) < limit or limit >= config.SEARCH_CURSOR_MAX_RESULTS:
+        return None
+    return encode_cursor(snapshot.version, _ordering_key(search_request), limit)
+
+def _cursor_page(snapshot, search_request: SearchRequest, limit: int) -> Tuple[SearchHits, int, Optional[str]]:
+    """
+    Hits of the page a cursor points at, the page's offset and the cursor of the page after it.
+    
+    Pages after the first are slices of the search's first SEARCH_CURSOR_MAX_RESULTS results,
+    which are computed once per snapshot and kept in the ordering cache, so walking a result set
+    does not run the search again for every page.
+    """
+    ordering_key = _ordering_key(search_request)
+    offset = decode_cursor(search_request.cursor, snapshot.version, ordering_key)
+    ordering = ordering_cache.get(snapshot, ordering_key)
+    cached = ordering is not None
+    if ordering is None:
+        ordering = execute_search(snapshot, search_request, config.SEARCH_CURSOR_MAX_RESULTS)
+        ordering_cache.put(snapshot, ordering_key, ordering)
+    
+    hits = ordering.page(offset, limit)
+    record_step('page', 'ordering_cache', len(hits.rows), cached=cached, offset=offset)
+    next_offset = offset + len(hits.rows)
+    next_cursor = encode_cursor(snapshot.version, ordering_key, next_offset) if next_offset < len(ordering.rows) else None
+    return hits, offset, next_cursor
+
+@router.post("/search/batch", response_model=BatchSearchResponse, tags=["Search"])
+async def batch_search_food_trucks(batch_request: BatchSearchRequest):
+    """
+    Run several searches in one request; results are returned in request order
+    
+    - **searches**: List of search requests, each as accepted by `/search` (max: 500), including cursors
+    
+    Nearest-neighbour proximity searches in a batch are evaluated together. A search that fails
+    validation gets an unsuccessful result without failing the rest of the batch.
+    """
+    try:
+        # Pin one snapshot for the whole batch
+        snapshot = data_loader.get_snapshot()
+        if snapshot is None or not data_loader.is_data_available():
+            raise HTTPException(status_code=500, detail="Data not available")
+        
+        # Search on the worker pool so the event loop stays free for other requests
+        return await search_pool.run(_search_batch, snapshot, batch_request.searches)
+        
+    except PoolSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+def _search_batch(snapshot, searches) -> Response:
+    """Run a batch of searches and build its response; executed on the worker pool"""
+    limits = [result_limit(search_request) for search_request in searches]
+    cache_keys = [
+        request_cache_key(search_request, limit, config.SEARCH_CACHE_COORDINATE_PRECISION)
+        for search_request, limit in zip(searches, limits)
+    ]
+    outcomes = []
+    pages = []  # (offset, next cursor) of every search, None for first pages until their hits are known
+    for search_request, limit, cache_key in zip(searches, limits, cache_keys):
+        try:
+            validate_search(search_request)
+        except ValueError as e:
+            outcomes.append(e)
+            pages.append((0, None))
+            continue
+        if search_request.cursor is None:
+            outcomes.append(result_cache.get(snapshot, cache_key))
+            pages.append(None)
+            continue
+        try:
+            hits, offset, next_cursor = _cursor_page(snapshot, search_request, limit)
+            outcomes.append(hits)
+            pages.append((offset, next_cursor))
+        except ValueError as e:
+            outcomes.append(e)
+            pages.append((0, None))
+    
+    # Execute everything the cache could not answer in one pass
+    missing = [position for position, outcome in enumerate(outcomes) if outcome is None]
+    if missing:
+        executed = execute_batch(snapshot, [searches[position] for position in missing], [limits[position] for position in missing])
+        for position, outcome in zip(missing, executed):
+            if isinstance(outcome, SearchHits):
+                result_cache.put(snapshot, cache_keys[position], outcome)
+            outcomes[position] = outcome
+    for position, outcome in enumerate(outcomes):
+        if pages[position] is None:
+            next_cursor = _first_page_cursor(snapshot, searches[position], limits[position], outcome) if isinstance(outcome, SearchHits) else None
+            pages[position] = (0, next_cursor)
+    
+    responses = [
+        _search_response_body(snapshot, search_request, limit, outcome, page)
+        for search_request, limit, outcome, page in zip(searches, limits, outcomes, pages)
+    ]
+    body = assemble_batch_response(f"Batch completed successfully. Ran {len(responses)} searches.", responses)
+    return Response(content=body, media_type="application/json")
+
+def _request_metadata(search_request: SearchRequest, limit: int) -> dict:
+    """Metadata describing a search request, before its results are known"""
+    return create_search_metadata(
+        search_request.query_type,
+        search_request.status,
+        limit,
+        search_request.latitude,
+        search_request.longitude,
+        search_request.radius_km,
+        search_request.fuzzy,
+        search_request.match if search_request.food_items else None
+    )
+
+def _search_response_body(snapshot, search_request: SearchRequest, limit: int, outcome,
+                          page: Tuple[int, Optional[str]] = (0, None)) -> bytes:
+    """Serialize the SearchResponse of one search in a batch from its hits or error and its (offset, next cursor)"""
+    metadata = _request_metadata(search_request, limit)
+    if isinstance(outcome, ValueError):
+        metadata["total_results"] = 0
+        return failed_search_response(str(outcome), metadata)
+    
+    metadata["total_results"] = len(outcome.rows)
+    metadata["offset"], metadata["next_cursor"] = page
+    fragments = _hit_fragments(snapshot, outcome)
+    return assemble_search_response(f"Search completed successfully. Found {len(outcome.rows)} results.", fragments, metadata)
+
+@router.get("/search/cache", response_model=CacheStatsResponse, tags=["Search"])
+async def search_cache_stats():
+    """
+    Size and hit/miss/eviction counters of the search result cache
+    """
+    return CacheStatsResponse(**result_cache.stats())
+
+@router.get("/search/workers", response_model=WorkerPoolStatsResponse, tags=["Search"])
+async def search_worker_stats():
+    """
+    Load and counters of the worker pool searches run on
+    """
+    return WorkerPoolStatsResponse(**search_pool.stats())
@@ -0,0 +1,36 @@
+import os
+
+# Search result cache (see app/utils/result_cache.py); set SEARCH_CACHE_MAX_ENTRIES=0 to disable
+SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get("SEARCH_CACHE_MAX_ENTRIES", "1024"))
+SEARCH_CACHE_TTL_SECONDS = float(os.environ.get("SEARCH_CACHE_TTL_SECONDS", "300"))
+# Decimal places coordinates are rounded to in cache keys (4 places is roughly 11 m)
+SEARCH_CACHE_COORDINATE_PRECISION = int(os.environ.get("SEARCH_CACHE_COORDINATE_PRECISION", "4"))
+
+# Result orderings cached for cursor pagination: a page after the first is a slice of the search's
+# first SEARCH_CURSOR_MAX_RESULTS results, computed once and kept for SEARCH_CURSOR_TTL_SECONDS
+SEARCH_CURSOR_MAX_RESULTS = int(os.environ.get("SEARCH_CURSOR_MAX_RESULTS", "10000"))
+SEARCH_CURSOR_MAX_ENTRIES = int(os.environ.get("SEARCH_CURSOR_MAX_ENTRIES", "256"))
+SEARCH_CURSOR_TTL_SECONDS = float(os.environ.get("SEARCH_CURSOR_TTL_SECONDS", "120"))
+
+# Streaming search responses (?stream=ndjson|json or Accept: application/x-ndjson) return up to
+# SEARCH_STREAM_MAX_RESULTS results, serialized SEARCH_STREAM_BLOCK_ROWS at a time as they are sent
+SEARCH_STREAM_MAX_RESULTS = int(os.environ.get("SEARCH_STREAM_MAX_RESULTS", "100000"))
+SEARCH_STREAM_BLOCK_ROWS = int(os.environ.get("SEARCH_STREAM_BLOCK_ROWS", "256"))
+
+# Worker pool searches run on, off the event loop (see app/utils/worker_pool.py)
+SEARCH_WORKERS = int(os.environ.get("SEARCH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Searches allowed to wait for a worker before new ones are rejected with 503
+SEARCH_QUEUE_DEPTH = int(os.environ.get("SEARCH_QUEUE_DEPTH", "64"))
+
+# Directory of memory-mapped snapshots (see app/dataloader/snapshot_store.py). It is a typed binary
+# cache of the CSV, reused while the source fingerprint matches, and is shared by all worker
+# processes on a host; empty parses the CSV on every load into a private snapshot per process
+SNAPSHOT_STORE_DIR = os.environ.get("SNAPSHOT_STORE_DIR", "datastore/.snapshots")
+
+# Rows of the CSV parsed and written to the snapshot store at a time, which bounds the memory a
+# reload needs for parsed text; 0 parses the whole file at once
+INGEST_CHUNK_ROWS = int(os.environ.get("INGEST_CHUNK_ROWS", "50000"))
+
+# Directory of permit CSVs served as region shards, one per file (see ShardedDataLoader); empty
+# serves the single bundled CSV
+PERMIT_DATA_DIR = os.environ.get("PERMIT_DATA_DIR", "")
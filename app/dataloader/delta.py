@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+from typing import NamedTuple, Optional, Tuple
+from app.dataloader.snapshot import DataSnapshot
+from app.dataloader.schema import PermitChunk, compact_permits, concat_permit_chunks, iter_parsed_permits, row_hashes
+
+
+class DeltaStats(NamedTuple):
+    """Size of the change between two versions of a permit source, matched by locationid"""
+    inserted: int
+    updated: int
+    deleted: int
+    unchanged: int
+
+    @property
+    def changed(self) -> int:
+        """Rows inserted, updated or deleted"""
+        return self.inserted + self.updated + self.deleted
+
+    def __str__(self):
+        return f"{self.inserted} inserted, {self.updated} updated, {self.deleted} deleted, {self.unchanged} unchanged"
+
+
+def diff_permits(snapshot: DataSnapshot, csv_path: str,
+                 chunk_rows: Optional[int] = None) -> Optional[Tuple[PermitChunk, DeltaStats]]:
+    """
+    Build the next version of a snapshot's data from its changed source, reusing unchanged rows.
+
+    Rows are matched by locationid and compared by the hash of their parsed values. Only inserted
+    and updated rows are validated, serialized and narrowed; every other row is copied from the
+    snapshot's compact columns and pre-serialized JSON. Rows keep the order of the new source, so
+    the result holds the same values as a full load of it.
+
+    Args:
+        snapshot: Snapshot of the previous version, with row hashes
+        csv_path: Path of the CSV source
+        chunk_rows: Rows parsed at a time; None parses the whole file at once
+
+    Returns:
+        Tuple of (PermitChunk of every row of the source, size of the change), or None if the
+        change cannot be applied as a delta (no row hashes, different columns, or missing or
+        duplicate locationids) and the source must be loaded in full
+    """
+    old = snapshot.data
+    if snapshot.row_hashes is None or 'locationid' not in old.columns:
+        return None
+    old_ids = pd.Index(old['locationid'])
+    if old_ids.hasnans or not old_ids.is_unique:
+        return None
+
+    positions = []  # Per chunk: position of each row in the snapshot, -1 where inserted or updated
+    found = []  # Per chunk: whether the row's locationid is in the snapshot
+    hashes = []
+    changed = []  # Parsed rows that were inserted or updated
+    new_ids = []
+    for parsed in iter_parsed_permits(csv_path, chunk_rows):
+        if list(parsed.columns) != list(old.columns):
+            return None
+        chunk_hashes = row_hashes(parsed)
+        chunk_positions = old_ids.get_indexer(parsed['locationid'])
+        chunk_found = chunk_positions >= 0
+        same = chunk_found.copy()
+        same[chunk_found] = snapshot.row_hashes[chunk_positions[chunk_found]] == chunk_hashes[chunk_found]
+        positions.append(np.where(same, chunk_positions, -1))
+        found.append(chunk_found)
+        hashes.append(chunk_hashes)
+        changed.append(parsed[~same])
+        new_ids.append(parsed['locationid'].to_numpy())
+
+    if not positions:
+        return None
+    ids = pd.Index(np.concatenate(new_ids))
+    if ids.hasnans or not ids.is_unique:
+        return None
+    positions = np.concatenate(positions)
+    found = np.concatenate(found)
+    hashes = np.concatenate(hashes)
+
+    kept_rows = np.flatnonzero(positions >= 0)
+    changed_rows = np.flatnonzero(positions < 0)
+    kept_positions = positions[kept_rows]
+    parts = [PermitChunk(
+        old.iloc[kept_positions].reset_index(drop=True),
+        snapshot.row_fragments_of(kept_positions),
+        hashes[kept_rows]
+    )]
+    if len(changed_rows):
+        # The only rows that pay for validation, serialization and narrowing
+        parts.append(compact_permits(pd.concat(changed, ignore_index=True)))
+    merged = concat_permit_chunks(parts)
+
+    # Back into source order: kept rows come first in the merged chunk, then the changed ones
+    order = np.empty(len(positions), dtype=np.int64)
+    order[kept_rows] = np.arange(len(kept_rows))
+    order[changed_rows] = len(kept_rows) + np.arange(len(changed_rows))
+    data = merged.data.iloc[order].reset_index(drop=True)
+    for column in data.columns:
+        if isinstance(data[column].dtype, pd.CategoricalDtype):
+            data[column] = data[column].cat.remove_unused_categories()  # Drop text only deleted rows used
+
+    inserted = int((~found).sum())
+    stats = DeltaStats(
+        inserted=inserted,
+        updated=len(changed_rows) - inserted,
+        deleted=len(old) - int(found.sum()),
+        unchanged=len(kept_rows)
+    )
+    return PermitChunk(data, [merged.fragments[row] for row in order], hashes), stats
@@ -0,0 +1,41 @@
+import hashlib
+import os
+from typing import NamedTuple, Optional
+
+HASH_CHUNK_SIZE = 1024 * 1024  # Read the source 1 MiB at a time while hashing
+
+
+class SourceFingerprint(NamedTuple):
+    """Identity of a data source file: stat metadata plus a hash of its contents"""
+    mtime_ns: int
+    size: int
+    digest: str
+
+    def same_content(self, other: Optional['SourceFingerprint']) -> bool:
+        """Check whether another fingerprint describes the same file contents"""
+        return other is not None and self.size == other.size and self.digest == other.digest
+
+
+def fingerprint_file(path: str, previous: Optional[SourceFingerprint] = None) -> SourceFingerprint:
+    """
+    Fingerprint a file by mtime, size and content hash.
+
+    The content hash is only recomputed when mtime or size differ from the previous
+    fingerprint, so polling an unchanged file costs a single stat call.
+
+    Args:
+        path: Path of the file to fingerprint
+        previous: Fingerprint from the last check, if any
+
+    Returns:
+        SourceFingerprint for the file as it is now
+    """
+    stat = os.stat(path)
+    if previous is not None and previous.mtime_ns == stat.st_mtime_ns and previous.size == stat.st_size:
+        return previous
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return SourceFingerprint(stat.st_mtime_ns, stat.st_size, digest.hexdigest())
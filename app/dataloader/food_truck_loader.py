@@ -1,40 +1,103 @@
 import pandas as pd
 import os
-import asyncio
+import threading
 from datetime import datetime, timedelta
+from typing import Dict, Optional
+from app import config
+from app.dataloader.snapshot import DataSnapshot, ShardedSnapshot
+from app.dataloader.snapshot_store import SnapshotStore
+from app.dataloader.schema import concat_permit_chunks, iter_permit_chunks
+from app.dataloader.delta import diff_permits
+from app.dataloader.fingerprint import fingerprint_file
+
+DEFAULT_CSV_PATH = 'datastore/Mobile_Food_Facility_Permit_20250822.csv'
 
 class FoodTruckDataLoader:
-    def __init__(self):
-        self._data = None
-        self._data_loaded = False
+    def __init__(self, csv_path: str = DEFAULT_CSV_PATH, store_dir: Optional[str] = None, chunk_rows: Optional[int] = None):
+        self._csv_path = csv_path
+        self._chunk_rows = chunk_rows  # Rows parsed at a time; None parses the whole file at once
+        # Memory-mapped snapshots shared with the other worker processes, if configured
+        self._store = SnapshotStore(store_dir) if store_dir else None
+        self._snapshot = None  # Published snapshot; replaced as a whole, never modified in place
+        self._fingerprint = None
+        self._version = 0
+        self._build_lock = threading.Lock()  # Only one snapshot is built at a time
         self._last_reload = None
         self._reload_interval = timedelta(minutes=1)  # Reload every 1 minute
     
+    def _build_snapshot(self, force: bool = False):
+        """
+        Parse the source (or map the shared store) and build a complete snapshot off to the side.
+        
+        Unless forced, a changed source is applied to the current snapshot as a delta by
+        locationid, so only inserted and updated rows are validated and serialized again. Names
+        and addresses the current snapshot already indexed keep their trigram postings.
+        """
+        csv_path = self._csv_path
+        if not os.path.exists(csv_path):
+            raise FileNotFoundError(f"CSV file not found at {csv_path}")
+        
+        if self._store is not None:
+            # Only one process parses; the others map the version it wrote
+            return self._store.load(csv_path, force, self._chunk_rows, previous=self._snapshot)
+        
+        # Fingerprint before parsing so a concurrent edit is picked up by the next reload
+        fingerprint = fingerprint_file(csv_path)
+        delta = None
+        previous = self._snapshot
+        if not force and previous is not None:
+            delta = diff_permits(previous, csv_path, self._chunk_rows)
+        if delta is not None:
+            chunk, change = delta
+        else:
+            chunk, change = concat_permit_chunks(iter_permit_chunks(csv_path, self._chunk_rows)), None
+        snapshot = DataSnapshot.build(chunk.data, version=self._version + 1, fingerprint=fingerprint,
+                                      row_fragments=chunk.fragments, row_hashes=chunk.hashes, previous=previous)
+        snapshot.change = change
+        return snapshot
+    
+    def _publish(self, snapshot):
+        """Make a fully built snapshot visible to requests with a single reference swap"""
+        self._fingerprint = snapshot.fingerprint
+        self._version = snapshot.version
+        self._snapshot = snapshot
+    
     def load_data(self):
         """Load the CSV data into memory if not already loaded"""
-        if not self._data_loaded:
-            try:
-                csv_path = 'datastore/Mobile_Food_Facility_Permit_20250822.csv'
-                if not os.path.exists(csv_path):
-                    raise FileNotFoundError(f"CSV file not found at {csv_path}")
-                
-                self._data = pd.read_csv(csv_path)
-                
-                self._data_loaded = True
-                print(f"Data loaded successfully. {len(self._data)} records loaded.")
-                
-            except Exception as e:
-                print(f"Error loading data: {e}")
-                self._data = pd.DataFrame()
-                self._data_loaded = False
+        if self._snapshot is None:
+            with self._build_lock:
+                if self._snapshot is None:
+                    try:
+                        self._publish(self._build_snapshot())
+                        print(f"Data loaded successfully. {len(self._snapshot)} records loaded.")
+                    except Exception as e:
+                        print(f"Error loading data: {e}")
         
-        return self._data
+        return self._current_data()
+    
+    def _current_data(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            return pd.DataFrame()
+        return snapshot.data
     
     def get_data(self):
         """Get the loaded data"""
-        if not self._data_loaded:
+        self.get_snapshot()
+        return self._current_data()
+    
+    def get_snapshot(self):
+        """
+        Get the currently published snapshot, loading it on first use.
+        
+        Callers should fetch the snapshot once per request and use only that object, so a
+        reload published mid-request never mixes data from two loads.
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
             self.load_data()
-        return self._data
+            snapshot = self._snapshot
+        return snapshot
     
     def should_reload(self):
         """Check if data should be reloaded based on time interval"""
@@ -44,19 +107,134 @@ class FoodTruckDataLoader:
     
     def is_data_available(self):
         """Check if data is available"""
-        return self._data_loaded and not self._data.empty
+        snapshot = self._snapshot
+        return snapshot is not None and not snapshot.data.empty
+    
+    def last_change(self):
+        """DeltaStats of the last reload, or None if the current snapshot was loaded in full"""
+        snapshot = self._snapshot
+        return snapshot.change if snapshot is not None else None
     
     def get_dataframe(self):
         """Get the pandas DataFrame"""
         return self.get_data()
     
-    def reload_data(self):
-        """Force reload the data (useful for testing or data updates)"""
-        self._data = None
-        self._data_loaded = False
-        result = self.load_data()
-        self._last_reload = datetime.now()
-        return result
+    def source_changed(self):
+        """Check whether the source file (or the shared store) differs from the one currently loaded"""
+        if self._store is not None and self._store.current_version() != self._version:
+            return True  # Another process published a new version; re-map it
+        try:
+            fingerprint = fingerprint_file(self._csv_path, self._fingerprint)
+        except OSError:
+            return True
+        if not fingerprint.same_content(self._fingerprint):
+            return True
+        # Same contents; remember the new mtime so the next check is a single stat call
+        self._fingerprint = fingerprint
+        return False
+    
+    def reload_data(self, force: bool = False):
+        """
+        Reload the data if its source changed (force=True re-parses regardless).
+        
+        The replacement snapshot is built while the current one keeps serving requests and is
+        only published once complete. If the rebuild fails the current snapshot stays in place.
+        """
+        with self._build_lock:
+            if force or self._snapshot is None or self.source_changed():
+                try:
+                    self._publish(self._build_snapshot(force))
+                    change = self._snapshot.change
+                    detail = f" Delta reload: {change}." if change is not None else ""
+                    print(f"Data reloaded successfully. {len(self._snapshot)} records loaded.{detail}")
+                except Exception as e:
+                    print(f"Error reloading data, keeping current snapshot: {e}")
+            self._last_reload = datetime.now()
+        return self._current_data()
+
+class ShardedDataLoader:
+    """
+    Loads every permit CSV in a directory as its own shard, e.g. one file per city or region.
+    
+    Each shard is a FoodTruckDataLoader with its own snapshot, indexes, snapshot store directory
+    and reload lifecycle. Requests get a ShardedSnapshot pinning the current snapshot of every
+    shard; files added to or removed from the directory are picked up on the next reload.
+    """
+    
+    def __init__(self, data_dir: str, store_dir: Optional[str] = None, chunk_rows: Optional[int] = None):
+        self._data_dir = data_dir
+        self._store_dir = store_dir
+        self._chunk_rows = chunk_rows
+        self._shards: Dict[str, FoodTruckDataLoader] = {}  # Shard name (file name without .csv) -> loader
+        self._lock = threading.Lock()
+        self._view = None  # ShardedSnapshot over the snapshots last published by the shards
+        self._loaded = False
+    
+    def _discover(self):
+        """Add a loader for every new CSV in the directory and drop those whose file is gone"""
+        try:
+            file_names = sorted(name for name in os.listdir(self._data_dir) if name.endswith('.csv'))
+        except OSError as e:
+            print(f"Error listing permit datasets in {self._data_dir}: {e}")
+            return
+        names = [file_name[:-len('.csv')] for file_name in file_names]
+        for name, file_name in zip(names, file_names):
+            if name not in self._shards:
+                store_dir = os.path.join(self._store_dir, name) if self._store_dir else None
+                self._shards[name] = FoodTruckDataLoader(os.path.join(self._data_dir, file_name), store_dir, self._chunk_rows)
+        for name in set(self._shards) - set(names):
+            print(f"Permit dataset {name} was removed; dropping its shard.")
+            del self._shards[name]
+    
+    def load_data(self):
+        """Load every shard that is not loaded yet"""
+        with self._lock:
+            self._discover()
+            shards = list(self._shards.values())
+            self._loaded = True
+        for loader in shards:
+            loader.load_data()
+        return self._current_view()
+    
+    def _current_view(self):
+        """ShardedSnapshot of the shards' current snapshots, reused while none of them changed"""
+        with self._lock:
+            shards = [
+                (name, loader.get_snapshot()) for name, loader in sorted(self._shards.items()) if loader.is_data_available()
+            ]
+            view = self._view
+            if view is None or view.names != [name for name, _ in shards] or any(
+                    current is not snapshot for current, (_, snapshot) in zip(view.shards, shards)):
+                view = ShardedSnapshot(shards) if shards else None
+                self._view = view
+            return view
+    
+    def get_snapshot(self):
+        """
+        Get a ShardedSnapshot of every shard's current snapshot, loading them on first use.
+        
+        Returns None if no shard has data. The same object is returned until a shard publishes
+        a new snapshot, so caches bound to the snapshot stay valid between reloads.
+        """
+        if not self._loaded:
+            self.load_data()
+        return self._current_view()
+    
+    def is_data_available(self):
+        """Check if any shard has data"""
+        return any(loader.is_data_available() for loader in list(self._shards.values()))
+    
+    def reload_data(self, force: bool = False):
+        """Pick up added or removed datasets and reload every shard whose source changed"""
+        with self._lock:
+            self._discover()
+            shards = dict(self._shards)
+        for loader in shards.values():
+            loader.reload_data(force)
+        return self._current_view()
 
-# Global instance
-data_loader = FoodTruckDataLoader()
+# Global instance: every CSV of PERMIT_DATA_DIR as a shard, or the single default CSV
+if config.PERMIT_DATA_DIR:
+    data_loader = ShardedDataLoader(config.PERMIT_DATA_DIR, config.SNAPSHOT_STORE_DIR or None, config.INGEST_CHUNK_ROWS or None)
+else:
+    data_loader = FoodTruckDataLoader(store_dir=config.SNAPSHOT_STORE_DIR or None, chunk_rows=config.INGEST_CHUNK_ROWS or None)
@@ -0,0 +1,224 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+from pandas.api.types import union_categoricals
+from app.utils.mappers import serialize_food_trucks
+
+DATE_FORMAT = '%Y %b %d %I:%M:%S %p'  # e.g. "2024 Nov 12 12:00:00 AM"
+
+# In-memory type of each permit column. Text columns are categorical so every distinct string
+# (statuses, facility types, but also the applicant, schedule URL and address repeated across a
+# vendor's permits) is held once and rows only carry small integer codes. Dates are stored as
+# seconds since the epoch and coordinates as float32. Responses are served from JSON serialized
+# from the parsed values before this narrowing, so they keep the source's exact text and digits.
+PERMIT_SCHEMA: Dict[str, str] = {
+    'locationid': 'int64',
+    'Applicant': 'category',
+    'FacilityType': 'category',
+    'cnn': 'int64',
+    'LocationDescription': 'category',
+    'Address': 'category',
+    'blocklot': 'category',
+    'block': 'category',
+    'lot': 'category',
+    'permit': 'category',
+    'Status': 'category',
+    'FoodItems': 'category',
+    'X': 'float64',
+    'Y': 'float64',
+    'Latitude': 'float32',
+    'Longitude': 'float32',
+    'Schedule': 'category',
+    'dayshours': 'category',
+    'NOISent': 'category',
+    'Approved': 'date',
+    'Received': 'int32',
+    'PriorPermit': 'int8',
+    'ExpirationDate': 'date',
+    'Location': 'category'
+}
+
+
+def _parse_dates(values: pd.Series) -> pd.Series:
+    """Dates as datetime64[s], or the text as a category if any value would not survive the trip"""
+    if values.dtype.kind == 'M':
+        return values.astype('datetime64[s]')
+    dates = pd.to_datetime(values, format=DATE_FORMAT, errors='coerce')
+    text = values.where(values.notna())
+    if not dates.dt.strftime(DATE_FORMAT).where(dates.notna()).equals(text.astype(object)):
+        print(f"Keeping {values.name} as text: not every value is a '{DATE_FORMAT}' date")
+        return values.astype('category')
+    return dates.astype('datetime64[s]')
+
+
+def _narrow(values: pd.Series, dtype: str) -> pd.Series:
+    """Convert a column to its schema type, leaving it unchanged where that would lose values"""
+    if dtype == 'date':
+        return _parse_dates(values)
+    if dtype == 'category':
+        if values.dtype.kind == 'f' and values.isna().all():
+            return values  # An entirely empty column parses as float; there is no text to intern
+        return values if isinstance(values.dtype, pd.CategoricalDtype) else values.astype(object).astype('category')
+    if values.dtype.kind in 'iu' and np.dtype(dtype).kind in 'iu':
+        info = np.iinfo(dtype)
+        if len(values) and (values.min() < info.min or values.max() > info.max):
+            return values
+        return values.astype(dtype)
+    if values.dtype.kind in 'iuf' and np.dtype(dtype).kind == 'f':
+        return values.astype(dtype)
+    return values  # e.g. an integer column that contains missing values and was parsed as float
+
+
+def apply_schema(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert parsed permit data to its compact in-memory types.
+
+    Args:
+        data: Permit data as parsed from the CSV
+
+    Returns:
+        DataFrame with the same columns and values in the types of PERMIT_SCHEMA; columns not in
+        the schema are kept as parsed
+    """
+    return pd.DataFrame({
+        column: _narrow(data[column], PERMIT_SCHEMA[column]) if column in PERMIT_SCHEMA else data[column]
+        for column in data.columns
+    }, index=data.index)
+
+
+def restore_schema(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert compact columns back to the types the CSV parses to (text, float64, int64).
+
+    Args:
+        data: Rows of compact permit data, typically only the rows of one response
+
+    Returns:
+        DataFrame with object text and date columns and 64-bit numbers
+    """
+    restored = {}
+    for column in data.columns:
+        values = data[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(object).where(values.notna(), np.nan)
+        elif values.dtype.kind == 'M':
+            values = values.dt.strftime(DATE_FORMAT).where(values.notna(), np.nan).astype(object)
+        elif values.dtype.kind == 'f' and values.dtype != np.float64:
+            values = values.astype(np.float64)
+        elif values.dtype.kind in 'iu' and values.dtype != np.int64:
+            values = values.astype(np.int64)
+        restored[column] = values
+    return pd.DataFrame(restored, index=data.index)
+
+
+# Columns parsed as text even where a chunk happens to hold only digits, so every chunk of a file
+# gets the same types (a chunk of all-numeric block numbers would otherwise lose leading zeros)
+TEXT_DTYPES = {column: object for column, kind in PERMIT_SCHEMA.items() if kind in ('category', 'date')}
+
+
+class PermitChunk(NamedTuple):
+    """Compact permit rows with what is derived from their values as parsed"""
+    data: pd.DataFrame
+    fragments: List[Optional[bytes]]  # Serialized FoodTruck JSON per row, None where invalid
+    hashes: Optional[np.ndarray] = None  # uint64 content hash per row, used to diff reloads
+
+
+def row_hashes(parsed: pd.DataFrame) -> np.ndarray:
+    """Content hash of every parsed row (not of its index), equal for rows with equal values"""
+    return pd.util.hash_pandas_object(parsed, index=False).to_numpy(dtype=np.uint64)
+
+
+def compact_permits(parsed: pd.DataFrame) -> PermitChunk:
+    """
+    Convert parsed permits to compact columns plus the response JSON and hash of every row.
+
+    The JSON is serialized from the values as parsed, before apply_schema narrows them, so
+    responses keep the source's exact text and coordinates. Rows that fail FoodTruck validation
+    get no JSON.
+
+    Args:
+        parsed: Permit data as parsed from the CSV
+
+    Returns:
+        PermitChunk of the rows
+    """
+    fragments = serialize_food_trucks(parsed)
+    location_ids = parsed['locationid'].tolist() if 'locationid' in parsed.columns else [None] * len(parsed)
+    return PermitChunk(
+        apply_schema(parsed),
+        [fragments.get(location_id) for location_id in location_ids],
+        row_hashes(parsed)
+    )
+
+
+def iter_parsed_permits(csv_path: str, chunk_rows: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """
+    Parse the permit CSV in chunks of at most chunk_rows rows, as text where the schema holds text.
+
+    Args:
+        csv_path: Path of the CSV source
+        chunk_rows: Rows per chunk; None or 0 parses the whole file as one chunk
+
+    Yields:
+        Parsed DataFrame per chunk, in file order
+    """
+    if not chunk_rows:
+        yield pd.read_csv(csv_path, dtype=TEXT_DTYPES)
+        return
+    with pd.read_csv(csv_path, dtype=TEXT_DTYPES, chunksize=chunk_rows) as reader:
+        yield from reader
+
+
+def iter_permit_chunks(csv_path: str, chunk_rows: Optional[int] = None) -> Iterator[PermitChunk]:
+    """
+    Parse the permit CSV in chunks of at most chunk_rows rows, compacting each one before the next
+    is read, so only one chunk of raw parsed text is alive at a time.
+
+    Args:
+        csv_path: Path of the CSV source
+        chunk_rows: Rows per chunk; None or 0 parses the whole file as one chunk
+
+    Yields:
+        PermitChunk per chunk, in file order
+    """
+    for parsed in iter_parsed_permits(csv_path, chunk_rows):
+        yield compact_permits(parsed)
+
+
+def _concat_column(name: str, parts: List[pd.Series]) -> pd.Series:
+    """One column of several compact chunks, in the type the whole column would have been given"""
+    if all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+        return pd.Series(union_categoricals(parts, ignore_order=True), name=name)
+    if len({part.dtype for part in parts}) == 1:
+        return pd.concat(parts, ignore_index=True)
+    # Chunks were narrowed differently (e.g. a date column with a malformed value in one chunk)
+    restored = pd.concat([restore_schema(part.to_frame())[name] for part in parts], ignore_index=True)
+    return _narrow(restored, PERMIT_SCHEMA[name]) if name in PERMIT_SCHEMA else restored
+
+
+def concat_permit_chunks(chunks: Iterable[PermitChunk]) -> PermitChunk:
+    """
+    Combine compact chunks into one compact DataFrame, merging the categories of text columns.
+
+    Args:
+        chunks: Chunks as produced by iter_permit_chunks
+
+    Returns:
+        PermitChunk of every row, with hashes only if every chunk has them
+    """
+    frames = []
+    row_fragments = []
+    hashes = []
+    for data, fragments, chunk_hashes in chunks:
+        frames.append(data)
+        row_fragments.extend(fragments)
+        hashes.append(chunk_hashes)
+    all_hashes = np.concatenate(hashes) if hashes and all(h is not None for h in hashes) else None
+    if len(frames) == 1:
+        return PermitChunk(frames[0], row_fragments, all_hashes)
+    if not frames:
+        return PermitChunk(pd.DataFrame(), row_fragments, np.empty(0, dtype=np.uint64))
+    return PermitChunk(pd.DataFrame({
+        column: _concat_column(column, [frame[column] for frame in frames])
+        for column in frames[0].columns
+    }), row_fragments, all_hashes)
@@ -0,0 +1,229 @@
+import numpy as np
+import pandas as pd
+from functools import cached_property
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from app.dataloader.fingerprint import SourceFingerprint
+from app.utils.spatial_index import GridIndex
+from app.utils.text_index import TokenIndex, TrigramIndex
+from app.utils.partitions import ValuePartitions
+from app.utils.mappers import serialize_food_trucks
+from app.dataloader.schema import restore_schema
+
+
+class DataSnapshot:
+    """
+    One loaded copy of the permit data together with the structures derived from it.
+
+    A snapshot is never modified after it is built: reloads build a new snapshot and publish it
+    in place of the old one, so a request holding a snapshot sees one consistent data set.
+    """
+
+    def __init__(self, data: pd.DataFrame, version: int = 0, fingerprint: Optional[SourceFingerprint] = None,
+                 row_fragments: Optional[Sequence[Optional[bytes]]] = None, row_hashes: Optional[np.ndarray] = None):
+        self.data = data
+        self.version = version
+        self.fingerprint = fingerprint
+        self.row_fragments = row_fragments  # Serialized response JSON per row, when already built elsewhere
+        self.row_hashes = row_hashes  # Content hash of every row as parsed, which delta reloads diff against
+        self.change = None  # DeltaStats against the previous version when built by a delta reload
+
+    @classmethod
+    def build(cls, data: pd.DataFrame, version: int = 0, fingerprint: Optional[SourceFingerprint] = None,
+              row_fragments: Optional[Sequence[Optional[bytes]]] = None, row_hashes: Optional[np.ndarray] = None,
+              previous: Optional['DataSnapshot'] = None):
+        """
+        Create a snapshot and precompute all derived structures up front.
+
+        Given the snapshot of an earlier version, the trigram indexes reuse the postings of the
+        names and addresses it already indexed; every other structure is vectorized over
+        category codes and rebuilt.
+        """
+        snapshot = cls(data, version, fingerprint, row_fragments, row_hashes)
+        snapshot.warm(previous)
+        return snapshot
+
+    def warm(self, previous: Optional['DataSnapshot'] = None):
+        """Compute every lazily derived structure so requests never pay for it"""
+        if previous is not None:
+            self.applicant_index = TrigramIndex(self._text_column('Applicant'), previous.applicant_index)
+            self.address_index = TrigramIndex(self._text_column('Address'), previous.address_index)
+        self.lat_rad
+        self.lon_rad
+        self.coordinate_rows
+        self.coordinate_mask
+        self.spatial_index
+        self.status_partitions
+        self.facility_partitions
+        self.applicant_index
+        self.address_index
+        self.food_item_index
+        self.location_ids
+        if self.row_fragments is None:
+            self.truck_json
+
+    def __len__(self):
+        return len(self.data)
+
+    def _text_column(self, column: str) -> pd.Series:
+        if column not in self.data.columns:
+            return pd.Series([None] * len(self.data), dtype=object)
+        return self.data[column]
+
+    def _numeric_column(self, column: str) -> np.ndarray:
+        if column not in self.data.columns:
+            return np.full(len(self.data), np.nan)
+        return pd.to_numeric(self.data[column], errors='coerce').to_numpy(dtype=np.float64)
+
+    @cached_property
+    def lat_rad(self) -> np.ndarray:
+        """Latitudes in radians, NaN where missing"""
+        return np.radians(self._numeric_column('Latitude'))
+
+    @cached_property
+    def lon_rad(self) -> np.ndarray:
+        """Longitudes in radians, NaN where missing"""
+        return np.radians(self._numeric_column('Longitude'))
+
+    @cached_property
+    def coordinate_rows(self) -> np.ndarray:
+        """Row positions that have both a latitude and a longitude"""
+        return np.flatnonzero(~(np.isnan(self.lat_rad) | np.isnan(self.lon_rad)))
+
+    @cached_property
+    def coordinate_mask(self) -> np.ndarray:
+        """Boolean bitmap of the rows that have both a latitude and a longitude"""
+        mask = np.zeros(len(self.data), dtype=bool)
+        mask[self.coordinate_rows] = True
+        return mask
+
+    @cached_property
+    def status_partitions(self) -> ValuePartitions:
+        """Row partitions by permit status (APPROVED / REQUESTED / EXPIRED / ...)"""
+        return ValuePartitions(self._text_column('Status'))
+
+    @cached_property
+    def facility_partitions(self) -> ValuePartitions:
+        """Row partitions by facility type (Truck / Push Cart)"""
+        return ValuePartitions(self._text_column('FacilityType'))
+
+    @cached_property
+    def spatial_index(self) -> GridIndex:
+        """Grid index over the rows with coordinates for nearest-neighbour queries"""
+        return GridIndex(self.lat_rad, self.lon_rad, self.coordinate_rows)
+
+    @cached_property
+    def applicant_index(self) -> TrigramIndex:
+        """Trigram index over business names for substring search"""
+        return TrigramIndex(self._text_column('Applicant'))
+
+    @cached_property
+    def address_index(self) -> TrigramIndex:
+        """Trigram index over street addresses for substring search"""
+        return TrigramIndex(self._text_column('Address'))
+
+    @cached_property
+    def food_item_index(self) -> TokenIndex:
+        """Inverted index over food item words for food item search"""
+        return TokenIndex(self._text_column('FoodItems'))
+
+    @cached_property
+    def location_ids(self) -> np.ndarray:
+        """locationid of every row, as Python objects for dictionary lookups"""
+        if 'locationid' not in self.data.columns:
+            return np.full(len(self.data), None, dtype=object)
+        return np.asarray(self.data['locationid'].tolist(), dtype=object)
+
+    @cached_property
+    def truck_json(self) -> Dict[int, bytes]:
+        """Pre-validated, serialized response JSON of every permit keyed by locationid"""
+        return serialize_food_trucks(restore_schema(self.data))
+
+    def row_fragments_of(self, rows: np.ndarray) -> List[Optional[bytes]]:
+        """Serialized JSON of the given rows, None for rows that failed validation"""
+        if self.row_fragments is not None:
+            return [self.row_fragments[row] for row in rows]
+        return [self.truck_json.get(location_id) for location_id in self.location_ids[rows]]
+
+    def truck_fragments(self, rows: np.ndarray) -> Optional[List[bytes]]:
+        """Serialized JSON of the given rows, or None if any of them has no cached fragment"""
+        fragments = self.row_fragments_of(rows)
+        if any(fragment is None for fragment in fragments):
+            return None
+        return fragments
+
+    @cached_property
+    def bounds(self) -> Optional[Tuple[float, float, float, float]]:
+        """(min_lat, max_lat, min_lon, max_lon) in degrees of the rows with coordinates, None if there are none"""
+        if not len(self.coordinate_rows):
+            return None
+        lat_deg = np.degrees(self.lat_rad[self.coordinate_rows])
+        lon_deg = np.degrees(self.lon_rad[self.coordinate_rows])
+        return float(lat_deg.min()), float(lat_deg.max()), float(lon_deg.min()), float(lon_deg.max())
+
+    def take(self, rows: np.ndarray) -> pd.DataFrame:
+        """Data of the given row positions, in their order"""
+        return self.data.iloc[rows]
+
+
+class ShardedSnapshot:
+    """
+    Pinned set of shard snapshots, one per permit dataset, searched as one dataset.
+
+    Rows are addressed by global positions: shard i owns positions offsets[i] to
+    offsets[i + 1] - 1, in shard order. Shards keep their own indexes and are reloaded
+    independently; a new ShardedSnapshot is made whenever any of them publishes a snapshot.
+    """
+
+    def __init__(self, shards: Sequence[Tuple[str, DataSnapshot]]):
+        self.names = [name for name, _ in shards]
+        self.shards = [snapshot for _, snapshot in shards]
+        self.offsets = np.concatenate([[0], np.cumsum([len(snapshot) for snapshot in self.shards])]).astype(np.int64)
+        self.version = tuple((name, snapshot.version) for name, snapshot in shards)
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def shard_of(self, rows: np.ndarray) -> np.ndarray:
+        """Index of the shard owning each global row position"""
+        return np.searchsorted(self.offsets, rows, side='right') - 1
+
+    def _split(self, rows: np.ndarray):
+        """(shard index, global positions in rows, local rows) for every shard the rows touch"""
+        rows = np.asarray(rows, dtype=np.int64)
+        shard_ids = self.shard_of(rows)
+        for shard_id in np.unique(shard_ids):
+            positions = np.flatnonzero(shard_ids == shard_id)
+            yield shard_id, positions, rows[positions] - self.offsets[shard_id]
+
+    def truck_fragments(self, rows: np.ndarray) -> Optional[List[bytes]]:
+        """Serialized JSON of the given global rows, or None if any of them has no cached fragment"""
+        fragments = [None] * len(rows)
+        for shard_id, positions, local_rows in self._split(rows):
+            shard_fragments = self.shards[shard_id].truck_fragments(local_rows)
+            if shard_fragments is None:
+                return None
+            for position, fragment in zip(positions, shard_fragments):
+                fragments[position] = fragment
+        return fragments
+
+    def take(self, rows: np.ndarray) -> pd.DataFrame:
+        """Data of the given global rows in their order, indexed by global row position"""
+        rows = np.asarray(rows, dtype=np.int64)
+        pieces = []
+        order = []
+        for shard_id, positions, local_rows in self._split(rows):
+            # Shards have their own categories; plain types let their rows be concatenated
+            pieces.append(restore_schema(self.shards[shard_id].take(local_rows)))
+            order.append(positions)
+        if not pieces:
+            return restore_schema(self.shards[0].take(rows)) if self.shards else pd.DataFrame()
+        data = pd.concat(pieces).iloc[np.argsort(np.concatenate(order), kind='stable')]
+        data.index = rows
+        return data
+
+
+def as_snapshot(data: Union[pd.DataFrame, DataSnapshot]) -> DataSnapshot:
+    """Wrap a plain DataFrame in a snapshot; snapshots are returned unchanged"""
+    if isinstance(data, DataSnapshot):
+        return data
+    return DataSnapshot(data)
@@ -0,0 +1,452 @@
+import json
+import os
+import shutil
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence
+import numpy as np
+import pandas as pd
+from app.dataloader.fingerprint import SourceFingerprint, fingerprint_file
+from app.dataloader.snapshot import DataSnapshot
+from app.dataloader.delta import diff_permits
+from app.dataloader.schema import PermitChunk, concat_permit_chunks, iter_permit_chunks, restore_schema
+from app.utils.mappers import serialize_food_trucks
+
+CURRENT_FILE = 'CURRENT'  # Names the published version directory
+LOCK_FILE = '.lock'  # Serializes builds across processes
+MANIFEST_FILE = 'manifest.json'
+KEEP_VERSIONS = 2  # Version directories kept on disk; older ones may still be mapped by slow workers
+CODE_BLOCK_ROWS = 1 << 20  # Categorical codes narrowed at a time when a version is finished
+STORE_FORMAT = 4  # Bumped whenever the on-disk layout changes; other formats are rebuilt from the source
+
+
+def map_array(path: str, dtype) -> np.ndarray:
+    """Map a raw array file read-only (empty files cannot be mapped and become empty arrays)"""
+    if os.path.getsize(path) == 0:
+        return np.empty(0, dtype=dtype)
+    # A plain ndarray view over the mapping: memmap's own indexing is many times slower per element
+    return np.memmap(path, dtype=dtype, mode='r').view(np.ndarray)
+
+
+def append_array(path: str, values: np.ndarray):
+    """Append the raw bytes of an array to a file"""
+    with open(path, 'ab') as output:
+        output.write(np.ascontiguousarray(values).tobytes())
+
+
+def code_dtype(categories: int) -> np.dtype:
+    """Narrowest integer type pandas keeps the codes of a categorical with this many categories in"""
+    for dtype in (np.int8, np.int16, np.int32):
+        if categories < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+class StringBlob:
+    """
+    Column of optional strings stored as one UTF-8 buffer plus offsets, readable from a memory map.
+
+    Entry i spans buffer[offsets[i]:offsets[i + 1]]; missing entries are flagged separately so
+    they differ from empty strings.
+    """
+
+    def __init__(self, offsets: np.ndarray, buffer: np.ndarray, missing: np.ndarray):
+        self.offsets = offsets
+        self.buffer = buffer
+        self.missing = missing
+
+    def __len__(self):
+        return len(self.missing)
+
+    def __getitem__(self, row: int) -> Optional[bytes]:
+        if self.missing[row]:
+            return None
+        return self.buffer[self.offsets[row]:self.offsets[row + 1]].tobytes()
+
+    def decode(self) -> np.ndarray:
+        """All entries as an object array of str, NaN where missing (as pandas reads them)"""
+        text = self.buffer.tobytes().decode('utf-8') if len(self.buffer) else ''
+        # Offsets count bytes; map them to character positions once for the whole column
+        if len(text) == len(self.buffer):
+            starts = self.offsets
+        else:
+            char_sizes = np.ones(len(self.buffer), dtype=np.int64)
+            char_sizes[(self.buffer & 0xC0) == 0x80] = 0  # Continuation bytes are not characters
+            starts = np.concatenate([[0], np.cumsum(char_sizes)])[self.offsets]
+        values = np.empty(len(self), dtype=object)
+        for row in range(len(self)):
+            values[row] = np.nan if self.missing[row] else text[starts[row]:starts[row + 1]]
+        return values
+
+    @classmethod
+    def load(cls, directory: str, name: str) -> 'StringBlob':
+        return cls(
+            map_array(os.path.join(directory, f'{name}.offsets.bin'), np.int64),
+            map_array(os.path.join(directory, f'{name}.blob.bin'), np.uint8),
+            map_array(os.path.join(directory, f'{name}.missing.bin'), bool)
+        )
+
+
+class StringBlobWriter:
+    """Builds a StringBlob on disk by appending batches of encoded values"""
+
+    def __init__(self, directory: str, name: str):
+        self.paths = {part: os.path.join(directory, f'{name}.{part}.bin') for part in ('offsets', 'blob', 'missing')}
+        self.size = 0  # Bytes written to the blob so far
+        for path in self.paths.values():
+            open(path, 'wb').close()
+        append_array(self.paths['offsets'], np.zeros(1, dtype=np.int64))
+
+    def append(self, values: Sequence[Optional[bytes]]):
+        """Append encoded values (None for missing)"""
+        lengths = np.array([0 if value is None else len(value) for value in values], dtype=np.int64)
+        append_array(self.paths['offsets'], self.size + np.cumsum(lengths))
+        append_array(self.paths['missing'], np.array([value is None for value in values], dtype=bool))
+        with open(self.paths['blob'], 'ab') as blob:
+            blob.write(b''.join(value for value in values if value is not None))
+        self.size += int(lengths.sum())
+
+
+def encode_text(values: pd.Series) -> List[Optional[bytes]]:
+    """UTF-8 encoding of every value, None where missing"""
+    return [None if pd.isna(value) else str(value).encode('utf-8') for value in values]
+
+
+class ChunkSchemaError(ValueError):
+    """Raised when a chunk's columns or column types differ from those of the first chunk"""
+
+
+class VersionWriter:
+    """
+    Appends chunks of compact permit data to the column files of one store version.
+
+    Columns take their kind and type from the first chunk: numeric and date columns are raw
+    arrays, categorical columns are int32 codes into one dictionary of categories that grows as
+    chunks arrive (narrowed to the type pandas uses for that many categories once the last chunk
+    is in), and other text columns are string blobs. Memory use is bounded by one chunk plus the
+    distinct strings of the categorical columns.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.rows = 0
+        self.columns: Optional[List[dict]] = None
+        self._categories: Dict[str, Dict[str, int]] = {}
+        self._texts: Dict[str, StringBlobWriter] = {}
+        self._fragments = StringBlobWriter(directory, 'fragments')
+        self.has_hashes = True  # Until a chunk without row hashes is appended
+        open(self._path('row_hashes'), 'wb').close()
+
+    def _path(self, file_name: str) -> str:
+        return os.path.join(self.directory, f'{file_name}.bin')
+
+    def _start(self, data: pd.DataFrame):
+        self.columns = []
+        for position, name in enumerate(data.columns):
+            values = data[name]
+            file_name = f'column{position}'
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                self._categories[file_name] = {}
+                column = {'name': name, 'file': file_name, 'kind': 'category'}
+            elif values.dtype.kind in 'biufM':
+                column = {'name': name, 'file': file_name, 'kind': 'numeric', 'dtype': values.dtype.str}
+            else:
+                self._texts[file_name] = StringBlobWriter(self.directory, file_name)
+                column = {'name': name, 'file': file_name, 'kind': 'text'}
+            if column['kind'] != 'text':
+                open(self._path(file_name), 'wb').close()
+            self.columns.append(column)
+
+    def append(self, data: pd.DataFrame, row_fragments: Sequence[Optional[bytes]], hashes: Optional[np.ndarray] = None):
+        """
+        Append a chunk of rows.
+
+        Args:
+            data: Compact rows, with the same columns as every other chunk
+            row_fragments: Response JSON per row
+            hashes: Content hash per row, if known
+
+        Raises:
+            ChunkSchemaError: If the chunk's columns or column types differ from the first chunk's
+        """
+        if self.columns is None:
+            self._start(data)
+        if list(data.columns) != [column['name'] for column in self.columns]:
+            raise ChunkSchemaError("Chunk columns differ from the first chunk")
+
+        for column in self.columns:
+            values = data[column['name']]
+            if column['kind'] == 'category':
+                if not isinstance(values.dtype, pd.CategoricalDtype):
+                    raise ChunkSchemaError(f"Column {column['name']} is no longer categorical")
+                # Map the chunk's codes onto the codes of the shared dictionary (-1 stays missing)
+                lookup = self._categories[column['file']]
+                mapping = np.array([lookup.setdefault(value, len(lookup)) for value in values.cat.categories] + [-1], dtype=np.int32)
+                append_array(self._path(column['file']), mapping[values.cat.codes.to_numpy()])
+            elif column['kind'] == 'numeric':
+                if values.dtype.str != column['dtype']:
+                    raise ChunkSchemaError(f"Column {column['name']} changed type from {column['dtype']} to {values.dtype}")
+                append_array(self._path(column['file']), values.to_numpy())
+            else:
+                self._texts[column['file']].append(encode_text(values))
+        self._fragments.append(row_fragments)
+        if hashes is None:
+            self.has_hashes = False
+        elif self.has_hashes:
+            append_array(self._path('row_hashes'), hashes.astype(np.uint64))
+        self.rows += len(data)
+
+    def _narrow_codes(self, file_name: str, dtype: np.dtype):
+        """Rewrite a column's int32 codes as dtype, a block at a time"""
+        path = self._path(file_name)
+        codes = map_array(path, np.int32)
+        narrowed_path = f'{path}.tmp'
+        open(narrowed_path, 'wb').close()
+        for start in range(0, len(codes), CODE_BLOCK_ROWS):
+            append_array(narrowed_path, codes[start:start + CODE_BLOCK_ROWS].astype(dtype))
+        del codes
+        os.replace(narrowed_path, path)
+
+    def finish(self) -> List[dict]:
+        """Write the category dictionaries and return the column descriptions for the manifest"""
+        for column in self.columns or []:
+            if column['kind'] != 'category':
+                continue
+            lookup = self._categories[column['file']]
+            StringBlobWriter(self.directory, f"{column['file']}.categories").append([str(value).encode('utf-8') for value in lookup])
+            # Stored at the width pandas uses so attached columns can wrap the mapped codes as they are
+            column['dtype'] = code_dtype(len(lookup)).str
+            if column['dtype'] != np.dtype(np.int32).str:
+                self._narrow_codes(column['file'], np.dtype(column['dtype']))
+        return self.columns or []
+
+
+class StoreManifest(NamedTuple):
+    """Description of one published version of the store"""
+    version: int
+    directory: str
+    rows: int
+    columns: List[dict]
+    fingerprint: Optional[SourceFingerprint]
+    row_hashes: bool = False  # Whether row_hashes.bin holds a hash for every row
+
+
+class SnapshotStore:
+    """
+    Directory of memory-mapped snapshots shared by every worker process on a host.
+
+    One process parses the source chunk by chunk and appends each chunk to raw column files
+    (numeric and date columns as arrays, categorical columns as codes plus a string blob of their
+    categories, other text columns as string blobs) together with the pre-serialized response
+    JSON, so writing a version never holds more than one chunk of parsed text. Every
+    process, including the writer, then maps the files read-only: numeric columns, categorical
+    codes and response JSON are shared through the page cache instead of being copied into
+    each worker. The directory is created when the store is first locked for a build.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    @contextmanager
+    def _locked(self):
+        """Hold the store's cross-process build lock (POSIX only, so imported on first use)"""
+        import fcntl
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def current_version(self) -> int:
+        """Version currently published in the store (0 when empty); a single small file read"""
+        try:
+            with open(os.path.join(self.directory, CURRENT_FILE)) as current:
+                return int(current.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _version_directory(self, version: int) -> str:
+        return os.path.join(self.directory, f'v{version:09d}')
+
+    def read_manifest(self) -> Optional[StoreManifest]:
+        """Manifest of the published version, or None if nothing usable was published yet"""
+        version = self.current_version()
+        if not version:
+            return None
+        directory = self._version_directory(version)
+        try:
+            with open(os.path.join(directory, MANIFEST_FILE)) as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable snapshot version {version}: {e}")
+            return None
+        if manifest.get('format') != STORE_FORMAT:
+            return None
+        fingerprint = manifest.get('fingerprint')
+        return StoreManifest(
+            manifest['version'],
+            directory,
+            manifest['rows'],
+            manifest['columns'],
+            SourceFingerprint(*fingerprint) if fingerprint else None,
+            manifest.get('row_hashes', False)
+        )
+
+    def write(self, data: pd.DataFrame, fingerprint: Optional[SourceFingerprint] = None,
+              row_fragments: Optional[List[Optional[bytes]]] = None) -> StoreManifest:
+        """
+        Write a DataFrame as a new version and publish it.
+
+        Args:
+            data: Data to store
+            fingerprint: Fingerprint of the source the data was parsed from
+            row_fragments: Response JSON per row; serialized from data when not given
+
+        Returns:
+            Manifest of the published version
+        """
+        if row_fragments is None:
+            fragments = serialize_food_trucks(restore_schema(data))
+            location_ids = data['locationid'].tolist() if 'locationid' in data.columns else [None] * len(data)
+            row_fragments = [fragments.get(location_id) for location_id in location_ids]
+        return self.write_chunks([PermitChunk(data, row_fragments)], fingerprint)
+
+    def write_chunks(self, chunks: Iterable[PermitChunk], fingerprint: Optional[SourceFingerprint] = None) -> StoreManifest:
+        """
+        Write chunks of data as a new version and publish it.
+
+        Each chunk is appended to the version's files before the next one is taken from the
+        iterable. The version directory is completely written before ``CURRENT`` is atomically
+        replaced, so readers never see a partial version.
+
+        Args:
+            chunks: PermitChunks in row order
+            fingerprint: Fingerprint of the source the data was parsed from
+
+        Returns:
+            Manifest of the published version
+
+        Raises:
+            ChunkSchemaError: If the chunks do not share one set of column types; nothing is published
+        """
+        version = self.current_version() + 1
+        directory = self._version_directory(version)
+        shutil.rmtree(directory, ignore_errors=True)  # Leftover of an interrupted write
+        os.makedirs(directory)
+        try:
+            writer = VersionWriter(directory)
+            for data, row_fragments, hashes in chunks:
+                writer.append(data, row_fragments, hashes)
+            columns = writer.finish()
+        except BaseException:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+
+        manifest = {
+            'format': STORE_FORMAT,
+            'version': version,
+            'rows': writer.rows,
+            'columns': columns,
+            'row_hashes': writer.has_hashes,
+            'fingerprint': list(fingerprint) if fingerprint else None
+        }
+        with open(os.path.join(directory, MANIFEST_FILE), 'w') as manifest_file:
+            json.dump(manifest, manifest_file)
+
+        # Publish with an atomic rename, then drop versions no worker should still need
+        current_tmp = os.path.join(self.directory, f'{CURRENT_FILE}.tmp')
+        with open(current_tmp, 'w') as current:
+            current.write(str(version))
+        os.replace(current_tmp, os.path.join(self.directory, CURRENT_FILE))
+        for old_version in range(1, version - KEEP_VERSIONS + 1):
+            shutil.rmtree(self._version_directory(old_version), ignore_errors=True)
+        return self.read_manifest()
+
+    def attach(self, manifest: StoreManifest, previous: Optional[DataSnapshot] = None) -> DataSnapshot:
+        """
+        Map a published version into a snapshot without parsing or copying numeric columns or
+        categorical codes.
+
+        Args:
+            manifest: Manifest of the version to map
+            previous: Snapshot of an earlier version, whose trigram postings are reused
+
+        Returns:
+            Fully built snapshot over the mapped files
+        """
+        columns = {}
+        for column in manifest.columns:
+            path = os.path.join(manifest.directory, f"{column['file']}.bin")
+            if column['kind'] == 'numeric':
+                columns[column['name']] = map_array(path, np.dtype(column['dtype']))
+            elif column['kind'] == 'category':
+                codes = map_array(path, np.dtype(column['dtype']))
+                categories = StringBlob.load(manifest.directory, f"{column['file']}.categories").decode()
+                # The codes were written by VersionWriter in range and at pandas' width, so they are not copied
+                columns[column['name']] = pd.Categorical.from_codes(codes, categories=categories, validate=False)
+            else:
+                columns[column['name']] = StringBlob.load(manifest.directory, column['file']).decode()
+        data = pd.DataFrame(columns, copy=False)
+        if not manifest.columns:
+            data = pd.DataFrame(index=range(manifest.rows))
+        fragments = StringBlob.load(manifest.directory, 'fragments')
+        hashes = map_array(os.path.join(manifest.directory, 'row_hashes.bin'), np.uint64) if manifest.row_hashes else None
+        return DataSnapshot.build(data, manifest.version, manifest.fingerprint, row_fragments=fragments,
+                                  row_hashes=hashes, previous=previous)
+
+    def load(self, csv_path: str, force: bool = False, chunk_rows: Optional[int] = None,
+             previous: Optional[DataSnapshot] = None) -> DataSnapshot:
+        """
+        Attach to the published version, parsing the source first only if it changed.
+
+        This makes the store a typed binary cache of the source: as long as its fingerprint
+        matches, startups and reloads map the stored columns instead of parsing text. Only one
+        process parses a given source; processes that were waiting for the lock find the version
+        it published and just map it. A version that cannot be mapped is rebuilt from the source.
+
+        When the caller still holds the published version, a changed source is applied to it as
+        a delta (see diff_permits): only inserted and updated rows are compacted and serialized,
+        and the trigram indexes only extract new values. The source is still parsed and hashed
+        in full to find the change, and the delta is written as a complete new version (rows
+        keep source order, so column files cannot be patched in place).
+
+        Args:
+            csv_path: Path of the CSV source
+            force: Parse and publish a new version even if the source is unchanged
+            chunk_rows: Rows parsed and written at a time; None parses the whole file at once
+            previous: Snapshot the caller currently serves, used as the base of a delta and of the
+                trigram indexes
+
+        Returns:
+            Snapshot of the current version; its change is set when it was built as a delta
+        """
+        change = None
+        with self._locked():
+            manifest = self.read_manifest()
+            stored = manifest.fingerprint if manifest else None
+            fingerprint = fingerprint_file(csv_path, stored)
+            if force or manifest is None or not fingerprint.same_content(stored):
+                delta = None
+                if not force and previous is not None and manifest is not None and previous.version == manifest.version:
+                    delta = diff_permits(previous, csv_path, chunk_rows)
+                try:
+                    if delta is not None:
+                        chunk, change = delta
+                        manifest = self.write_chunks([chunk], fingerprint)
+                    else:
+                        manifest = self.write_chunks(iter_permit_chunks(csv_path, chunk_rows), fingerprint)
+                except ChunkSchemaError as e:
+                    # Merging in memory reconciles the types, at the cost of holding the whole table
+                    print(f"Chunks of {csv_path} parsed to different types ({e}); merging them in memory")
+                    manifest = self.write_chunks([concat_permit_chunks(iter_permit_chunks(csv_path, chunk_rows))], fingerprint)
+                print(f"Snapshot version {manifest.version} written to {self.directory}.")
+            try:
+                snapshot = self.attach(manifest, previous)
+                snapshot.change = change
+                return snapshot
+            except (OSError, ValueError) as e:
+                if force:
+                    raise
+                print(f"Rebuilding unreadable snapshot version {manifest.version}: {e}")
+        return self.load(csv_path, force=True, chunk_rows=chunk_rows)
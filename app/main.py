@@ -29,7 +29,7 @@ async def read_index():
     return FileResponse("app/static/index.html")
 
 def periodic_data_reload():
-    """Background task to reload data every minute"""
+    """Background task to reload data every minute when the source file has changed"""
     while True:
         try:
             time.sleep(60)  # Wait 60 seconds
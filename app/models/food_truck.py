@@ -2,10 +2,23 @@ from pydantic import BaseModel, Field
 from typing import List, Optional, Union
 from enum import Enum
 
+MAX_RADIUS_RESULTS = 1000  # Upper bound on results returned by a radius search
+MAX_BATCH_SIZE = 500  # Upper bound on searches in one batch request
+
 class SearchType(str, Enum):
     NAME = "name"
     STREET = "street"
     PROXIMITY = "proximity"
+    FOOD_ITEMS = "food_items"
+    COMPOUND = "compound"  # Every given name, street, food item, facility type, status and geo predicate
+
+class TermMatch(str, Enum):
+    ALL = "all"  # Every term must match (AND)
+    ANY = "any"  # At least one term must match (OR)
+
+class StreamFormat(str, Enum):
+    NDJSON = "ndjson"  # One FoodTruck per line
+    JSON = "json"  # A SearchResponse, sent in chunks
 
 class StatusType(str, Enum):
     APPROVED = "APPROVED"
@@ -15,11 +28,19 @@ class StatusType(str, Enum):
 class SearchRequest(BaseModel):
     query_type: SearchType = Field(..., description="Type of search to perform")
     applicant: Optional[str] = Field(None, description="Business name for name search")
+    fuzzy: bool = Field(False, description="Name search also matches names with typos, best match first")
     street: Optional[str] = Field(None, description="Street name for street search")
+    food_items: Optional[str] = Field(None, description="Comma-separated food items for food item search, e.g. 'tacos, hot dogs'")
+    match: TermMatch = Field(TermMatch.ALL, description="Whether a food item search needs all of its items or any of them")
+    facility_type: Optional[str] = Field(None, description="Facility type for compound search (Truck or Push Cart)")
     latitude: Optional[float] = Field(None, ge=-90, le=90, description="Latitude for proximity search (-90 to 90)")
     longitude: Optional[float] = Field(None, ge=-180, le=180, description="Longitude for proximity search (-180 to 180)")
+    radius_km: Optional[float] = Field(None, gt=0, le=100, description="Return every truck within this many kilometers for proximity search")
     status: Optional[StatusType] = Field(None, description="Filter by permit status")
     limit: Optional[int] = Field(5, ge=1, le=100, description="Maximum number of results")
+    max_results: Optional[int] = Field(None, ge=1, le=MAX_RADIUS_RESULTS, description="Maximum number of results for radius search")
+    explain: bool = Field(False, description="Return the execution plan, candidate counts and stage timings in metadata.explain")
+    cursor: Optional[str] = Field(None, description="metadata.next_cursor of the previous page, sent with the same search to fetch the next page")
 
 class FoodTruck(BaseModel):
     """
@@ -61,6 +82,31 @@ class SearchResponse(BaseModel):
     data: List[FoodTruck] = Field(..., description="List of food trucks")
     metadata: dict = Field(..., description="Search metadata")
 
+class BatchSearchRequest(BaseModel):
+    searches: List[SearchRequest] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE, description="Searches to run, answered in order")
+
+class BatchSearchResponse(BaseModel):
+    success: bool = Field(..., description="Whether the batch was executed")
+    message: str = Field(..., description="Response message")
+    results: List[SearchResponse] = Field(..., description="One search response per search, in request order")
+
+class CacheStatsResponse(BaseModel):
+    size: int = Field(..., description="Number of cached search results")
+    max_entries: int = Field(..., description="Maximum number of cached search results")
+    ttl_seconds: float = Field(..., description="Seconds a cached result stays valid")
+    hits: int = Field(..., description="Searches answered from the cache")
+    misses: int = Field(..., description="Searches that had to be executed")
+    evictions: int = Field(..., description="Results dropped to stay within max_entries")
+    expirations: int = Field(..., description="Results dropped after their time-to-live")
+    invalidations: int = Field(..., description="Times the cache was emptied because new data was published")
+
+class WorkerPoolStatsResponse(BaseModel):
+    max_workers: int = Field(..., description="Searches executed concurrently")
+    max_queue: int = Field(..., description="Searches allowed to wait for a worker")
+    pending: int = Field(..., description="Searches running or waiting right now")
+    completed: int = Field(..., description="Searches finished")
+    rejected: int = Field(..., description="Searches rejected because the pool was saturated")
+
 class HealthResponse(BaseModel):
     status: str = Field(..., description="Service status")
     service: str = Field(..., description="Service name")
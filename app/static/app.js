@@ -4,20 +4,27 @@ const resultsGrid = document.getElementById('resultsGrid');
 const resultsInfo = document.getElementById('resultsInfo');
 const loading = document.getElementById('loading');
 const errorMessage = document.getElementById('errorMessage');
+const loadMoreButton = document.getElementById('loadMoreButton');
 
 // API Base URL
 const API_BASE_URL = 'http://localhost:8000/api';
 
+// Search being shown and the cursor of its next page
+let currentSearch = null;
+let nextCursor = null;
+
 // Form Submissions
 document.getElementById('nameSearchForm').addEventListener('submit', (e) => {
     e.preventDefault();
     const applicant = document.getElementById('applicantName').value;
     const status = document.getElementById('nameStatus').value;
+    const fuzzy = document.getElementById('nameFuzzy').checked;
     
     searchFoodTrucks({
         query_type: 'name',
         applicant: applicant,
-        status: status || undefined
+        status: status || undefined,
+        fuzzy: fuzzy || undefined
     });
 });
 
@@ -33,6 +40,20 @@ document.getElementById('streetSearchForm').addEventListener('submit', (e) => {
     });
 });
 
+document.getElementById('foodSearchForm').addEventListener('submit', (e) => {
+    e.preventDefault();
+    const foodItems = document.getElementById('foodItems').value;
+    const match = document.getElementById('foodMatch').value;
+    const status = document.getElementById('foodStatus').value;
+    
+    searchFoodTrucks({
+        query_type: 'food_items',
+        food_items: foodItems,
+        match: match,
+        status: status || undefined
+    });
+});
+
 document.getElementById('proximitySearchForm').addEventListener('submit', (e) => {
     e.preventDefault();
     const latitude = parseFloat(document.getElementById('latitude').value);
@@ -47,19 +68,26 @@ document.getElementById('proximitySearchForm').addEventListener('submit', (e) =>
     });
 });
 
+loadMoreButton.addEventListener('click', () => {
+    searchFoodTrucks(currentSearch, nextCursor);
+});
+
 // Main Search Function
-async function searchFoodTrucks(searchParams) {
+async function searchFoodTrucks(searchParams, cursor) {
     try {
         showLoading();
-        clearResults();
+        if (!cursor) {
+            clearResults();
+        }
         hideError();
+        loadMoreButton.style.display = 'none';
         
         const response = await fetch(`${API_BASE_URL}/search`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify(searchParams)
+            body: JSON.stringify({ ...searchParams, cursor: cursor || undefined })
         });
         
         const data = await response.json();
@@ -69,7 +97,9 @@ async function searchFoodTrucks(searchParams) {
         }
         
         if (data.success) {
-            displayResults(data);
+            currentSearch = searchParams;
+            nextCursor = data.metadata.next_cursor;
+            displayResults(data, Boolean(cursor));
         } else {
             throw new Error(data.message || 'Search failed');
         }
@@ -82,24 +112,28 @@ async function searchFoodTrucks(searchParams) {
 }
 
 // Display Results
-function displayResults(data) {
+function displayResults(data, append) {
     console.log('Displaying results with data:', data);
     console.log('Data.data:', data.data);
     console.log('First truck:', data.data[0]);
     
+    const shown = data.metadata.offset + data.metadata.total_results;
     resultsInfo.innerHTML = `
-        <span>Found ${data.metadata.total_results} results</span>
+        <span>Showing ${shown} results</span>
         <span>•</span>
         <span>${data.metadata.query_type} search</span>
         ${data.metadata.status_filter ? `<span>•</span><span>Status: ${data.metadata.status_filter}</span>` : ''}
     `;
     
-    if (data.data.length === 0) {
+    if (shown === 0) {
         resultsGrid.innerHTML = '<p style="text-align: center; color: #666; grid-column: 1/-1;">No food trucks found matching your criteria.</p>';
+    } else if (append) {
+        resultsGrid.insertAdjacentHTML('beforeend', data.data.map(truck => createTruckCard(truck)).join(''));
     } else {
         resultsGrid.innerHTML = data.data.map(truck => createTruckCard(truck)).join('');
     }
     
+    loadMoreButton.style.display = nextCursor ? 'block' : 'none';
     resultsContainer.style.display = 'block';
 }
 
@@ -1,4 +1,9 @@
 import math
+import numpy as np
+from typing import Tuple
+from app.utils.profiling import profile_stage
+
+EARTH_RADIUS_KM = 6371  # Earth's radius in kilometers
 
 def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """
@@ -13,8 +18,6 @@ def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     Returns:
         Distance in kilometers
     """
-    R = 6371  # Earth's radius in kilometers
-    
     # Convert to radians
     lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
     
@@ -25,6 +28,105 @@ def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     # Haversine formula
     a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
     c = 2 * math.asin(math.sqrt(a))
-    distance = R * c
+    distance = EARTH_RADIUS_KM * c
     
     return distance
+
+def haversine_distances(latitude: float, longitude: float, lat_rad: np.ndarray, lon_rad: np.ndarray) -> np.ndarray:
+    """
+    Calculate the great circle distance from one point to many points in a single vectorized pass.
+    
+    Args:
+        latitude: Latitude of the query point in degrees
+        longitude: Longitude of the query point in degrees
+        lat_rad: Latitudes of the target points in radians
+        lon_rad: Longitudes of the target points in radians
+    
+    Returns:
+        Array of distances in kilometers, aligned with the target arrays
+    """
+    lat1 = math.radians(latitude)
+    lon1 = math.radians(longitude)
+    
+    # Haversine formula, broadcast over the target arrays
+    with profile_stage('distance'):
+        a = np.sin((lat_rad - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat_rad) * np.sin((lon_rad - lon1) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def haversine_distance_matrix(latitudes: np.ndarray, longitudes: np.ndarray, lat_rad: np.ndarray, lon_rad: np.ndarray) -> np.ndarray:
+    """
+    Calculate the great circle distance from several query points to many points at once.
+    
+    Row i is identical to haversine_distances(latitudes[i], longitudes[i], lat_rad, lon_rad).
+    
+    Args:
+        latitudes: Latitudes of the query points in degrees
+        longitudes: Longitudes of the query points in degrees
+        lat_rad: Latitudes of the target points in radians
+        lon_rad: Longitudes of the target points in radians
+    
+    Returns:
+        Array of distances in kilometers with one row per query point and one column per target
+    """
+    # Per-query terms use the same scalar math as haversine_distances so results match bit for bit
+    lat1 = np.array([math.radians(latitude) for latitude in latitudes])[:, None]
+    lon1 = np.array([math.radians(longitude) for longitude in longitudes])[:, None]
+    cos_lat1 = np.array([math.cos(latitude) for latitude in lat1[:, 0]])[:, None]
+    
+    # Haversine formula, broadcast over queries x targets
+    a = np.sin((lat_rad - lat1) / 2) ** 2 + cos_lat1 * np.cos(lat_rad) * np.sin((lon_rad - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def bounding_box(latitude: float, longitude: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """
+    Calculate the latitude/longitude box that encloses every point within a radius.
+    
+    Args:
+        latitude: Latitude of the center in degrees
+        longitude: Longitude of the center in degrees
+        radius_km: Radius in kilometers
+    
+    Returns:
+        Tuple of (min_lat, max_lat, min_lon, max_lon) in degrees. When the box crosses the
+        antimeridian min_lon is greater than max_lon.
+    """
+    angular = radius_km / EARTH_RADIUS_KM
+    min_lat = latitude - math.degrees(angular)
+    max_lat = latitude + math.degrees(angular)
+    
+    # A circle reaching a pole spans every longitude
+    if min_lat <= -90 or max_lat >= 90 or angular >= math.pi / 2:
+        return max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0
+    
+    # Widest longitude offset reached anywhere on the circle
+    delta_lon = math.degrees(math.asin(min(math.sin(angular) / math.cos(math.radians(latitude)), 1.0)))
+    min_lon = (longitude - delta_lon + 180) % 360 - 180
+    max_lon = (longitude + delta_lon + 180) % 360 - 180
+    return min_lat, max_lat, min_lon, max_lon
+
+def box_distance_lower_bound(latitude: float, longitude: float, box: Tuple[float, float, float, float]) -> float:
+    """
+    Calculate a lower bound on the distance from a point to anything inside a latitude/longitude box.
+    
+    Args:
+        latitude: Latitude of the point in degrees
+        longitude: Longitude of the point in degrees
+        box: Tuple of (min_lat, max_lat, min_lon, max_lon) in degrees, not crossing the antimeridian
+    
+    Returns:
+        Distance in kilometers that no point in the box is closer than (0 when the point is inside)
+    """
+    min_lat, max_lat, min_lon, max_lon = box
+    
+    # Every point in the box is at least the latitude gap away along a meridian
+    lat_gap = max(min_lat - latitude, latitude - max_lat, 0.0)
+    bound = math.radians(lat_gap) * EARTH_RADIUS_KM
+    
+    # ... and, within the box's latitude band, at least the longitude gap away
+    lon_offset = (longitude + 180) % 360 - 180
+    if lon_offset < min_lon or lon_offset > max_lon:
+        lon_gap = min((min_lon - lon_offset) % 360, (lon_offset - max_lon) % 360, 180.0)
+        band_cos = max(0.0, min(math.cos(math.radians(min_lat)), math.cos(math.radians(max_lat))))
+        a = math.cos(math.radians(latitude)) * band_cos * math.sin(math.radians(lon_gap) / 2) ** 2
+        bound = max(bound, 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0))))
+    return bound
@@ -1,6 +1,8 @@
+import json
 import pandas as pd
-from typing import List
-from app.models.food_truck import FoodTruck, SearchType, StatusType
+from typing import Dict, Iterable, Iterator, List
+from pydantic import ValidationError
+from app.models.food_truck import FoodTruck, SearchType, StatusType, TermMatch
 
 def convert_to_food_trucks(df: pd.DataFrame) -> List[FoodTruck]:
     """
@@ -23,8 +25,123 @@ def convert_to_food_trucks(df: pd.DataFrame) -> List[FoodTruck]:
     # This ensures the Pydantic model field names (not aliases) are used in the response
     return food_trucks
 
+def _dump_json(value) -> bytes:
+    """Encode a value the way FastAPI's JSONResponse does (compact, UTF-8, no NaN)"""
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+def serialize_food_trucks(df: pd.DataFrame) -> Dict[int, bytes]:
+    """
+    Validate every row once and serialize it to the JSON a search response returns for it.
+    
+    Args:
+        df: DataFrame containing food truck data
+    
+    Returns:
+        Serialized FoodTruck JSON keyed by locationid; rows that fail validation are left out
+    """
+    fragments = {}
+    df_clean = df.replace({float('nan'): None})
+    for data_dict in df_clean.to_dict('records'):
+        try:
+            food_truck = FoodTruck(**data_dict)
+        except ValidationError as e:
+            print(f"Skipping serialization of location {data_dict.get('locationid')}: {e}")
+            continue
+        fragments[food_truck.location_id] = serialize_food_truck(food_truck)
+    return fragments
+
+def serialize_food_truck(food_truck: FoodTruck) -> bytes:
+    """Serialize a FoodTruck to the JSON a search response returns for it"""
+    return _dump_json(food_truck.model_dump(mode='json', by_alias=True))
+
+def assemble_search_response(message: str, fragments: List[bytes], metadata: dict) -> bytes:
+    """
+    Build a SearchResponse body from pre-serialized FoodTruck fragments.
+    
+    Args:
+        message: Response message
+        fragments: Serialized FoodTruck JSON, in result order
+        metadata: Search metadata
+    
+    Returns:
+        JSON body identical to what FastAPI renders for the equivalent SearchResponse
+    """
+    return b"".join([
+        b'{"success":true,"message":', _dump_json(message),
+        b',"data":[', b",".join(fragments),
+        b'],"metadata":', _dump_json(metadata), b"}"
+    ])
+
+def stream_search_response(message: str, fragment_blocks: Iterable[List[bytes]], metadata: dict) -> Iterator[bytes]:
+    """
+    Build a SearchResponse body piece by piece from blocks of pre-serialized FoodTruck fragments.
+    
+    Args:
+        message: Response message
+        fragment_blocks: Serialized FoodTruck JSON in result order, in blocks that are only
+            serialized as the body is consumed
+        metadata: Search metadata
+    
+    Yields:
+        Parts of a body identical to assemble_search_response with all fragments
+    """
+    yield b'{"success":true,"message":' + _dump_json(message) + b',"data":['
+    separator = b""
+    for fragments in fragment_blocks:
+        if fragments:
+            yield separator + b",".join(fragments)
+            separator = b","
+    yield b'],"metadata":' + _dump_json(metadata) + b"}"
+
+def stream_ndjson(fragment_blocks: Iterable[List[bytes]]) -> Iterator[bytes]:
+    """
+    Build a newline-delimited JSON body with one FoodTruck per line.
+    
+    Args:
+        fragment_blocks: Serialized FoodTruck JSON in result order, in blocks
+    
+    Yields:
+        One part of the body per non-empty block
+    """
+    for fragments in fragment_blocks:
+        if fragments:
+            yield b"\n".join(fragments) + b"\n"
+
+def failed_search_response(message: str, metadata: dict) -> bytes:
+    """
+    Build the SearchResponse body of a search that could not be executed.
+    
+    Args:
+        message: Error message
+        metadata: Search metadata
+    
+    Returns:
+        JSON body of an unsuccessful SearchResponse without data
+    """
+    return b"".join([
+        b'{"success":false,"message":', _dump_json(message),
+        b',"data":[],"metadata":', _dump_json(metadata), b"}"
+    ])
+
+def assemble_batch_response(message: str, responses: List[bytes]) -> bytes:
+    """
+    Build a BatchSearchResponse body from serialized SearchResponse bodies.
+    
+    Args:
+        message: Response message
+        responses: Serialized SearchResponse JSON, in request order
+    
+    Returns:
+        JSON body of the BatchSearchResponse
+    """
+    return b"".join([
+        b'{"success":true,"message":', _dump_json(message),
+        b',"results":[', b",".join(responses), b"]}"
+    ])
+
 def create_search_metadata(query_type: SearchType, status: StatusType = None, limit: int = 10, 
-                          latitude: float = None, longitude: float = None) -> dict:
+                          latitude: float = None, longitude: float = None, radius_km: float = None,
+                          fuzzy: bool = False, match: TermMatch = None) -> dict:
     """
     Create metadata for search response.
     
@@ -32,8 +149,11 @@ def create_search_metadata(query_type: SearchType, status: StatusType = None, li
         query_type: Type of search performed
         status: Status filter applied
         limit: Result limit
-        latitude: Search latitude (for proximity searches)
-        longitude: Search longitude (for proximity searches)
+        latitude: Search latitude (for proximity and compound searches)
+        longitude: Search longitude (for proximity and compound searches)
+        radius_km: Search radius (for radius-bounded proximity and compound searches)
+        fuzzy: Whether the name search tolerated typos
+        match: Whether a food item search needed all of its items or any (for food item and compound searches)
     
     Returns:
         Metadata dictionary
@@ -44,10 +164,16 @@ def create_search_metadata(query_type: SearchType, status: StatusType = None, li
         "limit": limit
     }
     
-    if query_type == SearchType.PROXIMITY:
+    if query_type == SearchType.PROXIMITY or latitude is not None and longitude is not None:
         metadata["search_coordinates"] = {
             "latitude": latitude,
             "longitude": longitude
         }
+        if radius_km is not None:
+            metadata["radius_km"] = radius_km
+    if fuzzy:
+        metadata["fuzzy"] = True
+    if query_type in (SearchType.FOOD_ITEMS, SearchType.COMPOUND) and match is not None:
+        metadata["match"] = match.value
     
     return metadata
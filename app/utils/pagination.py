@@ -0,0 +1,61 @@
+import base64
+import binascii
+import hashlib
+import json
+from typing import Hashable
+
+
+class CursorError(ValueError):
+    """Raised for a cursor that is malformed, belongs to another search or outlived its snapshot"""
+
+
+def _tag(value) -> str:
+    """Short digest identifying a snapshot version or a normalized search"""
+    return hashlib.blake2b(repr(value).encode('utf-8'), digest_size=6).hexdigest()
+
+
+def encode_cursor(version, search_key: Hashable, offset: int) -> str:
+    """
+    Encode the position after a page of results as an opaque cursor.
+
+    Args:
+        version: Version of the snapshot the results came from
+        search_key: Normalized key of the search (see request_cache_key)
+        offset: Position of the first result of the next page
+
+    Returns:
+        URL-safe cursor string
+    """
+    payload = json.dumps({"v": _tag(version), "q": _tag(search_key), "o": offset}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, version, search_key: Hashable) -> int:
+    """
+    Decode a cursor issued for a search on a snapshot version.
+
+    Args:
+        cursor: Cursor from a previous response
+        version: Version of the snapshot the search runs on now
+        search_key: Normalized key of the search the cursor is used with
+
+    Returns:
+        Position of the first result of the page
+
+    Raises:
+        CursorError: If the cursor is malformed, was issued for another search, or the data was
+            reloaded since it was issued
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        offset = payload["o"]
+        version_tag, search_tag = payload["v"], payload["q"]
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, KeyError):
+        raise CursorError("Invalid cursor")
+    if not isinstance(offset, int) or offset < 0:
+        raise CursorError("Invalid cursor")
+    if search_tag != _tag(search_key):
+        raise CursorError("Cursor belongs to a different search; repeat the search it came from")
+    if version_tag != _tag(version):
+        raise CursorError("Cursor expired because the data was reloaded; repeat the search without a cursor")
+    return offset
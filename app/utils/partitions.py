@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, Optional
+
+
+class ValuePartitions:
+    """
+    Rows of a low-cardinality column split by value, precomputed once per snapshot.
+
+    Every value gets both a boolean bitmap over all rows (for filtering candidate rows in
+    place) and a sorted array of its row positions (for iterating a partition directly).
+    Neither requires copying any data at query time.
+    """
+
+    def __init__(self, values: pd.Series):
+        """
+        Build the partitions.
+
+        Args:
+            values: Column to partition; missing values belong to no partition
+        """
+        self.size = len(values)
+        codes, distinct = pd.factorize(values)
+        codes = np.asarray(codes)
+        order = np.argsort(codes, kind='stable')
+        order.flags.writeable = False  # Partitions are shared by every request on the snapshot
+        counts = np.bincount(codes[codes >= 0], minlength=len(distinct))
+        offsets = np.concatenate([[0], np.cumsum(counts)]) + np.count_nonzero(codes < 0)
+
+        self._rows: Dict[object, np.ndarray] = {}
+        self._masks: Dict[object, np.ndarray] = {}
+        for code, value in enumerate(distinct):
+            rows = order[offsets[code]:offsets[code + 1]]
+            mask = np.zeros(self.size, dtype=bool)
+            mask[rows] = True
+            mask.flags.writeable = False
+            self._rows[value] = rows
+            self._masks[value] = mask
+        self._all_rows = np.arange(self.size)
+        self._all_mask = np.ones(self.size, dtype=bool)
+        self._no_rows = self._all_rows[:0]
+        self._no_mask = np.zeros(self.size, dtype=bool)
+        for array in (self._all_rows, self._all_mask, self._no_mask):
+            array.flags.writeable = False
+
+    def values(self):
+        """Distinct values present in the column"""
+        return list(self._rows)
+
+    def rows(self, value: Optional[object] = None) -> np.ndarray:
+        """Sorted row positions holding a value (every row when value is None)"""
+        if value is None:
+            return self._all_rows
+        return self._rows.get(value, self._no_rows)
+
+    def mask(self, value: Optional[object] = None) -> np.ndarray:
+        """Boolean bitmap of the rows holding a value (every row when value is None)"""
+        if value is None:
+            return self._all_mask
+        return self._masks.get(value, self._no_mask)
+
+    def count(self, value: Optional[object] = None) -> int:
+        """Number of rows holding a value (every row when value is None)"""
+        return len(self.rows(value))
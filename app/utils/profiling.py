@@ -0,0 +1,81 @@
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Callable, Iterator, Optional
+
+STAGES = ('filter', 'distance', 'top_k', 'materialize', 'serialize')
+
+# Profile of the search running in the current thread, set only while an explained search runs
+_current_profile: ContextVar[Optional['SearchProfile']] = ContextVar('search_profile', default=None)
+
+
+class SearchProfile:
+    """
+    Execution plan and per-stage timings of one search, collected when explain is requested.
+
+    Search code reports into the active profile through record_step and profile_stage, which do
+    nothing when no profile is active, so searches that are not explained pay no more than a
+    context variable lookup. Stage timings exclude the time spent in stages nested inside them
+    (e.g. distance calculations during a spatial index lookup count as distance, not filter).
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self._clock = clock
+        self._started = clock()
+        self._open = []  # [stage, start, time spent in nested stages] per running stage
+        self.steps = []
+        self.timings = dict.fromkeys(STAGES, 0.0)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Attribute the time spent inside the block to a stage"""
+        entry = [name, self._clock(), 0.0]
+        self._open.append(entry)
+        try:
+            yield
+        finally:
+            self._open.pop()
+            elapsed = self._clock() - entry[1]
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed - entry[2]
+            if self._open:
+                self._open[-1][2] += elapsed
+
+    def step(self, predicate: str, index: str, candidates: int, estimate: Optional[int] = None, **details):
+        """Record one evaluated step of the plan and the candidates left after it"""
+        step = {"predicate": predicate, "index": index, "candidates": int(candidates)}
+        if estimate is not None:
+            step["estimate"] = int(estimate)
+        step.update(details)
+        self.steps.append(step)
+
+    def to_dict(self) -> dict:
+        """Plan, indexes used and timings in milliseconds, as returned in search metadata"""
+        return {
+            "plan": self.steps,
+            "indexes": list(dict.fromkeys(step["index"] for step in self.steps)),
+            "timings_ms": {name: round(seconds * 1000, 3) for name, seconds in self.timings.items()},
+            "total_ms": round((self._clock() - self._started) * 1000, 3)
+        }
+
+
+@contextmanager
+def profiling(profile: Optional[SearchProfile]) -> Iterator[Optional[SearchProfile]]:
+    """Make a profile (or None for no profiling) the active one for the duration of the block"""
+    token = _current_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _current_profile.reset(token)
+
+
+def profile_stage(name: str):
+    """Context manager attributing a block's time to a stage of the active profile, if any"""
+    profile = _current_profile.get()
+    return profile.stage(name) if profile is not None else nullcontext()
+
+
+def record_step(predicate: str, index: str, candidates: int, estimate: Optional[int] = None, **details):
+    """Record a plan step in the active profile, if any"""
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.step(predicate, index, candidates, estimate, **details)
@@ -0,0 +1,213 @@
+import numpy as np
+from abc import ABC, abstractmethod
+from typing import List, Optional, Tuple
+from app.models.food_truck import SearchRequest, TermMatch
+from app.dataloader.snapshot import DataSnapshot
+from app.utils.geo import haversine_distances
+from app.utils.partitions import ValuePartitions
+from app.utils.profiling import record_step
+from app.utils.spatial_index import top_k
+from app.utils.text_index import contains_rows, is_literal, parse_terms
+
+
+class Predicate(ABC):
+    """
+    One condition of a compound search.
+
+    A predicate estimates how many rows it matches from index statistics alone, looks up its
+    matching rows in an index, and filters a set of candidate rows found by another predicate.
+    """
+
+    name = ''
+    index = ''  # Index or partition the predicate is answered from
+
+    @abstractmethod
+    def estimate(self, snapshot: DataSnapshot) -> int:
+        """Upper bound on the rows the predicate matches, without evaluating it"""
+
+    @abstractmethod
+    def rows(self, snapshot: DataSnapshot) -> np.ndarray:
+        """Sorted row positions matching the predicate"""
+
+    @abstractmethod
+    def filter(self, snapshot: DataSnapshot, rows: np.ndarray) -> np.ndarray:
+        """Keep only the candidate rows matching the predicate, in their given order"""
+
+
+class TextPredicate(Predicate):
+    """Case-insensitive substring match on a text column with a trigram index"""
+
+    def __init__(self, name: str, column: str, index: str, term: str):
+        self.name = name
+        self.column = column
+        self.term = term
+        # Terms with regular expression syntax scan the column like contains_rows does
+        self.index = index if is_literal(term) else 'scan'
+        self._index_name = index
+
+    def estimate(self, snapshot: DataSnapshot) -> int:
+        if self.index == 'scan':
+            return len(snapshot)
+        return getattr(snapshot, self._index_name).estimate(self.term)
+
+    def rows(self, snapshot: DataSnapshot) -> np.ndarray:
+        return contains_rows(snapshot.data[self.column], self.term, getattr(snapshot, self._index_name))
+
+    def filter(self, snapshot: DataSnapshot, rows: np.ndarray) -> np.ndarray:
+        if self.index == 'scan':
+            values = snapshot.data[self.column].iloc[rows]
+            return rows[values.str.contains(self.term, case=False, na=False).to_numpy(dtype=bool)]
+        return getattr(snapshot, self._index_name).filter_rows(rows, self.term)
+
+
+class FoodItemPredicate(Predicate):
+    """Food items sold, all or any of several, from the item token index"""
+
+    name = 'food_items'
+    index = 'food_item_index'
+
+    def __init__(self, terms: List[List[str]], match_all: bool):
+        self.terms = terms
+        self.match_all = match_all
+
+    def estimate(self, snapshot: DataSnapshot) -> int:
+        return snapshot.food_item_index.estimate(self.terms, self.match_all)
+
+    def rows(self, snapshot: DataSnapshot) -> np.ndarray:
+        return snapshot.food_item_index.match(self.terms, self.match_all)
+
+    def filter(self, snapshot: DataSnapshot, rows: np.ndarray) -> np.ndarray:
+        return snapshot.food_item_index.filter_rows(rows, self.terms, self.match_all)
+
+
+class PartitionPredicate(Predicate):
+    """Equality with one value of a partitioned column (status, facility type), ignoring case"""
+
+    def __init__(self, name: str, index: str, value: str):
+        self.name = name
+        self.index = index
+        self.value = value
+
+    def _partition(self, snapshot: DataSnapshot) -> Tuple[ValuePartitions, str]:
+        partitions = getattr(snapshot, self.index)
+        lowered = self.value.lower()
+        for value in partitions.values():
+            if isinstance(value, str) and value.lower() == lowered:
+                return partitions, value
+        return partitions, self.value
+
+    def estimate(self, snapshot: DataSnapshot) -> int:
+        partitions, value = self._partition(snapshot)
+        return partitions.count(value)
+
+    def rows(self, snapshot: DataSnapshot) -> np.ndarray:
+        partitions, value = self._partition(snapshot)
+        return partitions.rows(value)
+
+    def filter(self, snapshot: DataSnapshot, rows: np.ndarray) -> np.ndarray:
+        partitions, value = self._partition(snapshot)
+        return rows[partitions.mask(value)[rows]]
+
+
+class RadiusPredicate(Predicate):
+    """Distance from a point within a radius, from the spatial index"""
+
+    name = 'radius'
+    index = 'spatial_index'
+
+    def __init__(self, latitude: float, longitude: float, radius_km: float):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.radius_km = radius_km
+
+    def estimate(self, snapshot: DataSnapshot) -> int:
+        return snapshot.spatial_index.count_within(self.latitude, self.longitude, self.radius_km)
+
+    def rows(self, snapshot: DataSnapshot) -> np.ndarray:
+        return np.sort(snapshot.spatial_index.within(self.latitude, self.longitude, self.radius_km)[0])
+
+    def filter(self, snapshot: DataSnapshot, rows: np.ndarray) -> np.ndarray:
+        rows = rows[snapshot.coordinate_mask[rows]]
+        distances = haversine_distances(self.latitude, self.longitude, snapshot.lat_rad[rows], snapshot.lon_rad[rows])
+        return rows[distances <= self.radius_km]
+
+
+def compound_predicates(search_request: SearchRequest) -> List[Predicate]:
+    """
+    Turn the fields of a compound search request into predicates.
+
+    Args:
+        search_request: The search request; every given name, street, food item, facility type,
+            status and radius becomes one predicate
+
+    Returns:
+        Predicates in field order
+    """
+    predicates: List[Predicate] = []
+    if search_request.applicant:
+        predicates.append(TextPredicate('applicant', 'Applicant', 'applicant_index', search_request.applicant))
+    if search_request.street:
+        predicates.append(TextPredicate('street', 'Address', 'address_index', search_request.street))
+    if search_request.food_items:
+        terms = parse_terms(search_request.food_items)
+        if not terms:
+            raise ValueError("Food items required for food item search")
+        predicates.append(FoodItemPredicate(terms, search_request.match == TermMatch.ALL))
+    if search_request.facility_type:
+        predicates.append(PartitionPredicate('facility_type', 'facility_partitions', search_request.facility_type))
+    if search_request.status:
+        predicates.append(PartitionPredicate('status', 'status_partitions', search_request.status.value))
+    if search_request.radius_km is not None:
+        predicates.append(RadiusPredicate(search_request.latitude, search_request.longitude, search_request.radius_km))
+    return predicates
+
+
+def plan_compound(snapshot: DataSnapshot, predicates: List[Predicate]) -> List[Tuple[int, Predicate]]:
+    """
+    Order predicates most selective first by their estimated row counts.
+
+    Args:
+        snapshot: Snapshot the predicates will run on
+        predicates: Predicates of a compound search
+
+    Returns:
+        (estimate, predicate) pairs, smallest estimate first and in field order among equal ones
+    """
+    estimated = [(predicate.estimate(snapshot), position, predicate) for position, predicate in enumerate(predicates)]
+    return [(estimate, predicate) for estimate, _, predicate in sorted(estimated, key=lambda item: item[:2])]
+
+
+def run_compound(snapshot: DataSnapshot, plan: List[Tuple[int, Predicate]], latitude: Optional[float] = None,
+                 longitude: Optional[float] = None, limit: Optional[int] = None) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Evaluate a compound search plan.
+
+    The first predicate looks up its rows in its index; every later one only filters the rows
+    that survived, and evaluation stops as soon as none are left. Each evaluated step is
+    recorded in the active search profile, if any.
+
+    Args:
+        snapshot: Snapshot to search
+        plan: Predicates ordered by plan_compound
+        latitude: Optional latitude to order the results by distance from
+        longitude: Optional longitude to order the results by distance from
+        limit: Optional number of results to keep
+
+    Returns:
+        Tuple of (rows, distances or None); rows are in dataset order, or nearest first when
+        coordinates are given
+    """
+    rows = None
+    for estimate, predicate in plan:
+        mode = 'lookup' if rows is None else 'filter'
+        rows = predicate.rows(snapshot) if rows is None else predicate.filter(snapshot, rows)
+        record_step(predicate.name, predicate.index, len(rows), estimate, mode=mode)
+        if not len(rows):
+            break
+
+    if latitude is None or longitude is None:
+        return rows[:limit], None
+    rows = rows[snapshot.coordinate_mask[rows]]
+    distances = haversine_distances(latitude, longitude, snapshot.lat_rad[rows], snapshot.lon_rad[rows])
+    return top_k(rows, distances, limit)
+
@@ -0,0 +1,143 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+from app.models.food_truck import SearchRequest, SearchType
+from app.utils.text_index import is_literal, parse_terms
+
+
+def request_cache_key(search_request: SearchRequest, limit: int, coordinate_precision: int) -> tuple:
+    """
+    Normalize a search request into a cache key.
+
+    Only the fields the query type uses are kept. Literal search terms are lower-cased (searches
+    ignore case), food items are reduced to their normalized tokens and coordinates are rounded, so requests within the same small cell share an entry.
+
+    Args:
+        search_request: The search request
+        limit: Effective result limit of the request
+        coordinate_precision: Decimal places coordinates are rounded to
+
+    Returns:
+        Hashable cache key
+    """
+    query_type = search_request.query_type
+    status = search_request.status.value if search_request.status else None
+    if query_type == SearchType.PROXIMITY:
+        latitude, longitude = _rounded_coordinates(search_request, coordinate_precision)
+        return (query_type.value, latitude, longitude, search_request.radius_km, status, limit)
+
+    if query_type == SearchType.FOOD_ITEMS:
+        return (query_type.value, _food_item_terms(search_request), search_request.match.value, status, limit)
+    if query_type == SearchType.COMPOUND:
+        latitude, longitude = _rounded_coordinates(search_request, coordinate_precision)
+        facility_type = search_request.facility_type.lower() if search_request.facility_type else None
+        return (
+            query_type.value, _literal_term(search_request.applicant), _literal_term(search_request.street),
+            _food_item_terms(search_request), search_request.match.value if search_request.food_items else None,
+            facility_type, latitude, longitude, search_request.radius_km, status, limit
+        )
+
+    term = search_request.applicant if query_type == SearchType.NAME else search_request.street
+    if term and search_request.fuzzy:
+        term = term.lower()
+    return (query_type.value, _literal_term(term), status, search_request.fuzzy, limit)
+
+
+def _literal_term(term: Optional[str]) -> Optional[str]:
+    """Lower-case a search term unless it is a regular expression, where case can matter"""
+    return term.lower() if term and is_literal(term) else term
+
+
+def _food_item_terms(search_request: SearchRequest) -> tuple:
+    """Normalized tokens of a request's food items, in a canonical order"""
+    return tuple(sorted(tuple(sorted(tokens)) for tokens in parse_terms(search_request.food_items or '')))
+
+
+def _rounded_coordinates(search_request: SearchRequest, coordinate_precision: int) -> tuple:
+    """Request coordinates rounded to the cache precision (None when either is missing)"""
+    latitude, longitude = search_request.latitude, search_request.longitude
+    if latitude is None or longitude is None:
+        return latitude, longitude
+    return round(latitude, coordinate_precision), round(longitude, coordinate_precision)
+
+
+class ResultCache:
+    """
+    Bounded LRU cache of search results with a time-to-live, tied to one data snapshot.
+
+    Entries belong to the snapshot they were computed from. As soon as a request arrives with a
+    different snapshot (a reload was published) every entry is dropped, so stale results are
+    never served.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, value), least recently used first
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _bind(self, snapshot):
+        """Drop every entry if the snapshot differs from the one the entries came from"""
+        if snapshot is not self._snapshot:
+            if self._entries:
+                self.invalidations += 1
+                self._entries.clear()
+            self._snapshot = snapshot
+
+    def get(self, snapshot, key: Hashable):
+        """Get the cached result for a key on a snapshot, or None"""
+        with self._lock:
+            self._bind(snapshot)
+            entry = self._entries.get((snapshot.version, key))
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._entries[(snapshot.version, key)]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end((snapshot.version, key))
+            self.hits += 1
+            return value
+
+    def put(self, snapshot, key: Hashable, value):
+        """Cache the result for a key on a snapshot, evicting the least recently used entries"""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._bind(snapshot)
+            self._entries[(snapshot.version, key)] = (self._clock() + self.ttl_seconds, value)
+            self._entries.move_to_end((snapshot.version, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+            self._snapshot = None
+
+    def stats(self) -> dict:
+        """Current size and hit/miss/eviction counters"""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations
+            }
@@ -1,16 +1,45 @@
+import numpy as np
 import pandas as pd
-from typing import List, Tuple
-from app.models.food_truck import FoodTruck, SearchType, StatusType
-from app.utils.geo import haversine_distance
+from typing import List, NamedTuple, Optional, Sequence, Tuple, Union
+from app.models.food_truck import FoodTruck, SearchRequest, SearchType, StatusType, TermMatch, MAX_RADIUS_RESULTS
+from app.dataloader.snapshot import DataSnapshot, ShardedSnapshot, as_snapshot
+from app.dataloader.schema import restore_schema
+from app.utils.geo import box_distance_lower_bound, haversine_distances, haversine_distance_matrix
+from app.utils.spatial_index import top_k
+from app.utils.query_planner import compound_predicates, plan_compound, run_compound
+from app.utils.profiling import profile_stage, record_step
+from app.utils.text_index import contains_rows, is_literal, parse_terms
+
+BATCH_MATRIX_MAX_ROWS = 65536  # Above this many candidate trucks a batch uses the spatial index per query
+BATCH_BLOCK_CELLS = 1 << 22  # Distance matrix entries computed per block (32 MiB of float64)
+ROUTING_SLACK_KM = 1e-6  # Absorbs rounding in shard bounding-box distance bounds
+
+class SearchHits(NamedTuple):
+    """Result of a search as row positions into a snapshot, before any data is materialized"""
+    rows: np.ndarray
+    distances: Optional[np.ndarray] = None
+    scores: Optional[np.ndarray] = None  # Similarity of fuzzy name matches
+
+    def head(self, limit: int) -> 'SearchHits':
+        """Keep only the first limit hits"""
+        return self.page(0, limit)
+
+    def page(self, offset: int, limit: int) -> 'SearchHits':
+        """Keep only the limit hits starting at offset"""
+        end = offset + limit
+        return SearchHits(*(None if values is None else values[offset:end] for values in self))
 
 def apply_status_filter(df: pd.DataFrame, status: StatusType = None) -> pd.DataFrame:
     """
-    Apply status filter to DataFrame.
-    
+    Apply status filter to DataFrame, returning an independent copy.
+
+    The search functions do not use this; they intersect row positions with the snapshot's
+    precomputed status partitions instead of copying the data.
+
     Args:
         df: DataFrame containing food truck data
         status: Status to filter by
-    
+
     Returns:
         Filtered DataFrame
     """
@@ -18,80 +47,493 @@ def apply_status_filter(df: pd.DataFrame, status: StatusType = None) -> pd.DataF
         return df[df['Status'] == status.value].copy()
     return df.copy()
 
-def search_by_name(df: pd.DataFrame, applicant: str, status: StatusType = None) -> pd.DataFrame:
+def filter_rows_by_status(snapshot: DataSnapshot, rows: np.ndarray, status: StatusType = None) -> np.ndarray:
     """
-    Search food trucks by business name.
-    
+    Keep only the row positions whose permit has the given status.
+
     Args:
-        df: DataFrame containing food truck data
+        snapshot: Snapshot the rows belong to
+        rows: Row positions to filter
+        status: Status to filter by
+
+    Returns:
+        Filtered row positions
+    """
+    if not status:
+        return rows
+    rows = rows[snapshot.status_partitions.mask(status.value)[rows]]
+    record_step('status', 'status_partitions', len(rows))
+    return rows
+
+def find_by_name(snapshot: DataSnapshot, applicant: str, status: StatusType = None, fuzzy: bool = False) -> SearchHits:
+    """
+    Find the rows whose business name contains a term.
+
+    Args:
+        snapshot: Snapshot to search
         applicant: Business name to search for
         status: Optional status filter
-    
+        fuzzy: Also match names containing the term with typos, ranked by similarity
+
     Returns:
-        Filtered DataFrame
+        SearchHits in dataset order, or best match first with their scores when fuzzy
     """
     if not applicant:
         raise ValueError("Applicant name required for name search")
-    
-    # Apply status filter
-    df = apply_status_filter(df, status)
-    
-    mask = df['Applicant'].str.contains(applicant, case=False, na=False)
-    return df[mask]
 
-def search_by_street(df: pd.DataFrame, street: str, status: StatusType = None) -> pd.DataFrame:
+    if fuzzy:
+        # Candidate names come from the trigram postings; only a shortlist is scored exactly
+        rows, scores = snapshot.applicant_index.similar(applicant)
+        record_step('applicant', 'applicant_index', len(rows), fuzzy=True)
+        if status:
+            keep = snapshot.status_partitions.mask(status.value)[rows]
+            rows, scores = rows[keep], scores[keep]
+            record_step('status', 'status_partitions', len(rows))
+        return SearchHits(rows, scores=scores)
+
+    # Candidate rows come from the trigram index and are verified exactly
+    rows = contains_rows(snapshot.data['Applicant'], applicant, snapshot.applicant_index)
+    record_step('applicant', 'applicant_index' if is_literal(applicant) else 'scan', len(rows))
+    return SearchHits(filter_rows_by_status(snapshot, rows, status))
+
+def find_by_street(snapshot: DataSnapshot, street: str, status: StatusType = None) -> SearchHits:
     """
-    Search food trucks by street address.
-    
+    Find the rows whose street address contains a term.
+
     Args:
-        df: DataFrame containing food truck data
+        snapshot: Snapshot to search
         street: Street name to search for
         status: Optional status filter
-    
+
     Returns:
-        Filtered DataFrame
+        SearchHits in dataset order
     """
     if not street:
         raise ValueError("Street name required for street search")
-    
-    # Apply status filter
-    df = apply_status_filter(df, status)
-    
-    mask = df['Address'].str.contains(street, case=False, na=False)
-    return df[mask]
 
-def search_by_proximity(df: pd.DataFrame, latitude: float, longitude: float, status: StatusType = StatusType.APPROVED) -> pd.DataFrame:
+    # Candidate rows come from the trigram index and are verified exactly
+    rows = contains_rows(snapshot.data['Address'], street, snapshot.address_index)
+    record_step('street', 'address_index' if is_literal(street) else 'scan', len(rows))
+    return SearchHits(filter_rows_by_status(snapshot, rows, status))
+
+def find_by_food_items(snapshot: DataSnapshot, food_items: str, match: TermMatch = TermMatch.ALL,
+                       status: StatusType = None) -> SearchHits:
     """
-    Search food trucks by proximity to coordinates.
-    
+    Find the rows whose food items contain all (or any) of several items.
+
     Args:
-        df: DataFrame containing food truck data
+        snapshot: Snapshot to search
+        food_items: Comma-separated items to search for, e.g. "tacos, hot dogs"
+        match: Whether every item must be sold or at least one
+        status: Optional status filter
+
+    Returns:
+        SearchHits in dataset order
+    """
+    terms = parse_terms(food_items or '')
+    if not terms:
+        raise ValueError("Food items required for food item search")
+
+    # Rows come from the posting lists of the item index, no per-row text is scanned
+    rows = snapshot.food_item_index.match(terms, match == TermMatch.ALL)
+    record_step('food_items', 'food_item_index', len(rows))
+    return SearchHits(filter_rows_by_status(snapshot, rows, status))
+
+def validate_proximity(latitude: float, longitude: float, radius_km: float = None):
+    """Reject proximity searches without coordinates or with a non-positive radius"""
+    if latitude is None or longitude is None:
+        raise ValueError("Latitude and longitude required for proximity search")
+    if radius_km is not None and radius_km <= 0:
+        raise ValueError("Radius must be positive for proximity search")
+
+def find_by_proximity(snapshot: DataSnapshot, latitude: float, longitude: float, status: StatusType = StatusType.APPROVED,
+                      limit: int = None, radius_km: float = None) -> SearchHits:
+    """
+    Find the rows nearest to coordinates.
+
+    Args:
+        snapshot: Snapshot to search
         latitude: Search latitude
         longitude: Search longitude
         status: Optional status filter (defaults to APPROVED)
-    
+        limit: Optional number of nearest results; only these are selected and sorted
+        radius_km: Optional search radius; only trucks within it are returned
+
     Returns:
-        Filtered and sorted DataFrame by distance
+        SearchHits sorted by distance
     """
-    if latitude is None or longitude is None:
-        raise ValueError("Latitude and longitude required for proximity search")
-    
-    # Apply status filter (defaults to APPROVED if not specified)
-    df = apply_status_filter(df, status)
-    
-    # Copy the DataFrame first, then filter to only rows with valid coordinates
-    df_copy = df.copy()
-    valid_coords_df = df_copy.dropna(subset=['Latitude', 'Longitude'])
-    
-    if valid_coords_df.empty:
-        return valid_coords_df  # Return empty DataFrame if no valid coordinates
-    
-    # Calculate distances and sort by proximity
-    valid_coords_df['Distance'] = valid_coords_df.apply(
-        lambda row: haversine_distance(
-            latitude, longitude,
-            row['Latitude'], row['Longitude']
-        ), axis=1
+    validate_proximity(latitude, longitude, radius_km)
+
+    # Narrow by the precomputed status partition (defaults to APPROVED if not specified)
+    allowed = None
+    allowed_rows = None
+    if status:
+        allowed = snapshot.status_partitions.mask(status.value)
+        allowed_rows = snapshot.status_partitions.rows(status.value)
+        record_step('status', 'status_partitions', len(allowed_rows))
+
+    if radius_km is not None:
+        # Bounding-box prefilter through the spatial index, exact distances only for survivors
+        rows, distances = snapshot.spatial_index.within(latitude, longitude, radius_km, allowed, limit)
+        record_step('radius', 'spatial_index', len(rows))
+    elif limit:
+        # k-nearest-neighbour lookup through the spatial index
+        rows, distances = snapshot.spatial_index.nearest(latitude, longitude, limit, allowed, allowed_rows)
+        record_step('nearest', 'spatial_index', len(rows))
+    else:
+        # Calculate all distances in one pass over the precomputed radian arrays
+        rows = snapshot.coordinate_rows if allowed_rows is None else allowed_rows[snapshot.coordinate_mask[allowed_rows]]
+        distances = haversine_distances(latitude, longitude, snapshot.lat_rad[rows], snapshot.lon_rad[rows])
+        rows, distances = top_k(rows, distances, None)
+        record_step('nearest', 'scan', len(rows))
+    return SearchHits(rows, distances)
+
+def find_compound(snapshot: DataSnapshot, search_request: SearchRequest, limit: int = None) -> SearchHits:
+    """
+    Find the rows matching every predicate of a compound search.
+
+    Each given name, street, food item, facility type, status and radius is a predicate. The
+    predicate with the smallest estimated row count (from index statistics) looks up its rows
+    first, and the others only filter the rows that survived it.
+
+    Args:
+        snapshot: Snapshot to search
+        search_request: The compound search request
+        limit: Optional number of results
+
+    Returns:
+        SearchHits in dataset order, or sorted by distance when coordinates are given
+    """
+    latitude, longitude = search_request.latitude, search_request.longitude
+    if latitude is not None or longitude is not None or search_request.radius_km is not None:
+        validate_proximity(latitude, longitude, search_request.radius_km)
+    predicates = compound_predicates(search_request)
+    if not predicates:
+        raise ValueError("Compound search requires a name, street, food item, facility type, status or radius")
+
+    rows, distances = run_compound(snapshot, plan_compound(snapshot, predicates), latitude, longitude, limit)
+    return SearchHits(rows, distances)
+
+def result_limit(search_request: SearchRequest) -> int:
+    """
+    Number of results a request returns - different defaults based on search type.
+
+    Args:
+        search_request: The search request
+
+    Returns:
+        Result limit
+    """
+    if search_request.query_type == SearchType.PROXIMITY and search_request.radius_km is not None:
+        return search_request.max_results or MAX_RADIUS_RESULTS  # Radius search returns everything in range
+    if search_request.query_type == SearchType.PROXIMITY:
+        return search_request.limit or 5  # Default 5 for proximity search
+    return search_request.limit or 10  # Default 10 for name/street/food item/compound search
+
+def validate_search(search_request: SearchRequest) -> None:
+    """
+    Reject option combinations a search type does not support.
+
+    Runs before any cache lookup, so a request is rejected whether or not the same search
+    without the unsupported option has been answered from the cache.
+
+    Args:
+        search_request: The search request
+
+    Raises:
+        ValueError: If the request asks for fuzzy matching on anything but a name search
+    """
+    if search_request.fuzzy and search_request.query_type != SearchType.NAME:
+        raise ValueError("Fuzzy matching is only supported for name search")
+
+def execute_search(snapshot: DataSnapshot, search_request: SearchRequest, limit: int) -> SearchHits:
+    """
+    Run a search request against a snapshot without materializing any data.
+
+    Args:
+        snapshot: Snapshot to search
+        search_request: The search request
+        limit: Maximum number of hits to return
+
+    Returns:
+        At most limit SearchHits, in result order
+    """
+    if isinstance(snapshot, ShardedSnapshot):
+        return execute_sharded_search(snapshot, search_request, limit)
+    validate_search(search_request)
+    with profile_stage('filter'):
+        if search_request.query_type == SearchType.NAME:
+            hits = find_by_name(snapshot, search_request.applicant, search_request.status, search_request.fuzzy)
+        elif search_request.query_type == SearchType.STREET:
+            hits = find_by_street(snapshot, search_request.street, search_request.status)
+        elif search_request.query_type == SearchType.FOOD_ITEMS:
+            hits = find_by_food_items(snapshot, search_request.food_items, search_request.match, search_request.status)
+        elif search_request.query_type == SearchType.COMPOUND:
+            hits = find_compound(snapshot, search_request, limit)
+        elif search_request.query_type == SearchType.PROXIMITY:
+            hits = find_by_proximity(
+                snapshot,
+                search_request.latitude,
+                search_request.longitude,
+                search_request.status,
+                limit,
+                search_request.radius_km
+            )
+        else:
+            raise ValueError(f"Unsupported query type: {search_request.query_type}")
+    return hits.head(limit)
+
+def find_nearest_batch(snapshot: DataSnapshot, latitudes: Sequence[float], longitudes: Sequence[float],
+                       status: StatusType, limits: Sequence[int]) -> List[SearchHits]:
+    """
+    Find the nearest rows for several coordinates sharing one status filter.
+
+    While the candidate set is small enough, all queries are answered from one query-by-truck
+    distance matrix (computed in blocks); larger data sets use the spatial index per query.
+
+    Args:
+        snapshot: Snapshot to search
+        latitudes: Search latitudes
+        longitudes: Search longitudes
+        status: Status filter shared by every query
+        limits: Number of nearest results per query
+
+    Returns:
+        SearchHits sorted by distance, one per query, identical to find_by_proximity
+    """
+    rows = snapshot.coordinate_rows
+    if status:
+        rows = rows[snapshot.status_partitions.mask(status.value)[rows]]
+    if len(rows) > BATCH_MATRIX_MAX_ROWS:
+        return [
+            find_by_proximity(snapshot, latitude, longitude, status, limit)
+            for latitude, longitude, limit in zip(latitudes, longitudes, limits)
+        ]
+
+    lat_rad = snapshot.lat_rad[rows]
+    lon_rad = snapshot.lon_rad[rows]
+    block = max(1, BATCH_BLOCK_CELLS // max(len(rows), 1))
+    hits = []
+    for start in range(0, len(latitudes), block):
+        matrix = haversine_distance_matrix(latitudes[start:start + block], longitudes[start:start + block], lat_rad, lon_rad)
+        for distances, limit in zip(matrix, limits[start:start + block]):
+            hits.append(SearchHits(*top_k(rows, distances, limit)))
+    return hits
+
+def execute_batch(snapshot: DataSnapshot, search_requests: Sequence[SearchRequest], limits: Sequence[int]) -> List[Union[SearchHits, ValueError]]:
+    """
+    Run several search requests against one snapshot.
+
+    Nearest-neighbour proximity searches are grouped by status filter and evaluated together;
+    every other request runs through execute_search.
+
+    Args:
+        snapshot: Snapshot to search
+        search_requests: The search requests
+        limits: Maximum number of hits per request
+
+    Returns:
+        SearchHits per request in request order, or the ValueError a request failed with
+    """
+    results: List[Union[SearchHits, ValueError, None]] = [None] * len(search_requests)
+    if isinstance(snapshot, ShardedSnapshot):
+        # Each search is routed to its own subset of shards
+        for position, (search_request, limit) in enumerate(zip(search_requests, limits)):
+            try:
+                results[position] = execute_sharded_search(snapshot, search_request, limit)
+            except ValueError as e:
+                results[position] = e
+        return results
+    groups = {}
+    for position, (search_request, limit) in enumerate(zip(search_requests, limits)):
+        if (search_request.query_type == SearchType.PROXIMITY and search_request.radius_km is None
+                and search_request.latitude is not None and search_request.longitude is not None):
+            groups.setdefault(search_request.status, []).append(position)
+            continue
+        try:
+            results[position] = execute_search(snapshot, search_request, limit)
+        except ValueError as e:
+            results[position] = e
+
+    for status, positions in groups.items():
+        group_hits = find_nearest_batch(
+            snapshot,
+            [search_requests[position].latitude for position in positions],
+            [search_requests[position].longitude for position in positions],
+            status,
+            [limits[position] for position in positions]
+        )
+        for position, hits in zip(positions, group_hits):
+            results[position] = hits
+    return results
+
+def shard_hits(sharded: ShardedSnapshot, shard_id: int, hits: SearchHits) -> SearchHits:
+    """Translate a shard's hits to global row positions"""
+    return hits._replace(rows=hits.rows + sharded.offsets[shard_id])
+
+def merge_nearest(parts: List[SearchHits], limit: Optional[int]) -> SearchHits:
+    """Merge distance-sorted hits of several shards, keeping the limit nearest (ties by global row)"""
+    if not parts:
+        return SearchHits(np.empty(0, dtype=np.int64), np.empty(0))
+    return SearchHits(*top_k(
+        np.concatenate([part.rows for part in parts]),
+        np.concatenate([part.distances for part in parts]),
+        limit
+    ))
+
+def merge_ranked(parts: List[SearchHits], limit: int) -> SearchHits:
+    """Merge score-ranked hits of several shards, keeping the limit best (ties by global row)"""
+    if not parts:
+        return SearchHits(np.empty(0, dtype=np.int64), scores=np.empty(0))
+    rows = np.concatenate([part.rows for part in parts])
+    scores = np.concatenate([part.scores for part in parts])
+    order = np.lexsort((rows, -scores))[:limit]
+    return SearchHits(rows[order], scores=scores[order])
+
+def execute_sharded_search(sharded: ShardedSnapshot, search_request: SearchRequest, limit: int) -> SearchHits:
+    """
+    Run a search request across the shards of a sharded snapshot.
+
+    Name, street and food item searches (and compound searches without coordinates) fan out to
+    the shards in order and stop once limit hits are found; fuzzy name searches ask every shard
+    for its best limit matches and keep the best overall. Proximity searches (and compound
+    searches with coordinates) only visit shards whose bounding box can contain a result: for a radius
+    search, shards whose box is within the radius; for a nearest-neighbour search, shards in
+    order of their box's distance, stopping once the next box is farther than the current
+    limit-th nearest hit. Results equal those of one snapshot holding every shard's rows.
+
+    Args:
+        sharded: Sharded snapshot to search
+        search_request: The search request
+        limit: Maximum number of hits to return
+
+    Returns:
+        At most limit SearchHits over global row positions, in result order
+    """
+    if search_request.fuzzy and search_request.query_type == SearchType.NAME:
+        return merge_ranked([
+            shard_hits(sharded, shard_id, execute_search(shard, search_request, limit))
+            for shard_id, shard in enumerate(sharded.shards)
+        ], limit)
+    geo = search_request.latitude is not None or search_request.longitude is not None or search_request.radius_km is not None
+    if (search_request.query_type in (SearchType.NAME, SearchType.STREET, SearchType.FOOD_ITEMS)
+            or search_request.query_type == SearchType.COMPOUND and not geo):
+        parts = []
+        found = 0
+        for shard_id, shard in enumerate(sharded.shards):
+            hits = execute_search(shard, search_request, limit - found)
+            record_step('shard', 'shards', len(hits.rows), shard=sharded.names[shard_id])
+            parts.append(shard_hits(sharded, shard_id, hits))
+            found += len(hits.rows)
+            if found >= limit:
+                break
+        if not parts:
+            return SearchHits(np.empty(0, dtype=np.int64))
+        return SearchHits(np.concatenate([part.rows for part in parts]))
+
+    if search_request.query_type not in (SearchType.PROXIMITY, SearchType.COMPOUND):
+        raise ValueError(f"Unsupported query type: {search_request.query_type}")
+    latitude, longitude, radius_km = search_request.latitude, search_request.longitude, search_request.radius_km
+    validate_proximity(latitude, longitude, radius_km)
+
+    # Shards without coordinates can never hold a proximity result
+    candidates = sorted(
+        (box_distance_lower_bound(latitude, longitude, shard.bounds), shard_id)
+        for shard_id, shard in enumerate(sharded.shards) if shard.bounds is not None
     )
-    return valid_coords_df.sort_values('Distance')
+    parts = []
+    best = None
+    for bound, shard_id in candidates:
+        if radius_km is not None and bound > radius_km + ROUTING_SLACK_KM:
+            break
+        if radius_km is None and best is not None and len(best.rows) >= limit and bound > best.distances[-1] + ROUTING_SLACK_KM:
+            break
+        hits = execute_search(sharded.shards[shard_id], search_request, limit)
+        record_step('shard', 'shard_bounds', len(hits.rows), shard=sharded.names[shard_id], bound_km=round(bound, 3))
+        parts.append(shard_hits(sharded, shard_id, hits))
+        best = merge_nearest(parts, limit)
+    return best if best is not None else merge_nearest([], limit)
+
+def materialize(snapshot: DataSnapshot, hits: SearchHits) -> pd.DataFrame:
+    """
+    Copy the data for a set of hits out of the snapshot.
+
+    Args:
+        snapshot: Snapshot the hits belong to
+        hits: Rows to materialize
+
+    Returns:
+        DataFrame holding only the hit rows (with a Distance column for proximity hits and a
+        Similarity column for fuzzy name hits)
+    """
+    df = restore_schema(snapshot.take(hits.rows))
+    if hits.distances is not None:
+        df = df.assign(Distance=hits.distances)
+    if hits.scores is not None:
+        df = df.assign(Similarity=hits.scores)
+    return df
+
+def search_by_name(data: Union[pd.DataFrame, DataSnapshot], applicant: str, status: StatusType = None) -> pd.DataFrame:
+    """
+    Search food trucks by business name.
+
+    Args:
+        data: DataFrame or DataSnapshot containing food truck data
+        applicant: Business name to search for
+        status: Optional status filter
+
+    Returns:
+        Filtered DataFrame
+    """
+    snapshot = as_snapshot(data)
+    return materialize(snapshot, find_by_name(snapshot, applicant, status))
+
+def search_by_street(data: Union[pd.DataFrame, DataSnapshot], street: str, status: StatusType = None) -> pd.DataFrame:
+    """
+    Search food trucks by street address.
+
+    Args:
+        data: DataFrame or DataSnapshot containing food truck data
+        street: Street name to search for
+        status: Optional status filter
+
+    Returns:
+        Filtered DataFrame
+    """
+    snapshot = as_snapshot(data)
+    return materialize(snapshot, find_by_street(snapshot, street, status))
 
+def search_by_food_items(data: Union[pd.DataFrame, DataSnapshot], food_items: str, match: TermMatch = TermMatch.ALL,
+                         status: StatusType = None) -> pd.DataFrame:
+    """
+    Search food trucks by the food items they sell.
+
+    Args:
+        data: DataFrame or DataSnapshot containing food truck data
+        food_items: Comma-separated items to search for, e.g. "tacos, hot dogs"
+        match: Whether every item must be sold or at least one
+        status: Optional status filter
+
+    Returns:
+        Filtered DataFrame
+    """
+    snapshot = as_snapshot(data)
+    return materialize(snapshot, find_by_food_items(snapshot, food_items, match, status))
+
+def search_by_proximity(data: Union[pd.DataFrame, DataSnapshot], latitude: float, longitude: float, status: StatusType = StatusType.APPROVED, limit: int = None, radius_km: float = None) -> pd.DataFrame:
+    """
+    Search food trucks by proximity to coordinates.
+
+    Args:
+        data: DataFrame or DataSnapshot containing food truck data
+        latitude: Search latitude
+        longitude: Search longitude
+        status: Optional status filter (defaults to APPROVED)
+        limit: Optional number of nearest results; only these are selected and sorted
+        radius_km: Optional search radius; only trucks within it are returned
+
+    Returns:
+        Filtered and sorted DataFrame by distance
+    """
+    snapshot = as_snapshot(data)
+    return materialize(snapshot, find_by_proximity(snapshot, latitude, longitude, status, limit, radius_km))
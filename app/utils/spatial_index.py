@@ -0,0 +1,293 @@
+import math
+import numpy as np
+from typing import List, Optional, Tuple
+from app.utils.geo import EARTH_RADIUS_KM, bounding_box, haversine_distances
+from app.utils.profiling import profile_stage
+
+BRUTE_FORCE_MAX_POINTS = 256  # Below this many points a full vectorized scan beats the grid
+MAX_RINGS = 16  # Rings to expand before falling back to a full scan
+MAX_BOX_ROWS = 512  # Grid rows a bounding box may span before a full bounding-box scan is cheaper
+POINTS_PER_CELL = 16  # Target average occupancy used to size grid cells
+
+
+class GridIndex:
+    """
+    Uniform latitude/longitude grid over point rows for k-nearest-neighbour queries.
+
+    Points are bucketed into square cells of ``cell_size`` degrees on a global grid and stored
+    sorted by cell key, so the rows of any run of adjacent cells form one contiguous slice.
+    Queries expand rings of cells around the query cell and stop as soon as the k-th best
+    distance is smaller than a lower bound on the distance to every cell not yet visited.
+    """
+
+    def __init__(self, lat_rad: np.ndarray, lon_rad: np.ndarray, rows: np.ndarray, cell_size: Optional[float] = None):
+        """
+        Build the grid.
+
+        Args:
+            lat_rad: Latitudes in radians for every row of the dataset
+            lon_rad: Longitudes in radians for every row of the dataset
+            rows: Row positions with valid coordinates to index
+            cell_size: Cell edge in degrees (chosen from the data when omitted)
+        """
+        self.lat_rad = lat_rad
+        self.lon_rad = lon_rad
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.indexed = np.zeros(len(lat_rad), dtype=bool)
+        self.indexed[self.rows] = True
+
+        lat_deg = np.degrees(lat_rad[self.rows])
+        lon_deg = np.degrees(lon_rad[self.rows])
+        # Round the cell size so a whole number of cells wraps around the globe exactly
+        self.lon_cells = int(math.ceil(360 / (cell_size or choose_cell_size(lat_deg, lon_deg))))
+        self.cell_size = 360 / self.lon_cells
+        self.lat_cells = int(math.ceil(180 / self.cell_size)) + 1
+
+        keys = self._cell_keys(lat_deg, lon_deg)
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.order = self.rows[order]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _cell_keys(self, lat_deg: np.ndarray, lon_deg: np.ndarray) -> np.ndarray:
+        lat_cell = np.floor((lat_deg + 90) / self.cell_size).astype(np.int64)
+        lon_cell = np.floor((lon_deg + 180) / self.cell_size).astype(np.int64) % self.lon_cells
+        return lat_cell * self.lon_cells + lon_cell
+
+    def _cell_of(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        lat_cell = int(math.floor((latitude + 90) / self.cell_size))
+        lon_cell = int(math.floor((longitude + 180) / self.cell_size)) % self.lon_cells
+        return lat_cell, lon_cell
+
+    def _key_ranges(self, lat_cell: int, lon_lo: int, lon_hi: int) -> List[Tuple[int, int]]:
+        """Inclusive key ranges for lon cells lon_lo..lon_hi of one lat row, split at the antimeridian"""
+        if lat_cell < 0 or lat_cell >= self.lat_cells:
+            return []
+        base = lat_cell * self.lon_cells
+        lon_lo %= self.lon_cells
+        lon_hi %= self.lon_cells
+        if lon_lo <= lon_hi:
+            return [(base + lon_lo, base + lon_hi)]
+        return [(base + lon_lo, base + self.lon_cells - 1), (base, base + lon_hi)]
+
+    def _ring_rows(self, lat_cell: int, lon_cell: int, ring: int) -> np.ndarray:
+        """Rows stored in the cells exactly ``ring`` steps away from the query cell"""
+        if ring == 0:
+            ranges = self._key_ranges(lat_cell, lon_cell, lon_cell)
+        else:
+            ranges = []
+            for edge in (lat_cell - ring, lat_cell + ring):
+                ranges += self._key_ranges(edge, lon_cell - ring, lon_cell + ring)
+            for row in range(lat_cell - ring + 1, lat_cell + ring):
+                ranges += self._key_ranges(row, lon_cell - ring, lon_cell - ring)
+                ranges += self._key_ranges(row, lon_cell + ring, lon_cell + ring)
+        return self._slices(ranges)
+
+    def _box_ranges(self, min_lat: float, max_lat: float, min_lon: float, max_lon: float) -> Optional[List[Tuple[int, int]]]:
+        """Inclusive cell key ranges overlapping a bounding box, or None when scanning every row is cheaper"""
+        lat_lo = int(math.floor((min_lat + 90) / self.cell_size))
+        lat_hi = int(math.floor((max_lat + 90) / self.cell_size))
+        if lat_hi - lat_lo + 1 > MAX_BOX_ROWS:
+            return None
+        if min_lon <= -180 and max_lon >= 180:
+            lon_lo, lon_hi = 0, self.lon_cells - 1
+        else:
+            lon_lo, lon_hi = self._cell_of(0.0, min_lon)[1], self._cell_of(0.0, max_lon)[1]
+        ranges = []
+        for row in range(lat_lo, lat_hi + 1):
+            ranges += self._key_ranges(row, lon_lo, lon_hi)
+        return ranges
+
+    def _range_bounds(self, ranges: List[Tuple[int, int]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Start and end positions in the sorted order of the given inclusive cell key ranges"""
+        bounds = np.array(ranges, dtype=np.int64)
+        return np.searchsorted(self.keys, bounds[:, 0], side='left'), np.searchsorted(self.keys, bounds[:, 1], side='right')
+
+    def _slices(self, ranges: List[Tuple[int, int]]) -> np.ndarray:
+        """Rows stored under the given inclusive cell key ranges"""
+        if not ranges:
+            return self.order[:0]
+        starts, ends = self._range_bounds(ranges)
+        return np.concatenate([self.order[start:end] for start, end in zip(starts, ends)])
+
+    def _unvisited_bound(self, latitude: float, longitude: float, lat_cell: int, lon_cell: int, ring: int) -> float:
+        """Lower bound in km on the distance from the query to any point outside the visited block"""
+        south = (lat_cell - ring) * self.cell_size - 90
+        north = (lat_cell + ring + 1) * self.cell_size - 90
+
+        bound = math.inf
+        if south > -90:
+            bound = min(bound, math.radians(latitude - south) * EARTH_RADIUS_KM)
+        if north < 90:
+            bound = min(bound, math.radians(north - latitude) * EARTH_RADIUS_KM)
+
+        if 2 * ring + 1 < self.lon_cells:
+            # Points beside the block lie within its latitude band but at least lon_gap away in longitude
+            west = (lon_cell - ring) * self.cell_size - 180
+            east = (lon_cell + ring + 1) * self.cell_size - 180
+            lon_offset = (longitude + 180) % 360 - 180
+            lon_gap = min(lon_offset - west, east - lon_offset, 180)
+            band_cos = max(0.0, min(math.cos(math.radians(max(south, -90))), math.cos(math.radians(min(north, 90)))))
+            a = math.cos(math.radians(latitude)) * band_cos * math.sin(math.radians(lon_gap) / 2) ** 2
+            bound = min(bound, 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0))))
+        return max(bound, 0.0)
+
+    def nearest(self, latitude: float, longitude: float, k: int, allowed: Optional[np.ndarray] = None, allowed_rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the k indexed rows nearest to a point.
+
+        Args:
+            latitude: Query latitude in degrees
+            longitude: Query longitude in degrees
+            k: Number of neighbours to return
+            allowed: Optional boolean mask over all dataset rows restricting the candidates
+            allowed_rows: Optional row positions set in allowed; small sets are scanned directly
+
+        Returns:
+            Tuple of (rows, distances in km), sorted by distance then row
+        """
+        if k <= 0 or len(self.rows) <= max(k, BRUTE_FORCE_MAX_POINTS):
+            return self._scan(latitude, longitude, k, self.rows, allowed)
+        if allowed_rows is not None and len(allowed_rows) <= BRUTE_FORCE_MAX_POINTS:
+            return self._scan(latitude, longitude, k, allowed_rows[self.indexed[allowed_rows]], None)
+
+        lat_cell, lon_cell = self._cell_of(latitude, longitude)
+        best_rows = self.order[:0]
+        best_distances = np.empty(0)
+        for ring in range(MAX_RINGS + 1):
+            candidates = self._ring_rows(lat_cell, lon_cell, ring)
+            if allowed is not None:
+                candidates = candidates[allowed[candidates]]
+            if len(candidates):
+                distances = haversine_distances(latitude, longitude, self.lat_rad[candidates], self.lon_rad[candidates])
+                best_rows, best_distances = top_k(
+                    np.concatenate([best_rows, candidates]),
+                    np.concatenate([best_distances, distances]),
+                    k
+                )
+            bound = self._unvisited_bound(latitude, longitude, lat_cell, lon_cell, ring)
+            if len(best_rows) >= k and best_distances[-1] < bound:
+                return best_rows, best_distances
+            if bound == math.inf:
+                return best_rows, best_distances
+
+        # The neighbourhood is too sparse for ring expansion to pay off
+        return self._scan(latitude, longitude, k, self.rows, allowed)
+
+    def within(self, latitude: float, longitude: float, radius_km: float, allowed: Optional[np.ndarray] = None, limit: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the indexed rows within a radius of a point.
+
+        Candidates come from the grid cells overlapping the circle's bounding box and are pruned
+        with a cheap latitude/longitude box test before exact distances are computed.
+
+        Args:
+            latitude: Query latitude in degrees
+            longitude: Query longitude in degrees
+            radius_km: Search radius in kilometers
+            allowed: Optional boolean mask over all dataset rows restricting the candidates
+            limit: Optional cap on the number of (nearest) rows returned
+
+        Returns:
+            Tuple of (rows, distances in km), sorted by distance then row
+        """
+        min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+        wraps = min_lon > max_lon
+        full_lon = min_lon <= -180 and max_lon >= 180
+
+        ranges = self._box_ranges(min_lat, max_lat, min_lon, max_lon)
+        candidates = self.rows if ranges is None else self._slices(ranges)
+
+        if allowed is not None:
+            candidates = candidates[allowed[candidates]]
+
+        # Bounding-box prefilter before any trigonometry
+        lat_c = self.lat_rad[candidates]
+        lon_c = self.lon_rad[candidates]
+        inside = (lat_c >= math.radians(min_lat)) & (lat_c <= math.radians(max_lat))
+        if not full_lon:
+            if wraps:
+                inside &= (lon_c >= math.radians(min_lon)) | (lon_c <= math.radians(max_lon))
+            else:
+                inside &= (lon_c >= math.radians(min_lon)) & (lon_c <= math.radians(max_lon))
+        candidates = candidates[inside]
+
+        distances = haversine_distances(latitude, longitude, lat_c[inside], lon_c[inside])
+        within_radius = distances <= radius_km
+        return top_k(candidates[within_radius], distances[within_radius], limit)
+
+    def count_within(self, latitude: float, longitude: float, radius_km: float) -> int:
+        """
+        Upper bound on the rows within a radius of a point: the points stored in the grid cells
+        overlapping the circle's bounding box, counted from the cell offsets without any distances.
+
+        Args:
+            latitude: Query latitude in degrees
+            longitude: Query longitude in degrees
+            radius_km: Search radius in kilometers
+
+        Returns:
+            Number of rows
+        """
+        ranges = self._box_ranges(*bounding_box(latitude, longitude, radius_km))
+        if ranges is None:
+            return len(self.rows)
+        if not ranges:
+            return 0
+        starts, ends = self._range_bounds(ranges)
+        return int((ends - starts).sum())
+
+    def _scan(self, latitude: float, longitude: float, k: int, rows: np.ndarray, allowed: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        if allowed is not None:
+            rows = rows[allowed[rows]]
+        distances = haversine_distances(latitude, longitude, self.lat_rad[rows], self.lon_rad[rows])
+        return top_k(rows, distances, k)
+
+
+def top_k(rows: np.ndarray, distances: np.ndarray, k: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Select and sort only the k smallest distances.
+
+    Args:
+        rows: Row positions
+        distances: Distances aligned with rows
+        k: Number of rows to keep (all rows when None)
+
+    Returns:
+        Tuple of (rows, distances) sorted by distance then row
+    """
+    if k is not None and k <= 0:
+        return rows[:0], distances[:0]
+    with profile_stage('top_k'):
+        if k is not None and len(rows) > k:
+            # Keep everything tied with the k-th distance so ties are broken by row, not partition order
+            kth = np.partition(distances, k - 1)[k - 1]
+            keep = np.flatnonzero(distances <= kth)
+            rows = rows[keep]
+            distances = distances[keep]
+        order = np.lexsort((rows, distances))[:k]
+        return rows[order], distances[order]
+
+
+def choose_cell_size(lat_deg: np.ndarray, lon_deg: np.ndarray, points_per_cell: int = POINTS_PER_CELL) -> float:
+    """
+    Pick a cell edge in degrees so that the dense part of the data averages points_per_cell per cell.
+
+    Args:
+        lat_deg: Latitudes in degrees
+        lon_deg: Longitudes in degrees
+        points_per_cell: Target average occupancy
+
+    Returns:
+        Cell edge in degrees
+    """
+    if len(lat_deg) == 0:
+        return 1.0
+    # Percentiles keep a few outliers (e.g. rows geocoded to 0, 0) from inflating the extent
+    lat_lo, lat_hi = np.percentile(lat_deg, [5, 95])
+    lon_lo, lon_hi = np.percentile(lon_deg, [5, 95])
+    area = max(lat_hi - lat_lo, 1e-4) * max(lon_hi - lon_lo, 1e-4)
+    cells = max(len(lat_deg) * 0.9 / points_per_cell, 1)
+    return float(min(max(math.sqrt(area / cells), 1e-3), 10.0))
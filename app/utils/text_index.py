@@ -0,0 +1,490 @@
+import re
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
+
+GRAM_SIZE = 3
+BUILD_CHUNK_SIZE = 65536  # Distinct values converted to code points per vectorized step
+REGEX_SPECIAL_CHARS = set('.^$*+?{}[]\\|()')
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')  # Words of item lists, after lower-casing
+TERM_SEPARATORS = re.compile(r'[,:;]')  # Separate the terms of a token query
+FUZZY_SHORTLIST = 64  # Distinct values sharing the most trigrams with a fuzzy term that are scored exactly
+FUZZY_MIN_SIMILARITY = 0.7  # Lowest similarity (1 - edits / term length) a fuzzy match may have
+
+
+def is_literal(term: str) -> bool:
+    """Check whether a search term has no regular expression meaning"""
+    return not (set(term) & REGEX_SPECIAL_CHARS)
+
+
+class TrigramIndex:
+    """
+    Inverted index from lower-cased character trigrams to the rows containing them.
+
+    Rows are grouped by distinct lower-cased value first, so repeated names and addresses are
+    indexed and verified once. A substring query intersects the posting lists of the term's
+    trigrams and only checks the surviving values exactly, so its cost follows the number of
+    matches rather than the number of rows.
+    """
+
+    def __init__(self, values: pd.Series, previous: Optional['TrigramIndex'] = None):
+        """
+        Build the index.
+
+        Args:
+            values: Column of strings to index; non-string entries are never matched
+            previous: Index over an earlier version of the column; the trigrams of the values it
+                already holds are taken from its postings instead of being extracted again
+        """
+        self.size = len(values)
+        self.values, self.value_rows, self.value_offsets, self.value_of_row = _group_rows(values)
+
+        # Distinct values grouped by trigram code (CSR layout)
+        if previous is None:
+            self.grams, self.gram_offsets, self.gram_values = _build_postings(self.values)
+        else:
+            self.grams, self.gram_offsets, self.gram_values = _update_postings(previous, self.values)
+        # Rows per trigram, for estimating how many rows a term matches without running it
+        self.gram_rows = np.bincount(
+            np.repeat(np.arange(len(self.grams)), np.diff(self.gram_offsets)),
+            weights=np.diff(self.value_offsets)[self.gram_values],
+            minlength=len(self.grams)
+        ).astype(np.int64)
+
+    def search(self, term: str) -> np.ndarray:
+        """
+        Find the rows whose value contains a literal term, ignoring case.
+
+        Args:
+            term: Literal substring to look for
+
+        Returns:
+            Sorted array of matching row positions
+        """
+        needle = term.lower()
+        candidates = self._candidate_values(needle)
+        matched = [value_id for value_id in candidates if needle in self.values[value_id]]
+        if not matched:
+            return self.value_rows[:0]
+        return _rows_of_values(self.value_rows, self.value_offsets, matched)
+
+    def estimate(self, term: str) -> int:
+        """
+        Upper bound on the rows search() returns: the rows holding the term's rarest trigram.
+
+        Args:
+            term: Literal substring to look for
+
+        Returns:
+            Number of rows
+        """
+        needle = term.lower()
+        if len(needle) < GRAM_SIZE:
+            return len(self.value_rows)
+        codes = np.unique(_gram_codes(np.array([needle]))[0])
+        positions = np.searchsorted(self.grams, codes)
+        if np.any(positions >= len(self.grams)) or np.any(self.grams[np.minimum(positions, len(self.grams) - 1)] != codes):
+            return 0
+        return int(self.gram_rows[positions].min())
+
+    def filter_rows(self, rows: np.ndarray, term: str) -> np.ndarray:
+        """
+        Keep only the rows whose value contains a literal term, ignoring case.
+
+        Only the distinct values of the given rows are checked, so the cost follows the number
+        of candidates rather than the size of the index.
+
+        Args:
+            rows: Candidate row positions
+            term: Literal substring to look for
+
+        Returns:
+            The matching rows, in their given order
+        """
+        needle = term.lower()
+        value_ids, inverse = np.unique(self.value_of_row[rows], return_inverse=True)
+        matched = np.fromiter(
+            (value_id >= 0 and needle in self.values[value_id] for value_id in value_ids), dtype=bool, count=len(value_ids)
+        )
+        return rows[matched[inverse]]
+
+    def similar(self, term: str, shortlist: int = FUZZY_SHORTLIST,
+                min_similarity: float = FUZZY_MIN_SIMILARITY) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the rows whose value contains a term with typos, ranked by similarity, ignoring case.
+
+        Values containing the term exactly are always returned, with similarity 1. Other
+        candidates are the distinct values sharing the most trigrams with the term, counted from
+        the posting lists of the term's trigrams only. Just the shortlist of them is scored, as
+        1 - (fewest edits turning the term into a substring of the value) / (term length).
+
+        Args:
+            term: Literal text to look for
+            shortlist: Distinct values without an exact match that are scored
+            min_similarity: Lowest similarity returned
+
+        Returns:
+            Tuple of (row positions, similarity per row), best match first and in row order
+            within equal similarity
+        """
+        needle = term.lower()
+        if len(needle) < GRAM_SIZE:
+            # Too short to have trigrams or tolerate a typo: exact substring matches only
+            rows = self.search(term)
+            return rows, np.ones(len(rows))
+
+        # Exact matches are never left to the shortlist, however many values share the term
+        exact = [value_id for value_id in self._candidate_values(needle) if needle in self.values[value_id]]
+
+        # Count the term's trigrams in every value that has at least one of them
+        codes = np.unique(_gram_codes(np.array([needle]))[0])
+        positions = np.searchsorted(self.grams, codes)
+        present = positions < len(self.grams)
+        present[present] = self.grams[positions[present]] == codes[present]
+        positions = positions[present]
+        if not len(positions):
+            return self.value_rows[:0], np.empty(0)
+        postings = np.concatenate([self.gram_values[self.gram_offsets[p]:self.gram_offsets[p + 1]] for p in positions])
+        value_ids, shared = np.unique(postings, return_counts=True)
+        inexact = ~np.isin(value_ids, exact)
+        value_ids, shared = value_ids[inexact], shared[inexact]
+        if len(value_ids) > shortlist:
+            best = np.lexsort((value_ids, -shared))[:shortlist]
+            value_ids = value_ids[best]
+
+        scored = [(value_id, 1.0) for value_id in exact]
+        for value_id in value_ids:
+            similarity = 1 - substring_edit_distance(needle, self.values[value_id]) / len(needle)
+            if similarity >= min_similarity:
+                scored.append((value_id, similarity))
+        if not scored:
+            return self.value_rows[:0], np.empty(0)
+        rows = np.concatenate([self.value_rows[self.value_offsets[v]:self.value_offsets[v + 1]] for v, _ in scored])
+        similarities = np.concatenate([
+            np.full(self.value_offsets[v + 1] - self.value_offsets[v], similarity) for v, similarity in scored
+        ])
+        order = np.lexsort((rows, -similarities))
+        return rows[order], similarities[order]
+
+    def _candidate_values(self, needle: str) -> np.ndarray:
+        """Distinct values containing every trigram of the needle"""
+        if len(needle) < GRAM_SIZE:
+            return np.arange(len(self.values))
+
+        codes = np.unique(_gram_codes(np.array([needle]))[0])
+        positions = np.searchsorted(self.grams, codes)
+        if np.any(positions >= len(self.grams)) or np.any(self.grams[np.minimum(positions, len(self.grams) - 1)] != codes):
+            return self.gram_values[:0]
+
+        # Intersect the shortest posting lists first
+        postings = sorted(
+            (self.gram_values[self.gram_offsets[p]:self.gram_offsets[p + 1]] for p in positions),
+            key=len
+        )
+        candidates = postings[0]
+        for posting in postings[1:]:
+            if not len(candidates):
+                break
+            candidates = np.intersect1d(candidates, posting, assume_unique=True)
+        return candidates
+
+
+class TokenIndex:
+    """
+    Inverted index from normalized word tokens to the rows containing them.
+
+    Built for item lists such as FoodItems ("Tacos: Burritos: Quesadillas"). Like TrigramIndex it
+    works on distinct lower-cased values: each token has a posting list of the distinct values
+    containing it, and only the values a query matches are expanded to rows, so the index stays
+    small however often a vendor's item list repeats.
+    """
+
+    def __init__(self, values: pd.Series):
+        """
+        Build the index.
+
+        Args:
+            values: Column of strings to index; non-string entries are never matched
+        """
+        self.size = len(values)
+        self.values, self.value_rows, self.value_offsets, self.value_of_row = _group_rows(values)
+
+        token_ids: Dict[str, int] = {}
+        pair_tokens = []
+        pair_values = []
+        for value_id, value in enumerate(self.values):
+            for token in tokenize(value):
+                pair_tokens.append(token_ids.setdefault(token, len(token_ids)))
+                pair_values.append(value_id)
+        pair_tokens = np.asarray(pair_tokens, dtype=np.int64)
+        pair_values = np.asarray(pair_values, dtype=np.int64)
+
+        # Distinct values grouped by token (CSR layout)
+        order = np.lexsort((pair_values, pair_tokens))
+        self.token_ids = token_ids
+        self.token_values = pair_values[order]
+        self.token_offsets = np.concatenate([[0], np.cumsum(np.bincount(pair_tokens, minlength=len(token_ids)))]).astype(np.int64)
+        # Rows per token, for estimating how many rows a query matches without running it
+        self.token_rows = np.bincount(pair_tokens, weights=np.diff(self.value_offsets)[pair_values], minlength=len(token_ids)).astype(np.int64)
+
+    def _postings(self, token: str) -> np.ndarray:
+        token_id = self.token_ids.get(token)
+        if token_id is None:
+            return self.token_values[:0]
+        return self.token_values[self.token_offsets[token_id]:self.token_offsets[token_id + 1]]
+
+    def _term_values(self, tokens: List[str]) -> np.ndarray:
+        """Distinct values containing every token of a term, intersecting the shortest postings first"""
+        postings = sorted((self._postings(token) for token in tokens), key=len)
+        values = postings[0]
+        for posting in postings[1:]:
+            if not len(values):
+                break
+            values = np.intersect1d(values, posting, assume_unique=True)
+        return values
+
+    def match(self, terms: List[List[str]], match_all: bool = True) -> np.ndarray:
+        """
+        Find the rows containing every (or any) of several terms.
+
+        Args:
+            terms: Terms as parsed by parse_terms; a term matches a row holding all of its tokens
+            match_all: Require every term (AND) rather than at least one (OR)
+
+        Returns:
+            Sorted array of matching row positions
+        """
+        return _rows_of_values(self.value_rows, self.value_offsets, self._match_values(terms, match_all))
+
+    def filter_rows(self, rows: np.ndarray, terms: List[List[str]], match_all: bool = True) -> np.ndarray:
+        """
+        Keep only the rows containing every (or any) of several terms.
+
+        Args:
+            rows: Candidate row positions
+            terms: Terms as parsed by parse_terms
+            match_all: Require every term (AND) rather than at least one (OR)
+
+        Returns:
+            The matching rows, in their given order
+        """
+        matched = np.zeros(len(self.values) + 1, dtype=bool)  # Last entry for rows without a value
+        matched[self._match_values(terms, match_all)] = True
+        return rows[matched[self.value_of_row[rows]]]
+
+    def _match_values(self, terms: List[List[str]], match_all: bool) -> np.ndarray:
+        """Distinct values containing every (or any) term, combining the shortest postings first"""
+        terms = [tokens for tokens in terms if tokens]
+        if not terms:
+            return self.token_values[:0]
+        term_values = sorted((self._term_values(tokens) for tokens in terms), key=len)
+        values = term_values[0]
+        for other in term_values[1:]:
+            values = np.intersect1d(values, other, assume_unique=True) if match_all else np.union1d(values, other)
+        return values
+
+    def estimate(self, terms: List[List[str]], match_all: bool = True) -> int:
+        """
+        Upper bound on the rows match() returns, from posting list sizes alone.
+
+        Args:
+            terms: Terms as parsed by parse_terms
+            match_all: Require every term (AND) rather than at least one (OR)
+
+        Returns:
+            Number of rows
+        """
+        term_counts = [
+            min(int(self.token_rows[self.token_ids[token]]) if token in self.token_ids else 0 for token in tokens)
+            for tokens in terms if tokens
+        ]
+        if not term_counts:
+            return 0
+        return min(term_counts) if match_all else min(sum(term_counts), self.size)
+
+
+def normalize_token(word: str) -> str:
+    """
+    Reduce a lower-cased word to a singular stem, so "tacos" and "taco" are the same token.
+
+    Singulars ending in "ie" share the "y" stem of "-ies" plurals, since "-ies" is the plural of
+    both "candy" and "cookie": "cookies" and "cookie" both become "cooky".
+    """
+    if len(word) > 4 and word.endswith('ies'):
+        word = word[:-3] + 'y'
+    elif len(word) > 4 and word.endswith(('ches', 'shes', 'sses', 'xes', 'zes')):
+        word = word[:-2]
+    elif len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        word = word[:-1]
+    if len(word) > 3 and word.endswith('ie'):
+        word = word[:-2] + 'y'
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Distinct normalized word tokens of a text, in order of first appearance"""
+    return list(dict.fromkeys(normalize_token(word) for word in TOKEN_PATTERN.findall(text.lower())))
+
+
+def parse_terms(query: str) -> List[List[str]]:
+    """
+    Split a query into terms at commas, colons and semicolons, each as its normalized tokens.
+
+    Args:
+        query: e.g. "tacos, hot dogs"
+
+    Returns:
+        Tokens per non-empty term, e.g. [['taco'], ['hot', 'dog']]
+    """
+    terms = [tokenize(term) for term in TERM_SEPARATORS.split(query)]
+    return [tokens for tokens in terms if tokens]
+
+
+def _group_rows(values: pd.Series) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Group the rows of a text column by distinct lower-cased value.
+
+    A categorical column already holds its distinct values and factorizing any other column
+    finds them, so no per-row strings are lower-cased.
+
+    Args:
+        values: Column of strings; non-string entries belong to no group
+
+    Returns:
+        Tuple of four arrays: distinct lower-cased values, row positions grouped by value, CSR
+        offsets of each value's rows, and the value id of every row (-1 for rows without text)
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, categories = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, categories = pd.factorize(values)
+    categories = pd.Index(categories, dtype=object)
+    is_text = np.fromiter((isinstance(value, str) for value in categories), dtype=bool, count=len(categories))
+    lowered_of_category, distinct = pd.factorize(categories[is_text].str.lower())
+    value_of_category = np.full(len(categories) + 1, -1, dtype=np.int64)  # Last entry for code -1
+    value_of_category[np.flatnonzero(is_text)] = lowered_of_category
+
+    value_of_row = value_of_category[codes]
+    text_rows = np.flatnonzero(value_of_row >= 0)
+    value_of_row = value_of_row[text_rows]
+    distinct = np.asarray(distinct, dtype=object)
+
+    # Rows grouped by distinct value (CSR layout)
+    order = np.argsort(value_of_row, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(value_of_row, minlength=len(distinct)))]).astype(np.int64)
+    row_values = np.full(len(codes), -1, dtype=np.int32)
+    row_values[text_rows] = value_of_row
+    return distinct, text_rows[order], offsets, row_values
+
+
+def _rows_of_values(value_rows: np.ndarray, value_offsets: np.ndarray, value_ids) -> np.ndarray:
+    """Sorted row positions of a set of distinct values"""
+    if not len(value_ids):
+        return value_rows[:0]
+    return np.sort(np.concatenate([value_rows[value_offsets[v]:value_offsets[v + 1]] for v in value_ids]))
+
+
+def substring_edit_distance(needle: str, haystack: str) -> int:
+    """Fewest insertions, deletions and substitutions turning needle into some substring of haystack"""
+    # Sellers' algorithm: edit distance where the match may start and end anywhere in haystack
+    previous = list(range(len(needle) + 1))
+    best = previous[-1]
+    for char in haystack:
+        current = [0]
+        for position, needle_char in enumerate(needle, 1):
+            current.append(min(previous[position] + 1, current[position - 1] + 1, previous[position - 1] + (needle_char != char)))
+        best = min(best, current[-1])
+        previous = current
+    return best
+
+
+def _gram_codes(strings: np.ndarray) -> np.ndarray:
+    """Trigram codes per string (one row per string) packed as 21 bits per code point"""
+    width = max(int(np.char.str_len(strings).max()) if len(strings) else 0, GRAM_SIZE)
+    points = strings.astype(f'U{width}').view(np.uint32).reshape(len(strings), width).astype(np.int64)
+    return (points[:, :-2] << 42) | (points[:, 1:-1] << 21) | points[:, 2:]
+
+
+def _build_postings(values: np.ndarray):
+    """Sorted unique trigram codes with CSR offsets into the distinct value ids containing them"""
+    code_parts = []
+    value_parts = []
+    for start in range(0, len(values), BUILD_CHUNK_SIZE):
+        chunk = values[start:start + BUILD_CHUNK_SIZE].astype(str)
+        lengths = np.char.str_len(chunk)
+        codes = _gram_codes(chunk)
+        valid = np.arange(codes.shape[1])[None, :] < (lengths - (GRAM_SIZE - 1))[:, None]
+        code_parts.append(codes[valid])
+        value_parts.append(np.broadcast_to(np.arange(start, start + len(chunk))[:, None], codes.shape)[valid])
+
+    if not code_parts:
+        return np.empty(0, dtype=np.int64), np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    codes = np.concatenate(code_parts)
+    value_ids = np.concatenate(value_parts)
+    order = np.lexsort((value_ids, codes))
+    codes = codes[order]
+    value_ids = value_ids[order]
+
+    # A value can repeat a trigram; keep one posting per (trigram, value)
+    keep = np.ones(len(codes), dtype=bool)
+    keep[1:] = (codes[1:] != codes[:-1]) | (value_ids[1:] != value_ids[:-1])
+    codes = codes[keep]
+    value_ids = value_ids[keep]
+
+    grams, starts = np.unique(codes, return_index=True)
+    offsets = np.append(starts, len(codes)).astype(np.int64)
+    return grams, offsets, value_ids.astype(np.int64)
+
+
+def _update_postings(previous: TrigramIndex, values: np.ndarray):
+    """
+    Postings of distinct values as _build_postings returns them, reusing an earlier index's.
+
+    Only values the earlier index does not hold have their trigrams extracted. Postings of the
+    values it holds are renumbered to their new value ids, and those of values no longer present
+    are dropped, so the string work follows the number of new values.
+    """
+    old_ids = pd.Index(previous.values).get_indexer(values)
+    reused = old_ids >= 0
+    new_of_old = np.full(len(previous.values), -1, dtype=np.int64)
+    new_of_old[old_ids[reused]] = np.flatnonzero(reused)
+    old_values = new_of_old[previous.gram_values]
+    kept = old_values >= 0
+    old_grams = np.repeat(np.arange(len(previous.grams)), np.diff(previous.gram_offsets))[kept]
+
+    added = np.flatnonzero(~reused)
+    added_grams, added_offsets, added_values = _build_postings(values[added])
+    grams = np.union1d(previous.grams, added_grams)
+    gram_ids = np.concatenate([
+        np.searchsorted(grams, previous.grams)[old_grams],
+        np.searchsorted(grams, added_grams)[np.repeat(np.arange(len(added_grams)), np.diff(added_offsets))]
+    ]).astype(np.int64)
+    value_ids = np.concatenate([old_values[kept], added[added_values]]).astype(np.int64)
+
+    # One sort of (trigram, value) pairs packed into int64s; nearly sorted already when few values changed
+    pairs = np.sort((gram_ids << 32) | value_ids, kind='stable')
+    counts = np.bincount(pairs >> 32, minlength=len(grams))
+    present = counts > 0
+    offsets = np.concatenate([[0], np.cumsum(counts[present])]).astype(np.int64)
+    return grams[present], offsets, pairs & 0xFFFFFFFF
+
+
+def contains_rows(values: pd.Series, term: str, index: Optional[TrigramIndex] = None) -> np.ndarray:
+    """
+    Find the rows whose value contains a term, ignoring case.
+
+    Literal terms are answered from the trigram index; terms with regular expression syntax keep
+    the pandas ``str.contains`` semantics and scan the column.
+
+    Args:
+        values: Column being searched
+        term: Search term
+        index: Trigram index over the column, if one was built
+
+    Returns:
+        Sorted array of matching row positions
+    """
+    if index is not None and is_literal(term):
+        return index.search(term)
+    return np.flatnonzero(values.str.contains(term, case=False, na=False).to_numpy(dtype=bool))
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+
+class PoolSaturatedError(Exception):
+    """Raised when a job is submitted while every worker is busy and the queue is full"""
+
+
+class WorkerPool:
+    """
+    Bounded thread pool for running CPU-bound work off the event loop.
+
+    At most max_workers jobs run at once and at most max_queue more wait for a worker. A job
+    submitted beyond that is rejected immediately instead of queueing, so a burst of searches
+    cannot delay other requests served by the event loop. Threads are used rather than processes
+    because jobs share the in-memory snapshot, and numpy releases the GIL for the heavy work.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, name: str = "worker"):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._pending = 0  # Jobs running or waiting for a worker
+        self.completed = 0
+        self.rejected = 0
+
+    def _reserve(self):
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise PoolSaturatedError("Server is busy, try again shortly")
+            self._pending += 1
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+            self.completed += 1
+
+    async def run(self, function: Callable, *args):
+        """
+        Run a function on the pool and wait for its result without blocking the event loop.
+
+        Args:
+            function: Function to run
+            *args: Arguments passed to the function
+
+        Returns:
+            The function's return value (its exception is re-raised)
+
+        Raises:
+            PoolSaturatedError: If every worker is busy and the queue is full
+        """
+        self._reserve()
+        try:
+            future = self._executor.submit(function, *args)
+        except Exception:
+            self._release(None)
+            raise
+        # The slot is freed when the job finishes, even if the waiting request is cancelled
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        """Current load and job counters"""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "pending": self._pending,
+                "completed": self.completed,
+                "rejected": self.rejected
+            }
@@ -0,0 +1,64 @@
+import os
+import numpy as np
+import pandas as pd
+from app.dataloader.food_truck_loader import DEFAULT_CSV_PATH
+
+JITTER_DEGREES = 0.01  # Coordinates are moved by up to about 1 km so resampled trucks do not stack
+ROWS_PER_VENDOR = 20  # Distinct business names grow with the dataset, one per this many rows
+
+
+def synthetic_permits(rows: int, seed: int = 0, source_path: str = DEFAULT_CSV_PATH) -> pd.DataFrame:
+    """
+    Build a permit dataset of any size by resampling the bundled CSV.
+
+    Rows keep the bundled data's columns, value formats and status / food item mix. Location ids
+    are unique, coordinates are jittered, and business names and street numbers are varied so
+    the number of distinct names and addresses grows with the dataset like a larger city's
+    would, instead of every index seeing the same few hundred values.
+
+    Args:
+        rows: Number of rows to generate
+        seed: Random seed; the same seed gives the same dataset
+        source_path: CSV to resample
+
+    Returns:
+        DataFrame in the CSV's raw (unparsed) column layout
+    """
+    source = pd.read_csv(source_path, dtype=str, keep_default_na=False)
+    rng = np.random.default_rng(seed)
+    data = source.iloc[rng.integers(0, len(source), rows)].reset_index(drop=True)
+    data['locationid'] = np.arange(1, rows + 1).astype(str)
+
+    latitude = pd.to_numeric(data['Latitude'], errors='coerce').to_numpy()
+    longitude = pd.to_numeric(data['Longitude'], errors='coerce').to_numpy()
+    located = (latitude != 0) & (longitude != 0) & ~np.isnan(latitude) & ~np.isnan(longitude)
+    latitude[located] += rng.uniform(-JITTER_DEGREES, JITTER_DEGREES, located.sum())
+    longitude[located] += rng.uniform(-JITTER_DEGREES, JITTER_DEGREES, located.sum())
+    data['Latitude'] = np.where(located, np.round(latitude, 11).astype(str), data['Latitude'])
+    data['Longitude'] = np.where(located, np.round(longitude, 11).astype(str), data['Longitude'])
+
+    vendors = pd.Series(rng.integers(0, max(1, rows // ROWS_PER_VENDOR), rows)).astype(str)
+    named = data['Applicant'] != ''
+    data.loc[named, 'Applicant'] = data['Applicant'][named] + ' #' + vendors[named]
+    street = data['Address'].str.replace(r'^\d+ ', '', regex=True)
+    numbers = pd.Series(rng.integers(1, 4000, rows)).astype(str)
+    addressed = data['Address'] != ''
+    data.loc[addressed, 'Address'] = numbers[addressed] + ' ' + street[addressed]
+    return data
+
+
+def write_permits_csv(rows: int, directory: str, seed: int = 0) -> str:
+    """
+    Write a synthetic permit CSV.
+
+    Args:
+        rows: Number of rows to generate
+        directory: Directory to write the file to
+        seed: Random seed
+
+    Returns:
+        Path of the written CSV
+    """
+    path = os.path.join(directory, f'permits_{rows}.csv')
+    synthetic_permits(rows, seed).to_csv(path, index=False)
+    return path
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the search functions, the data loader and the /api/search endpoint.
+
+Run from the project root:
+
+    python -m benchmarks.run                                        # 1k to 1M rows, printed
+    python -m benchmarks.run --sizes 1000,10000 --output base.json  # Save a baseline
+    python -m benchmarks.run --sizes 1000,10000 --compare base.json # Flag regressions against it
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import httpx
+import numpy as np
+from app import config
+from app.api import search
+from app.main import app
+from app.dataloader.food_truck_loader import FoodTruckDataLoader
+from app.models.food_truck import StatusType
+from app.utils.mappers import convert_to_food_trucks
+from app.utils.result_cache import ResultCache
+from app.utils.search_utils import SearchHits, materialize, search_by_name, search_by_proximity, search_by_street
+from benchmarks.datasets import write_permits_csv
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+LOADS_PER_REPEAT = 50  # One timed load per this many --repeat calls, at least MIN_LOADS
+MIN_LOADS = 3
+CONVERT_MAX_ROWS = 10000  # Rows converted per convert_to_food_trucks call, whatever the dataset size
+MIN_COMPARABLE_MS = 0.05  # Changes smaller than this are timer noise, never regressions
+SF_BOUNDS = (37.70, 37.81, -122.51, -122.37)  # Latitude / longitude range search points are drawn from
+NAME_TERMS = ['Taco', 'Coffee', 'Kitchen', 'Halal', 'Philz', 'Truck #1']
+STREET_TERMS = ['MISSION', 'MARKET', 'HOWARD', 'SANSOME', '03RD', 'ST']
+
+
+def summarize(latencies_ms: Sequence[float]) -> dict:
+    """Percentiles of a list of latencies in milliseconds"""
+    latencies = np.asarray(latencies_ms, dtype=float)
+    return {
+        "calls": len(latencies),
+        "min_ms": round(float(latencies.min()), 4),
+        "median_ms": round(float(np.percentile(latencies, 50)), 4),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 4),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 4)
+    }
+
+
+def time_calls(function: Callable, arguments: Sequence[tuple]) -> dict:
+    """Call a function once per argument tuple and summarize the latencies"""
+    latencies = []
+    for args in arguments:
+        started = time.perf_counter()
+        function(*args)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return summarize(latencies)
+
+
+def random_points(rng: np.random.Generator, count: int) -> List[tuple]:
+    """Random (latitude, longitude) pairs within San Francisco"""
+    min_lat, max_lat, min_lon, max_lon = SF_BOUNDS
+    return list(zip(rng.uniform(min_lat, max_lat, count).tolist(), rng.uniform(min_lon, max_lon, count).tolist()))
+
+
+def load(csv_path: str, store_dir: str) -> FoodTruckDataLoader:
+    """Load the CSV through a new loader using the given store"""
+    loader = FoodTruckDataLoader(csv_path, store_dir=store_dir, chunk_rows=config.INGEST_CHUNK_ROWS or None)
+    loader.load_data()
+    return loader
+
+
+def bench_load(csv_path: str, store_dir: str, repeat: int) -> Tuple[Dict[str, dict], FoodTruckDataLoader]:
+    """
+    Time FoodTruckDataLoader.load_data parsing the CSV into a new store, then mapping that store.
+
+    Loads are far slower than searches, so each is repeated repeat / LOADS_PER_REPEAT times (at
+    least MIN_LOADS). Every timed parse writes to its own empty store so it never finds a version.
+    """
+    loads = max(MIN_LOADS, repeat // LOADS_PER_REPEAT)
+    stores = [os.path.join(store_dir, f'parse{attempt}') for attempt in range(loads)]
+    results = {
+        "load_data": time_calls(load, [(csv_path, store) for store in stores]),
+        "load_data_from_store": time_calls(load, [(csv_path, stores[-1])] * loads)
+    }
+    return results, load(csv_path, stores[-1])
+
+
+def bench_functions(snapshot, repeat: int, rng: np.random.Generator) -> Dict[str, dict]:
+    """Time the search functions and convert_to_food_trucks on a loaded snapshot"""
+    points = random_points(rng, repeat)
+    results = {
+        "search_by_name": time_calls(search_by_name, [(snapshot, NAME_TERMS[i % len(NAME_TERMS)]) for i in range(repeat)]),
+        "search_by_street": time_calls(search_by_street, [(snapshot, STREET_TERMS[i % len(STREET_TERMS)]) for i in range(repeat)]),
+        "search_by_proximity": time_calls(
+            search_by_proximity, [(snapshot, latitude, longitude, StatusType.APPROVED, 5) for latitude, longitude in points]
+        ),
+        "search_by_proximity_radius": time_calls(
+            search_by_proximity, [(snapshot, latitude, longitude, None, None, 0.5) for latitude, longitude in points]
+        )
+    }
+    rows = min(len(snapshot), CONVERT_MAX_ROWS)
+    frame = materialize(snapshot, SearchHits(np.arange(rows)))
+    results["convert_to_food_trucks"] = time_calls(convert_to_food_trucks, [(frame,)] * max(1, repeat // 10))
+    results["convert_to_food_trucks"]["rows"] = rows
+    return results
+
+
+def search_requests(rng: np.random.Generator, count: int) -> List[dict]:
+    """A mix of name, street, proximity, radius and compound search bodies"""
+    bodies = []
+    for position, (latitude, longitude) in enumerate(random_points(rng, count)):
+        kind = position % 5
+        if kind == 0:
+            bodies.append({"query_type": "name", "applicant": NAME_TERMS[position % len(NAME_TERMS)]})
+        elif kind == 1:
+            bodies.append({"query_type": "street", "street": STREET_TERMS[position % len(STREET_TERMS)]})
+        elif kind == 2:
+            bodies.append({"query_type": "proximity", "latitude": latitude, "longitude": longitude, "limit": 5})
+        elif kind == 3:
+            bodies.append({"query_type": "proximity", "latitude": latitude, "longitude": longitude, "radius_km": 0.5, "max_results": 100})
+        else:
+            bodies.append({"query_type": "compound", "food_items": "tacos", "status": "APPROVED",
+                           "latitude": latitude, "longitude": longitude, "radius_km": 2, "limit": 10})
+    return bodies
+
+
+async def _drive(bodies: List[dict], concurrency: int) -> tuple:
+    """Send every body to /api/search through the ASGI app with at most concurrency in flight"""
+    latencies = {}
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark") as client:
+        async def send(body):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post("/api/search", json=body)
+                elapsed = (time.perf_counter() - started) * 1000
+            if response.status_code != 200:
+                raise RuntimeError(f"/api/search returned {response.status_code} for {body}: {response.text}")
+            latencies.setdefault(body["query_type"], []).append(elapsed)
+            latencies.setdefault("all", []).append(elapsed)
+
+        await asyncio.gather(*(send(body) for body in bodies[:concurrency]))  # Warm up
+        latencies.clear()
+        started = time.perf_counter()
+        await asyncio.gather(*(send(body) for body in bodies))
+        return latencies, time.perf_counter() - started
+
+
+def bench_http(loader, requests: int, concurrency: int, rng: np.random.Generator, cache: bool = True) -> Dict[str, dict]:
+    """Drive /api/search end to end through the ASGI app and report latency percentiles and throughput"""
+    saved = search.data_loader, search.result_cache
+    search.data_loader = loader
+    if not cache:
+        search.result_cache = ResultCache(0, config.SEARCH_CACHE_TTL_SECONDS)
+    try:
+        latencies, elapsed = asyncio.run(_drive(search_requests(rng, requests), concurrency))
+    finally:
+        search.data_loader, search.result_cache = saved
+
+    results = {f"http_{kind}": summarize(values) for kind, values in latencies.items()}
+    results["http_all"]["throughput_rps"] = round(len(latencies["all"]) / elapsed, 1)
+    return results
+
+
+def run_suite(sizes: Sequence[int], repeat: int, requests: int, concurrency: int, http: bool, cache: bool, seed: int) -> dict:
+    """Run every benchmark at every dataset size"""
+    report = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "repeat": repeat,
+            "requests": requests,
+            "concurrency": concurrency,
+            "result_cache": cache
+        },
+        "results": {}
+    }
+    rng = np.random.default_rng(seed)
+    for size in sizes:
+        print(f"Benchmarking {size} rows...")
+        with tempfile.TemporaryDirectory(prefix="foodtruck-bench-") as directory:
+            csv_path = write_permits_csv(size, directory, seed)
+            results, loader = bench_load(csv_path, os.path.join(directory, 'store'), repeat)
+            results.update(bench_functions(loader.get_snapshot(), repeat, rng))
+            if http:
+                results.update(bench_http(loader, requests, concurrency, rng, cache))
+        report["results"][str(size)] = results
+        print_results(size, results)
+    return report
+
+
+def print_results(size: int, results: Dict[str, dict]):
+    """Print one dataset size's results as a table"""
+    print(f"\n{size} rows")
+    print(f"  {'benchmark':<28}{'median ms':>12}{'p95 ms':>12}{'p99 ms':>12}{'req/s':>10}")
+    for name, stats in results.items():
+        throughput = stats.get("throughput_rps", "")
+        print(f"  {name:<28}{stats['median_ms']:>12.3f}{stats['p95_ms']:>12.3f}{stats['p99_ms']:>12.3f}{throughput:>10}")
+    print()
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> List[str]:
+    """
+    Compare a run against a baseline and print every benchmark both contain.
+
+    A benchmark regresses when its median latency (p95 for HTTP) grows by more than threshold,
+    or its throughput drops by more than threshold, and the change is not timer noise.
+
+    Args:
+        baseline: Report of the baseline run
+        current: Report of this run
+        threshold: Allowed relative slowdown, e.g. 0.2 for 20%
+
+    Returns:
+        Descriptions of the regressions found
+    """
+    regressions = []
+    print(f"Comparison against baseline from {baseline['meta'].get('created')} (threshold {threshold:.0%})")
+    print(f"  {'size':>8}  {'benchmark':<28}{'metric':>16}{'baseline':>12}{'current':>12}{'change':>10}")
+    for size, results in current["results"].items():
+        for name, stats in results.items():
+            base = baseline["results"].get(size, {}).get(name)
+            if base is None:
+                continue
+            metrics = [("p95_ms" if name.startswith("http_") else "median_ms", False)]
+            if "throughput_rps" in stats and "throughput_rps" in base:
+                metrics.append(("throughput_rps", True))
+            for metric, higher_is_better in metrics:
+                before, after = base[metric], stats[metric]
+                change = (after - before) / before if before else 0.0
+                if higher_is_better:
+                    regressed = after < before / (1 + threshold)
+                else:
+                    regressed = after > before * (1 + threshold) and after - before > MIN_COMPARABLE_MS
+                flag = "  REGRESSION" if regressed else ""
+                print(f"  {size:>8}  {name:<28}{metric:>16}{before:>12.3f}{after:>12.3f}{change:>+10.1%}{flag}")
+                if regressed:
+                    regressions.append(f"{name} at {size} rows: {metric} {before} -> {after} ({change:+.1%})")
+    return regressions
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the search functions, data loader and /api/search")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="Comma-separated dataset sizes in rows")
+    parser.add_argument("--repeat", type=int, default=200, help="Calls per search function benchmark (loads are repeated a 50th as often, at least 3 times)")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests sent to /api/search per dataset size")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight at once")
+    parser.add_argument("--no-http", action="store_true", help="Skip the /api/search benchmark")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the result cache for the /api/search benchmark")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic data and query points")
+    parser.add_argument("--output", help="Write the results as a JSON baseline to this path")
+    parser.add_argument("--compare", help="Baseline JSON to compare the results against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown flagged as a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    report = run_suite(sizes, args.repeat, args.requests, args.concurrency, not args.no_http, not args.no_cache, args.seed)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            return 1
+        print("\nNo regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
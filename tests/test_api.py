@@ -1,9 +1,12 @@
 import pytest
+import json
 from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock
 import pandas as pd
 from app.main import app
 from app.models.food_truck import SearchType, StatusType
+from app.dataloader.snapshot import DataSnapshot, ShardedSnapshot
+from app.utils.worker_pool import WorkerPool
 
 client = TestClient(app)
 
@@ -35,15 +38,21 @@ class TestSearchAPI:
             'permit': ['24MFF-00001', '24MFF-00002', '24MFF-00003']
         })
 
-    def test_search_by_name_success(self, monkeypatch):
-        """Test successful name search"""
+    def _patch_data_loader(self, monkeypatch):
+        """Replace the search module's data loader with a mock serving the sample data"""
         # Create a mock data loader
         mock_data_loader = MagicMock()
         mock_data_loader.get_data.return_value = self.sample_data
+        mock_data_loader.get_snapshot.return_value = DataSnapshot.build(self.sample_data)
         mock_data_loader.is_data_available.return_value = True
         
         # Monkeypatch the data_loader import in the search module
         monkeypatch.setattr('app.api.search.data_loader', mock_data_loader)
+        return mock_data_loader
+
+    def test_search_by_name_success(self, monkeypatch):
+        """Test successful name search"""
+        self._patch_data_loader(monkeypatch)
         
         response = client.post(
             "/api/search",
@@ -61,11 +70,7 @@ class TestSearchAPI:
 
     def test_search_by_name_with_status_filter(self, monkeypatch):
         """Test name search with status filter"""
-        mock_data_loader = MagicMock()
-        mock_data_loader.get_data.return_value = self.sample_data
-        mock_data_loader.is_data_available.return_value = True
-        
-        monkeypatch.setattr('app.api.search.data_loader', mock_data_loader)
+        self._patch_data_loader(monkeypatch)
         
         response = client.post(
             "/api/search",
@@ -81,13 +86,87 @@ class TestSearchAPI:
         assert data["success"] is True
         assert data["metadata"]["status_filter"] == "APPROVED"
 
+    def test_search_by_name_fuzzy(self, monkeypatch):
+        """Test that fuzzy name search finds names with typos and is only allowed for names"""
+        self._patch_data_loader(monkeypatch)
+        request = {"query_type": "name", "applicant": "Burgr Joint"}
+        
+        exact = client.post("/api/search", json=request)
+        fuzzy = client.post("/api/search", json={**request, "fuzzy": True})
+        street = client.post("/api/search", json={"query_type": "street", "street": "Misson", "fuzzy": True})
+        
+        assert exact.json()["data"] == []
+        assert [truck["locationid"] for truck in fuzzy.json()["data"]] == [3]
+        assert fuzzy.json()["metadata"]["fuzzy"] is True
+        assert street.status_code == 400
+
+    def test_search_fuzzy_rejected_after_cached_search(self, monkeypatch):
+        """Test that fuzzy matching is rejected for non-name searches even once the plain search is cached"""
+        self._patch_data_loader(monkeypatch)
+        requests = [
+            {"query_type": "food_items", "food_items": "tacos"},
+            {"query_type": "proximity", "latitude": 37.7749, "longitude": -122.4194},
+            {"query_type": "compound", "food_items": "tacos", "status": "APPROVED"}
+        ]
+        
+        for request in requests:
+            assert client.post("/api/search", json=request).status_code == 200
+            assert client.post("/api/search", json={**request, "fuzzy": True}).status_code == 400
+        batch = client.post("/api/search/batch", json={"searches": [{**request, "fuzzy": True} for request in requests]})
+        
+        assert batch.status_code == 200
+        assert [result["success"] for result in batch.json()["results"]] == [False, False, False]
+
+    def test_search_by_food_items(self, monkeypatch):
+        """Test food item search with all and any items"""
+        self._patch_data_loader(monkeypatch)
+        
+        both = client.post("/api/search", json={"query_type": "food_items", "food_items": "tacos, burritos"})
+        either = client.post("/api/search", json={"query_type": "food_items", "food_items": "burrito, fries", "match": "any"})
+        missing = client.post("/api/search", json={"query_type": "food_items"})
+        
+        assert [truck["locationid"] for truck in both.json()["data"]] == [1]
+        assert both.json()["metadata"]["match"] == "all"
+        assert [truck["locationid"] for truck in either.json()["data"]] == [1, 3]
+        assert missing.status_code == 400
+
+    def test_compound_search(self, monkeypatch):
+        """Test a compound search intersects its predicates and orders by distance"""
+        self._patch_data_loader(monkeypatch)
+        
+        response = client.post("/api/search", json={
+            "query_type": "compound",
+            "food_items": "tacos",
+            "status": "APPROVED",
+            "latitude": 37.7849,
+            "longitude": -122.4094,
+            "radius_km": 3
+        })
+        empty = client.post("/api/search", json={"query_type": "compound"})
+        
+        assert response.status_code == 200
+        assert [truck["locationid"] for truck in response.json()["data"]] == [1]
+        assert response.json()["metadata"]["radius_km"] == 3
+        assert empty.status_code == 400
+
+    def test_search_explain(self, monkeypatch):
+        """Test explained searches return their plan and timings, even when the result is cached"""
+        self._patch_data_loader(monkeypatch)
+        request = {"query_type": "compound", "food_items": "tacos", "status": "APPROVED"}
+        
+        plain = client.post("/api/search", json=request)
+        explained = client.post("/api/search", json={**request, "explain": True})
+        
+        assert "explain" not in plain.json()["metadata"]
+        explain = explained.json()["metadata"]["explain"]
+        assert [(step["predicate"], step["candidates"]) for step in explain["plan"]] == [("food_items", 2), ("status", 1)]
+        assert explain["indexes"] == ["food_item_index", "status_partitions"]
+        assert set(explain["timings_ms"]) == {"filter", "distance", "top_k", "materialize", "serialize"}
+        assert explained.json()["data"] == plain.json()["data"]
+
     def test_search_by_street_success(self, monkeypatch):
         """Test successful street search"""
-        mock_data_loader = MagicMock()
-        mock_data_loader.get_data.return_value = self.sample_data
-        mock_data_loader.is_data_available.return_value = True
-        
-        monkeypatch.setattr('app.api.search.data_loader', mock_data_loader)
+        self._patch_data_loader(monkeypatch)
         
         response = client.post(
             "/api/search",
@@ -104,11 +183,7 @@ class TestSearchAPI:
 
     def test_search_by_proximity_success(self, monkeypatch):
         """Test successful proximity search"""
-        mock_data_loader = MagicMock()
-        mock_data_loader.get_data.return_value = self.sample_data
-        mock_data_loader.is_data_available.return_value = True
-        
-        monkeypatch.setattr('app.api.search.data_loader', mock_data_loader)
+        self._patch_data_loader(monkeypatch)
         
         response = client.post(
             "/api/search",
@@ -127,11 +202,7 @@ class TestSearchAPI:
 
     def test_search_by_proximity_with_status_filter(self, monkeypatch):
         """Test proximity search with status filter"""
-        mock_data_loader = MagicMock()
-        mock_data_loader.get_data.return_value = self.sample_data
-        mock_data_loader.is_data_available.return_value = True
-        
-        monkeypatch.setattr('app.api.search.data_loader', mock_data_loader)
+        self._patch_data_loader(monkeypatch)
         
         response = client.post(
             "/api/search",
@@ -148,13 +219,203 @@ class TestSearchAPI:
         assert data["success"] is True
         assert data["metadata"]["status_filter"] == "APPROVED"
 
+    def test_search_by_proximity_with_radius(self, monkeypatch):
+        """Test radius-bounded proximity search"""
+        self._patch_data_loader(monkeypatch)
+        
+        response = client.post(
+            "/api/search",
+            json={
+                "query_type": "proximity",
+                "latitude": 37.7749,
+                "longitude": -122.4194,
+                "radius_km": 0.5
+            }
+        )
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["success"] is True
+        assert data["metadata"]["radius_km"] == 0.5
+        assert [truck["locationid"] for truck in data["data"]] == [1]
+
+    def test_search_serves_preserialized_trucks(self, monkeypatch):
+        """Test that responses built from cached fragments match the model-rendered ones"""
+        mock_data_loader = self._patch_data_loader(monkeypatch)
+        request = {"query_type": "name", "applicant": "Taco", "status": "APPROVED"}
+        
+        cached = client.post("/api/search", json=request)
+        # Without cached fragments the response is rendered through the FoodTruck models
+        mock_data_loader.get_snapshot.return_value.truck_json = {}
+        rendered = client.post("/api/search", json=request)
+        
+        assert cached.status_code == rendered.status_code == 200
+        assert cached.headers["content-type"] == rendered.headers["content-type"]
+        assert cached.content == rendered.content
+        assert cached.json()["data"][0]["Applicant"] == "Taco Truck 1"
+
+    def test_repeated_search_is_served_from_cache(self, monkeypatch):
+        """Test that a repeated search is answered from the result cache"""
+        self._patch_data_loader(monkeypatch)
+        request = {"query_type": "name", "applicant": "Taco"}
+        
+        first = client.post("/api/search", json=request)
+        before = client.get("/api/search/cache").json()
+        second = client.post("/api/search", json={"query_type": "name", "applicant": "taco"})
+        after = client.get("/api/search/cache").json()
+        
+        assert first.status_code == second.status_code == 200
+        assert first.json()["data"] == second.json()["data"]
+        assert after["hits"] == before["hits"] + 1
+        assert after["misses"] == before["misses"]
+
+    def test_new_snapshot_invalidates_cached_results(self, monkeypatch):
+        """Test that results are recomputed once new data is published"""
+        mock_data_loader = self._patch_data_loader(monkeypatch)
+        request = {"query_type": "name", "applicant": "Burger"}
+        assert len(client.post("/api/search", json=request).json()["data"]) == 1
+        
+        reloaded = self.sample_data.copy()
+        reloaded.loc[0, 'Applicant'] = 'Burger Truck'
+        mock_data_loader.get_snapshot.return_value = DataSnapshot.build(reloaded, version=2)
+        
+        assert len(client.post("/api/search", json=request).json()["data"]) == 2
+
+    def test_cursor_pagination_walks_results(self, monkeypatch):
+        """Test that following cursors returns the full result ordering one page at a time"""
+        mock_data_loader = self._patch_data_loader(monkeypatch)
+        request = {"query_type": "proximity", "latitude": 37.7849, "longitude": -122.4094}
+        everything = [truck["locationid"] for truck in client.post("/api/search", json={**request, "limit": 3}).json()["data"]]
+        
+        pages = []
+        cursor = None
+        while True:
+            response = client.post("/api/search", json={**request, "limit": 1, "cursor": cursor})
+            assert response.status_code == 200
+            metadata = response.json()["metadata"]
+            assert metadata["offset"] == len(pages)
+            pages.extend(truck["locationid"] for truck in response.json()["data"])
+            cursor = metadata["next_cursor"]
+            if cursor is None:
+                break
+        assert pages == everything == [2, 1, 3]
+        
+        # A cursor only continues the search and the data it was issued for
+        first = client.post("/api/search", json={**request, "limit": 1}).json()["metadata"]["next_cursor"]
+        other = client.post("/api/search", json={"query_type": "name", "applicant": "Taco", "cursor": first})
+        assert other.status_code == 400
+        mock_data_loader.get_snapshot.return_value = DataSnapshot.build(self.sample_data, version=2)
+        stale = client.post("/api/search", json={**request, "limit": 1, "cursor": first})
+        assert stale.status_code == 400
+        assert "reloaded" in stale.json()["detail"]
+
+    def test_search_streams_ndjson_and_chunked_json(self, monkeypatch):
+        """Test that streaming modes return every result in the same order and format"""
+        self._patch_data_loader(monkeypatch)
+        monkeypatch.setattr('app.config.SEARCH_STREAM_BLOCK_ROWS', 2)
+        request = {"query_type": "proximity", "latitude": 37.7849, "longitude": -122.4094, "limit": 1}
+        paged = client.post("/api/search", json={**request, "limit": 3}).json()
+        
+        ndjson = client.post("/api/search", json=request, headers={"Accept": "application/x-ndjson"})
+        assert ndjson.status_code == 200
+        assert ndjson.headers["content-type"] == "application/x-ndjson"
+        assert ndjson.headers["x-total-results"] == "3"
+        assert [json.loads(line) for line in ndjson.text.splitlines()] == paged["data"]
+        
+        chunked = client.post("/api/search?stream=json", json=request)
+        assert chunked.status_code == 200
+        assert "content-length" not in chunked.headers
+        assert chunked.json()["data"] == paged["data"]
+        assert chunked.json()["metadata"]["total_results"] == 3
+        
+        invalid = client.post("/api/search?stream=ndjson", json={"query_type": "proximity"})
+        assert invalid.status_code == 400
+
+    def test_streamed_blocks_are_serialized_on_worker_pool(self, monkeypatch):
+        """Test that a streamed body is produced by worker pool jobs, not outside its limit"""
+        self._patch_data_loader(monkeypatch)
+        monkeypatch.setattr('app.config.SEARCH_STREAM_BLOCK_ROWS', 2)
+        pool = WorkerPool(max_workers=1, max_queue=0)
+        monkeypatch.setattr('app.api.search.search_pool', pool)
+        
+        response = client.post("/api/search?stream=ndjson", json={"query_type": "proximity", "latitude": 37.7849, "longitude": -122.4094})
+        
+        assert len(response.text.splitlines()) == 3
+        # The search, two blocks of results and the end of the body
+        assert pool.stats()["completed"] == 4
+
+    def test_search_across_shards(self, monkeypatch):
+        """Test that a sharded snapshot answers exactly like one holding every row"""
+        mock_data_loader = self._patch_data_loader(monkeypatch)
+        requests = [
+            {"query_type": "name", "applicant": "Truck"},
+            {"query_type": "proximity", "latitude": 37.7849, "longitude": -122.4094, "status": "APPROVED", "limit": 2}
+        ]
+        single = [client.post("/api/search", json=request).json() for request in requests]
+        
+        mock_data_loader.get_snapshot.return_value = ShardedSnapshot([
+            ('mission', DataSnapshot.build(self.sample_data.iloc[:1].reset_index(drop=True))),
+            ('castro', DataSnapshot.build(self.sample_data.iloc[1:].reset_index(drop=True)))
+        ])
+        sharded = [client.post("/api/search", json=request).json() for request in requests]
+        
+        # Cursors encode the snapshot they were issued for, so only they differ
+        assert [response["metadata"].pop("next_cursor") is None for response in sharded] == [True, False]
+        assert [response["metadata"].pop("next_cursor") is None for response in single] == [True, False]
+        assert sharded == single
+
+    def test_batch_search(self, monkeypatch):
+        """Test batch search returns one response per search, in order"""
+        self._patch_data_loader(monkeypatch)
+        searches = [
+            {"query_type": "proximity", "latitude": 37.7649, "longitude": -122.4294, "limit": 1},
+            {"query_type": "name", "applicant": "Taco", "status": "REQUESTED"},
+            {"query_type": "street"},
+            {"query_type": "proximity", "latitude": 37.7749, "longitude": -122.4194, "radius_km": 0.5}
+        ]
+        
+        response = client.post("/api/search/batch", json={"searches": searches})
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["success"] is True
+        results = data["results"]
+        assert len(results) == 4
+        assert [truck["locationid"] for truck in results[0]["data"]] == [3]
+        assert [truck["locationid"] for truck in results[1]["data"]] == [2]
+        assert results[2]["success"] is False
+        assert results[2]["message"] == "Street name required for street search"
+        assert results[2]["data"] == []
+        assert [truck["locationid"] for truck in results[3]["data"]] == [1]
+        
+        # Each result matches the single search endpoint
+        single = client.post("/api/search", json=searches[0]).json()
+        assert results[0] == single
+
+    def test_batch_search_empty(self):
+        """Test that an empty batch is rejected"""
+        response = client.post("/api/search/batch", json={"searches": []})
+        assert response.status_code == 422
+
+    def test_search_rejected_when_workers_saturated(self, monkeypatch):
+        """Test that searches are rejected with 503 while the worker pool is full"""
+        self._patch_data_loader(monkeypatch)
+        saturated = WorkerPool(max_workers=1, max_queue=0)
+        saturated._pending = 1  # The only worker is busy
+        monkeypatch.setattr('app.api.search.search_pool', saturated)
+        
+        response = client.post("/api/search", json={"query_type": "name", "applicant": "Taco"})
+        batch = client.post("/api/search/batch", json={"searches": [{"query_type": "name", "applicant": "Taco"}]})
+        
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+        assert batch.status_code == 503
+        assert client.get("/api/health").status_code == 200
+        assert client.get("/api/search/workers").json()["rejected"] == 2
+
     def test_search_with_custom_limit(self, monkeypatch):
         """Test search with custom limit"""
-        mock_data_loader = MagicMock()
-        mock_data_loader.get_data.return_value = self.sample_data
-        mock_data_loader.is_data_available.return_value = True
-        
-        monkeypatch.setattr('app.api.search.data_loader', mock_data_loader)
+        self._patch_data_loader(monkeypatch)
         
         response = client.post(
             "/api/search",
@@ -279,11 +540,7 @@ class TestSearchAPI:
 
     def test_search_proximity_default_limit(self, monkeypatch):
         """Test that proximity search defaults to limit 5"""
-        mock_data_loader = MagicMock()
-        mock_data_loader.get_data.return_value = self.sample_data
-        mock_data_loader.is_data_available.return_value = True
-        
-        monkeypatch.setattr('app.api.search.data_loader', mock_data_loader)
+        self._patch_data_loader(monkeypatch)
         
         response = client.post(
             "/api/search",
@@ -1,9 +1,16 @@
 import pytest
 import pandas as pd
+import numpy as np
 import tempfile
 import os
 from unittest.mock import patch, MagicMock
-from app.dataloader.food_truck_loader import FoodTruckDataLoader
+from app.dataloader.food_truck_loader import FoodTruckDataLoader, ShardedDataLoader
+from app.dataloader.fingerprint import fingerprint_file
+from app.dataloader.snapshot import DataSnapshot
+from app.dataloader.snapshot_store import SnapshotStore
+from app.dataloader.schema import apply_schema, restore_schema
+from app.dataloader.delta import DeltaStats
+from app.utils.mappers import serialize_food_trucks
 
 
 class TestFoodTruckDataLoader:
@@ -25,8 +32,8 @@ class TestFoodTruckDataLoader:
 
     def test_initialization(self):
         """Test that loader initializes correctly"""
-        assert self.loader._data is None
-        assert self.loader._data_loaded is False
+        assert self.loader._snapshot is None
+        assert self.loader.is_data_available() is False
         assert self.loader._last_reload is None
         assert self.loader._reload_interval.total_seconds() == 60
 
@@ -39,18 +46,33 @@ class TestFoodTruckDataLoader:
         with patch('os.path.exists', return_value=True):
             result = self.loader.load_data()
             
-        assert self.loader._data_loaded is True
+        assert self.loader.is_data_available() is True
         assert len(result) == 3
-        assert result.equals(self.sample_data)
+        assert result.equals(apply_schema(self.sample_data))
         mock_read_csv.assert_called_once()
 
+    @patch('pandas.read_csv')
+    def test_load_data_builds_snapshot(self, mock_read_csv):
+        """Test that loading precomputes radian coordinates for the snapshot"""
+        mock_read_csv.return_value = self.sample_data
+        
+        with patch('os.path.exists', return_value=True):
+            self.loader.load_data()
+            
+        snapshot = self.loader.get_snapshot()
+        assert snapshot.data is self.loader.get_data()
+        assert snapshot.version == 1
+        assert snapshot.fingerprint is not None
+        assert np.allclose(snapshot.lat_rad, np.radians(self.sample_data['Latitude']))
+        assert list(snapshot.coordinate_rows) == [0, 1, 2]
+
     @patch('pandas.read_csv')
     def test_load_data_file_not_found(self, mock_read_csv):
         """Test data loading when file doesn't exist"""
         with patch('os.path.exists', return_value=False):
             result = self.loader.load_data()
         
-        assert self.loader._data_loaded is False
+        assert self.loader._snapshot is None
         assert result.empty
         mock_read_csv.assert_not_called()
 
@@ -62,20 +84,18 @@ class TestFoodTruckDataLoader:
         with patch('os.path.exists', return_value=True):
             result = self.loader.load_data()
             
-        assert self.loader._data_loaded is False
+        assert self.loader._snapshot is None
         assert result.empty
         assert isinstance(result, pd.DataFrame)
 
     def test_get_data_not_loaded(self):
         """Test getting data when not loaded"""
-        self.loader._data_loaded = False
-        self.loader._data = None
+        self.loader._snapshot = None
         with patch.object(self.loader, 'load_data') as mock_load:
             mock_load.return_value = self.sample_data
-            # Mock the side effect to set the data
+            # Mock the side effect to publish the data
             def side_effect():
-                self.loader._data = self.sample_data
-                self.loader._data_loaded = True
+                self.loader._snapshot = DataSnapshot(self.sample_data)
                 return self.sample_data
             mock_load.side_effect = side_effect
             result = self.loader.get_data()
@@ -85,8 +105,7 @@ class TestFoodTruckDataLoader:
 
     def test_get_data_already_loaded(self):
         """Test getting data when already loaded"""
-        self.loader._data = self.sample_data
-        self.loader._data_loaded = True
+        self.loader._snapshot = DataSnapshot(self.sample_data)
         
         with patch.object(self.loader, 'load_data') as mock_load:
             result = self.loader.get_data()
@@ -113,19 +132,17 @@ class TestFoodTruckDataLoader:
 
     def test_is_data_available_not_loaded(self):
         """Test data availability when not loaded"""
-        self.loader._data_loaded = False
+        self.loader._snapshot = None
         assert self.loader.is_data_available() is False
 
     def test_is_data_available_empty_data(self):
         """Test data availability when data is empty"""
-        self.loader._data_loaded = True
-        self.loader._data = pd.DataFrame()
+        self.loader._snapshot = DataSnapshot(pd.DataFrame())
         assert self.loader.is_data_available() is False
 
     def test_is_data_available_with_data(self):
         """Test data availability when data exists"""
-        self.loader._data_loaded = True
-        self.loader._data = self.sample_data
+        self.loader._snapshot = DataSnapshot(self.sample_data)
         assert self.loader.is_data_available() is True
 
     def test_get_dataframe(self):
@@ -143,16 +160,343 @@ class TestFoodTruckDataLoader:
         mock_read_csv.return_value = self.sample_data
         
         # Set initial state
-        self.loader._data = pd.DataFrame({'old': ['data']})
-        self.loader._data_loaded = True
+        self.loader._snapshot = DataSnapshot(pd.DataFrame({'old': ['data']}))
         
         with patch('os.path.exists', return_value=True):
             result = self.loader.reload_data()
             
-        assert self.loader._data_loaded is True  # load_data() sets this to True
-        assert result.equals(self.sample_data)
+        assert self.loader.is_data_available() is True
+        assert result.equals(apply_schema(self.sample_data))
         assert self.loader._last_reload is not None
 
+    def test_reload_skips_unchanged_source(self, tmp_path):
+        """Test that reloading an unchanged file skips parsing and index rebuilds"""
+        csv_path = tmp_path / 'permits.csv'
+        self.sample_data.to_csv(csv_path, index=False)
+        loader = FoodTruckDataLoader(str(csv_path))
+        loader.load_data()
+        snapshot = loader.get_snapshot()
+        
+        with patch('pandas.read_csv') as mock_read_csv:
+            loader.reload_data()
+            # Touching the file changes mtime but not content
+            os.utime(csv_path, ns=(0, 0))
+            loader.reload_data()
+            
+        mock_read_csv.assert_not_called()
+        assert loader.get_snapshot() is snapshot
+        assert loader._last_reload is not None
+
+    def test_reload_parses_changed_source(self, tmp_path):
+        """Test that reloading a modified file parses it again"""
+        csv_path = tmp_path / 'permits.csv'
+        self.sample_data.to_csv(csv_path, index=False)
+        loader = FoodTruckDataLoader(str(csv_path))
+        loader.load_data()
+        
+        self.sample_data.head(2).to_csv(csv_path, index=False)
+        result = loader.reload_data()
+        
+        assert len(result) == 2
+        assert len(loader.get_snapshot()) == 2
+
+    def test_reload_force(self, tmp_path):
+        """Test that a forced reload parses even when nothing changed"""
+        csv_path = tmp_path / 'permits.csv'
+        self.sample_data.to_csv(csv_path, index=False)
+        loader = FoodTruckDataLoader(str(csv_path))
+        loader.load_data()
+        snapshot = loader.get_snapshot()
+        
+        loader.reload_data(force=True)
+        
+        assert loader.get_snapshot() is not snapshot
+
+    def test_fingerprint_file(self, tmp_path):
+        """Test fingerprints track content and reuse the hash for an unchanged stat"""
+        path = tmp_path / 'source.csv'
+        path.write_text('a,b\n1,2\n')
+        first = fingerprint_file(str(path))
+        assert fingerprint_file(str(path), first) is first
+        
+        os.utime(path, ns=(0, 0))
+        touched = fingerprint_file(str(path), first)
+        assert touched is not first
+        assert touched.same_content(first)
+        
+        path.write_text('a,b\n1,3\n')
+        assert not fingerprint_file(str(path), touched).same_content(first)
+
+    def test_reload_builds_off_to_the_side(self, tmp_path):
+        """Test the old snapshot keeps serving until the new one is published whole"""
+        csv_path = tmp_path / 'permits.csv'
+        self.sample_data.to_csv(csv_path, index=False)
+        loader = FoodTruckDataLoader(str(csv_path))
+        loader.load_data()
+        old_snapshot = loader.get_snapshot()
+        
+        self.sample_data.head(2).to_csv(csv_path, index=False)
+        seen_during_build = []
+        original_build = DataSnapshot.build
+        def observing_build(*args, **kwargs):
+            seen_during_build.append(loader.get_snapshot())
+            return original_build(*args, **kwargs)
+        
+        with patch.object(DataSnapshot, 'build', side_effect=observing_build):
+            loader.reload_data()
+            
+        assert seen_during_build == [old_snapshot]
+        assert loader.get_snapshot().version == old_snapshot.version + 1
+        # The pinned snapshot is untouched by the swap
+        assert len(old_snapshot) == 3
+        assert len(loader.get_snapshot()) == 2
+
+    def test_failed_reload_keeps_current_snapshot(self, tmp_path):
+        """Test a failed rebuild leaves the published snapshot serving"""
+        csv_path = tmp_path / 'permits.csv'
+        self.sample_data.to_csv(csv_path, index=False)
+        loader = FoodTruckDataLoader(str(csv_path))
+        loader.load_data()
+        snapshot = loader.get_snapshot()
+        
+        with patch('pandas.read_csv', side_effect=Exception("Test error")):
+            result = loader.reload_data(force=True)
+            
+        assert loader.get_snapshot() is snapshot
+        assert loader.is_data_available() is True
+        assert len(result) == 3
+
+    @staticmethod
+    def _is_mapped(array: np.ndarray) -> bool:
+        """Whether an array is a view of a memory-mapped file"""
+        while array is not None and not isinstance(array, np.memmap):
+            array = array.base
+        return array is not None
+
+    def test_shared_store_parses_once(self, tmp_path):
+        """Test that loaders sharing a store parse the source once and map the same version"""
+        csv_path = tmp_path / 'permits.csv'
+        self.sample_data.to_csv(csv_path, index=False)
+        first = FoodTruckDataLoader(str(csv_path), store_dir=str(tmp_path / 'store'))
+        first.load_data()
+        
+        second = FoodTruckDataLoader(str(csv_path), store_dir=str(tmp_path / 'store'))
+        with patch('pandas.read_csv') as mock_read_csv:
+            result = second.load_data()
+            
+        mock_read_csv.assert_not_called()
+        pd.testing.assert_frame_equal(result, apply_schema(self.sample_data))
+        assert second.get_snapshot().version == first.get_snapshot().version == 1
+        # Numeric columns are read-only maps of the store's files, not private copies
+        assert self._is_mapped(result['Latitude'].values)
+
+    def test_shared_store_remaps_new_version(self, tmp_path):
+        """Test that a loader maps a version another process published on its next reload"""
+        csv_path = tmp_path / 'permits.csv'
+        self.sample_data.to_csv(csv_path, index=False)
+        first = FoodTruckDataLoader(str(csv_path), store_dir=str(tmp_path / 'store'))
+        second = FoodTruckDataLoader(str(csv_path), store_dir=str(tmp_path / 'store'))
+        first.load_data()
+        second.load_data()
+        
+        self.sample_data.head(2).to_csv(csv_path, index=False)
+        first.reload_data()
+        with patch('pandas.read_csv') as mock_read_csv:
+            result = second.reload_data()
+            
+        mock_read_csv.assert_not_called()
+        assert len(result) == 2
+        assert second.get_snapshot().version == 2
+
+    def test_shared_store_round_trip(self, tmp_path):
+        """Test missing values, empty and non-ASCII strings survive the store"""
+        data = self.sample_data.copy()
+        data['permit'] = ['24MFF-00001', '24MFF-00002', '24MFF-00003']
+        data.loc[0, 'FoodItems'] = np.nan
+        data.loc[1, 'Applicant'] = 'Café Crêpe ☕'
+        data.loc[2, 'FacilityType'] = ''
+        data.loc[2, 'Latitude'] = np.nan
+        store = SnapshotStore(str(tmp_path / 'store'))
+        
+        snapshot = store.attach(store.write(data))
+        
+        pd.testing.assert_frame_equal(snapshot.data, data)
+        assert snapshot.truck_fragments(np.array([1])) == DataSnapshot.build(data).truck_fragments(np.array([1]))
+
+    def test_compact_schema_round_trip(self, tmp_path):
+        """Test that compact columns keep their values in memory and through the store"""
+        data = self.sample_data.copy()
+        data['Approved'] = ['2024 Nov 12 12:00:00 AM', np.nan, '2023 Jan 05 03:30:15 PM']
+        data['Received'] = [20241112, 20230105, 20220101]
+
+        compact = apply_schema(data)
+
+        assert isinstance(compact['Status'].dtype, pd.CategoricalDtype)
+        assert compact['Latitude'].dtype == np.float32
+        assert compact['Received'].dtype == np.int32
+        assert compact['Approved'].dtype.kind == 'M'
+        assert compact['Status'].cat.codes.dtype == np.int8
+        restored = restore_schema(compact)
+        pd.testing.assert_frame_equal(restored.drop(columns=['Latitude', 'Longitude']), data.drop(columns=['Latitude', 'Longitude']))
+        np.testing.assert_allclose(restored['Latitude'], data['Latitude'], atol=1e-5)
+
+        store = SnapshotStore(str(tmp_path / 'store'))
+        attached = store.attach(store.write(compact)).data
+        pd.testing.assert_frame_equal(attached, compact)
+        # Categorical codes stay views of the mapped file instead of per-worker copies
+        assert self._is_mapped(attached['Status'].array.codes)
+
+    def test_store_created_on_first_build(self, tmp_path):
+        """Test that constructing a store does not create its directory"""
+        csv_path = tmp_path / 'permits.csv'
+        self.sample_data.to_csv(csv_path, index=False)
+        store = SnapshotStore(str(tmp_path / 'store'))
+        
+        assert not (tmp_path / 'store').exists()
+        assert store.read_manifest() is None
+        store.load(str(csv_path))
+        assert (tmp_path / 'store' / 'CURRENT').exists()
+
+    def test_unparseable_dates_kept_as_text(self):
+        """Test that a date column in an unexpected format keeps its text"""
+        data = self.sample_data.assign(ExpirationDate=['2024-11-12', 'soon', np.nan])
+
+        compact = apply_schema(data)
+
+        pd.testing.assert_series_equal(restore_schema(compact)['ExpirationDate'], data['ExpirationDate'])
+
+    def test_binary_cache_reused_across_restarts(self, tmp_path):
+        """Test that a restart reads the binary cache instead of parsing an unchanged CSV"""
+        csv_path = tmp_path / 'permits.csv'
+        self.sample_data.to_csv(csv_path, index=False)
+        FoodTruckDataLoader(str(csv_path), store_dir=str(tmp_path / 'cache')).load_data()
+        
+        # Touching the source changes its mtime but not its fingerprinted content
+        os.utime(csv_path, ns=(0, 0))
+        restarted = FoodTruckDataLoader(str(csv_path), store_dir=str(tmp_path / 'cache'))
+        with patch('pandas.read_csv') as mock_read_csv:
+            result = restarted.load_data()
+            
+        mock_read_csv.assert_not_called()
+        pd.testing.assert_frame_equal(result, apply_schema(self.sample_data))
+
+    def test_binary_cache_rebuilt_when_unreadable(self, tmp_path):
+        """Test that a corrupt or outdated cache is rebuilt from the CSV"""
+        csv_path = tmp_path / 'permits.csv'
+        self.sample_data.to_csv(csv_path, index=False)
+        store = SnapshotStore(str(tmp_path / 'cache'))
+        first_version = store.load(str(csv_path)).version
+        os.remove(os.path.join(store.read_manifest().directory, 'column0.bin'))
+        
+        snapshot = store.load(str(csv_path))
+        
+        assert snapshot.version == first_version + 1
+        pd.testing.assert_frame_equal(snapshot.data, apply_schema(self.sample_data))
+        
+        with open(os.path.join(store.read_manifest().directory, 'manifest.json'), 'w') as manifest_file:
+            manifest_file.write('{"format": 0}')
+        assert store.read_manifest() is None
+        assert store.load(str(csv_path)).version == first_version + 2
+
+    def test_chunked_store_load_matches_whole_file(self, tmp_path):
+        """Test that writing the store chunk by chunk gives the same table and response JSON"""
+        csv_path = tmp_path / 'permits.csv'
+        self.sample_data.to_csv(csv_path, index=False)
+        whole = SnapshotStore(str(tmp_path / 'whole')).load(str(csv_path))
+        
+        chunked = SnapshotStore(str(tmp_path / 'chunked')).load(str(csv_path), chunk_rows=2)
+        
+        pd.testing.assert_frame_equal(restore_schema(chunked.data), restore_schema(whole.data))
+        rows = np.arange(3)
+        assert chunked.truck_fragments(rows) == whole.truck_fragments(rows)
+        assert list(chunked.applicant_index.search('taco')) == [0, 1]
+
+    def test_chunked_load_merges_chunks_with_different_types(self, tmp_path):
+        """Test that chunks parsed to different types are merged instead of failing the load"""
+        csv_path = tmp_path / 'permits.csv'
+        self.sample_data.assign(Notes=[7, 'cash only', np.nan]).to_csv(csv_path, index=False)
+        
+        snapshot = SnapshotStore(str(tmp_path / 'store')).load(str(csv_path), chunk_rows=1)
+        in_memory = FoodTruckDataLoader(str(csv_path), chunk_rows=1).load_data()
+        
+        assert len(snapshot) == 3
+        assert list(snapshot.data['Notes'].iloc[:2]) == ['7', 'cash only']
+        # The store keeps text columns as strings; the in-memory merge keeps parsed values as they are
+        pd.testing.assert_frame_equal(restore_schema(in_memory).drop(columns='Notes'), restore_schema(snapshot.data).drop(columns='Notes'))
+
+    def _edit_sample(self):
+        """Sample data with locationid 1 deleted, 2 updated, 3 unchanged and 4 inserted"""
+        edited = self.sample_data.iloc[1:].copy()
+        edited.loc[1, 'Applicant'] = 'Taco Truck Deluxe'
+        inserted = self.sample_data.iloc[[0]].assign(locationid=4, Applicant='Crepe Cart')
+        return pd.concat([inserted, edited], ignore_index=True)
+
+    def test_delta_reload_applies_changes_by_locationid(self, tmp_path):
+        """Test that a changed source is applied as a delta that only serializes changed rows"""
+        csv_path = tmp_path / 'permits.csv'
+        self.sample_data.to_csv(csv_path, index=False)
+        loader = FoodTruckDataLoader(str(csv_path))
+        loader.load_data()
+        assert loader.last_change() is None
+        
+        self._edit_sample().to_csv(csv_path, index=False)
+        with patch('app.dataloader.schema.serialize_food_trucks', wraps=serialize_food_trucks) as serialize:
+            loader.reload_data()
+        
+        assert loader.last_change() == DeltaStats(inserted=1, updated=1, deleted=1, unchanged=1)
+        assert [len(call.args[0]) for call in serialize.call_args_list] == [2]
+        snapshot = loader.get_snapshot()
+        full = FoodTruckDataLoader(str(csv_path))
+        full.load_data()
+        pd.testing.assert_frame_equal(restore_schema(snapshot.data), restore_schema(full.get_snapshot().data))
+        assert snapshot.truck_fragments(np.arange(3)) == full.get_snapshot().truck_fragments(np.arange(3))
+        assert list(snapshot.applicant_index.search('taco')) == [1]
+        np.testing.assert_array_equal(snapshot.address_index.gram_values, full.get_snapshot().address_index.gram_values)
+        assert list(snapshot.data['Applicant'].cat.categories) == sorted(['Crepe Cart', 'Taco Truck Deluxe', 'Burger Joint'])
+
+    def test_delta_reload_through_store(self, tmp_path):
+        """Test that the store publishes a delta as a new version and keeps hashes for the next one"""
+        csv_path = tmp_path / 'permits.csv'
+        self.sample_data.to_csv(csv_path, index=False)
+        loader = FoodTruckDataLoader(str(csv_path), store_dir=str(tmp_path / 'store'), chunk_rows=2)
+        loader.load_data()
+        
+        self._edit_sample().to_csv(csv_path, index=False)
+        loader.reload_data()
+        
+        snapshot = loader.get_snapshot()
+        assert snapshot.version == 2
+        assert loader.last_change() == DeltaStats(inserted=1, updated=1, deleted=1, unchanged=1)
+        assert snapshot.row_hashes is not None
+        assert list(snapshot.data['locationid']) == [4, 2, 3]
+        
+        # A forced reload parses everything again
+        loader.reload_data(force=True)
+        assert loader.last_change() is None
+        pd.testing.assert_frame_equal(restore_schema(loader.get_snapshot().data), restore_schema(snapshot.data))
+
+    def test_sharded_loader_tracks_dataset_directory(self, tmp_path):
+        """Test that each CSV is a shard with its own lifecycle and the directory is rescanned on reload"""
+        self.sample_data.iloc[:2].to_csv(tmp_path / 'oakland.csv', index=False)
+        self.sample_data.iloc[2:].to_csv(tmp_path / 'berkeley.csv', index=False)
+        loader = ShardedDataLoader(str(tmp_path))
+        
+        snapshot = loader.get_snapshot()
+        
+        assert loader.is_data_available() is True
+        assert snapshot.names == ['berkeley', 'oakland']
+        assert len(snapshot) == 3
+        assert snapshot.shards[1].bounds == pytest.approx((37.7749, 37.7849, -122.4194, -122.4094))
+        
+        # Unchanged shards keep the same view; an edited, added or removed file changes only its shard
+        loader.reload_data()
+        assert loader.get_snapshot() is snapshot
+        self.sample_data.to_csv(tmp_path / 'alameda.csv', index=False)
+        os.remove(tmp_path / 'berkeley.csv')
+        reloaded = loader.reload_data()
+        assert reloaded.names == ['alameda', 'oakland']
+        assert reloaded.shards[1] is snapshot.shards[1]
+
     # Note: get_data_with_auto_reload method doesn't exist in the current implementation
 
     def test_data_loader_singleton(self):
@@ -2,7 +2,7 @@ import pytest
 from pydantic import ValidationError
 from app.models.food_truck import (
     SearchType, StatusType, SearchRequest, FoodTruck, 
-    SearchResponse, HealthResponse
+    SearchResponse, HealthResponse, BatchSearchRequest, MAX_BATCH_SIZE
 )
 
 
@@ -67,6 +67,43 @@ class TestSearchRequest:
         assert request.latitude == 37.7749
         assert request.longitude == -122.4194
 
+    def test_valid_radius_search(self):
+        """Test valid radius-bounded proximity search request"""
+        request = SearchRequest(
+            query_type=SearchType.PROXIMITY,
+            latitude=37.7749,
+            longitude=-122.4194,
+            radius_km=0.5,
+            max_results=200
+        )
+        assert request.radius_km == 0.5
+        assert request.max_results == 200
+
+    def test_invalid_radius(self):
+        """Test that radius must be positive"""
+        with pytest.raises(ValidationError):
+            SearchRequest(
+                query_type=SearchType.PROXIMITY,
+                latitude=37.7749,
+                longitude=-122.4194,
+                radius_km=0
+            )
+
+    def test_batch_request(self):
+        """Test batch request holding several searches"""
+        request = BatchSearchRequest(searches=[
+            {"query_type": "name", "applicant": "Taco"},
+            {"query_type": "proximity", "latitude": 37.7749, "longitude": -122.4194}
+        ])
+        assert [search.query_type for search in request.searches] == [SearchType.NAME, SearchType.PROXIMITY]
+
+    def test_batch_request_size_bounds(self):
+        """Test that a batch must hold between one and MAX_BATCH_SIZE searches"""
+        with pytest.raises(ValidationError):
+            BatchSearchRequest(searches=[])
+        with pytest.raises(ValidationError):
+            BatchSearchRequest(searches=[{"query_type": "name", "applicant": "Taco"}] * (MAX_BATCH_SIZE + 1))
+
     def test_search_with_status_filter(self):
         """Test search request with status filter"""
         request = SearchRequest(
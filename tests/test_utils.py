@@ -1,12 +1,30 @@
+import asyncio
+import json
+import threading
 import pytest
 import pandas as pd
 import numpy as np
+from app.utils import search_utils
 from app.utils.search_utils import (
-    apply_status_filter, search_by_name, search_by_street, search_by_proximity
+    apply_status_filter, search_by_name, search_by_street, search_by_proximity, search_by_food_items,
+    SearchHits, execute_search, execute_batch, find_by_proximity, find_nearest_batch, materialize, result_limit
 )
-from app.utils.mappers import convert_to_food_trucks, create_search_metadata
-from app.utils.geo import haversine_distance
-from app.models.food_truck import SearchType, StatusType
+from app.utils.mappers import (
+    convert_to_food_trucks, create_search_metadata, serialize_food_trucks, assemble_search_response, stream_search_response, stream_ndjson
+)
+from app.utils.geo import haversine_distance, haversine_distances, haversine_distance_matrix, bounding_box, box_distance_lower_bound
+from app.utils.spatial_index import GridIndex, top_k
+from app.utils.text_index import (
+    FUZZY_SHORTLIST, TokenIndex, TrigramIndex, contains_rows, parse_terms, substring_edit_distance
+)
+from app.utils.partitions import ValuePartitions
+from app.utils.query_planner import compound_predicates, plan_compound, run_compound
+from app.utils.result_cache import ResultCache, request_cache_key
+from app.utils.pagination import CursorError, encode_cursor, decode_cursor
+from app.utils.worker_pool import WorkerPool, PoolSaturatedError
+from app.utils.profiling import SearchProfile, profile_stage, profiling, record_step
+from app.dataloader.snapshot import DataSnapshot, ShardedSnapshot
+from app.models.food_truck import SearchRequest, SearchType, StatusType, TermMatch, MAX_RADIUS_RESULTS
 
 
 class TestGeoUtils:
@@ -37,6 +55,253 @@ class TestGeoUtils:
         with pytest.raises(TypeError):
             haversine_distance("invalid", -122.4194, 37.7749, -122.4194)
 
+    def test_haversine_distances_matches_scalar(self):
+        """Test vectorized haversine agrees with the scalar implementation"""
+        lats = np.array([37.7749, 37.8044, -33.8688])
+        lons = np.array([-122.4194, -122.2711, 151.2093])
+        distances = haversine_distances(37.7749, -122.4194, np.radians(lats), np.radians(lons))
+        expected = [haversine_distance(37.7749, -122.4194, lat, lon) for lat, lon in zip(lats, lons)]
+        assert np.allclose(distances, expected)
+        assert distances[0] == 0.0
+
+    def test_haversine_distance_matrix_matches_rows(self):
+        """Test each matrix row is identical to the single-query vectorized result"""
+        lat_rad = np.radians(np.array([37.7749, 37.8044, -33.8688]))
+        lon_rad = np.radians(np.array([-122.4194, -122.2711, 151.2093]))
+        queries = [(37.7749, -122.4194), (10.5, 20.25), (-45.0, 179.9)]
+        matrix = haversine_distance_matrix([q[0] for q in queries], [q[1] for q in queries], lat_rad, lon_rad)
+        assert matrix.shape == (3, 3)
+        for row, (lat, lon) in zip(matrix, queries):
+            assert np.array_equal(row, haversine_distances(lat, lon, lat_rad, lon_rad))
+
+    def test_box_distance_lower_bound(self):
+        """Test the box bound is zero inside the box and never exceeds the distance to a box corner"""
+        box = (37.70, 37.81, -122.52, -122.35)
+        assert box_distance_lower_bound(37.77, -122.42, box) == 0.0
+        rng = np.random.default_rng(7)
+        for lat, lon in zip(rng.uniform(-80, 80, 50), rng.uniform(-180, 180, 50)):
+            bound = box_distance_lower_bound(lat, lon, box)
+            corners = [haversine_distance(lat, lon, corner_lat, corner_lon) for corner_lat in box[:2] for corner_lon in box[2:]]
+            assert 0 <= bound <= min(corners) + 1e-9
+
+    def test_bounding_box_contains_radius(self):
+        """Test bounding box edges lie at the search radius"""
+        min_lat, max_lat, min_lon, max_lon = bounding_box(37.7749, -122.4194, 1.0)
+        assert min_lat < 37.7749 < max_lat
+        assert min_lon < -122.4194 < max_lon
+        assert abs(haversine_distance(37.7749, -122.4194, max_lat, -122.4194) - 1.0) < 1e-9
+
+    def test_bounding_box_across_antimeridian(self):
+        """Test bounding box wraps around the antimeridian"""
+        min_lat, max_lat, min_lon, max_lon = bounding_box(0.0, 179.99, 10.0)
+        assert min_lon > max_lon
+
+    def test_bounding_box_near_pole(self):
+        """Test bounding box covering a pole spans all longitudes"""
+        assert bounding_box(89.99, 0.0, 10.0)[2:] == (-180.0, 180.0)
+
+
+class TestSpatialIndex:
+    def setup_method(self):
+        """Set up a dataset large enough to exercise the grid rather than a full scan"""
+        rng = np.random.default_rng(42)
+        lat = np.concatenate([rng.uniform(37.70, 37.80, 2000), rng.uniform(-60, 60, 500), [0.0] * 20])
+        lon = np.concatenate([rng.uniform(-122.50, -122.35, 2000), rng.uniform(170, 190, 500) - 360 * (rng.random(500) < 0.5), [0.0] * 20])
+        lon = (lon + 180) % 360 - 180
+        self.lat_rad = np.radians(lat)
+        self.lon_rad = np.radians(lon)
+        self.rows = np.arange(len(lat))
+        self.index = GridIndex(self.lat_rad, self.lon_rad, self.rows)
+
+    def _brute_force(self, latitude, longitude, k, allowed=None):
+        rows = self.rows if allowed is None else self.rows[allowed]
+        distances = haversine_distances(latitude, longitude, self.lat_rad[rows], self.lon_rad[rows])
+        return top_k(rows, distances, k)
+
+    def test_nearest_matches_brute_force(self):
+        """Test grid kNN returns exactly the brute-force neighbours"""
+        for latitude, longitude in [(37.7749, -122.4194), (0.0, 0.0), (10.0, 179.99), (-5.0, -179.5), (80.0, 20.0)]:
+            rows, distances = self.index.nearest(latitude, longitude, 7)
+            expected_rows, expected_distances = self._brute_force(latitude, longitude, 7)
+            assert np.allclose(distances, expected_distances)
+            assert list(rows) == list(expected_rows)
+
+    def test_nearest_respects_allowed_mask(self):
+        """Test that only allowed rows are returned"""
+        allowed = np.zeros(len(self.rows), dtype=bool)
+        allowed[::3] = True
+        rows, distances = self.index.nearest(37.7749, -122.4194, 10, allowed)
+        expected_rows, _ = self._brute_force(37.7749, -122.4194, 10, allowed)
+        assert all(allowed[rows])
+        assert list(rows) == list(expected_rows)
+
+    def test_nearest_returns_sorted_top_k(self):
+        """Test that exactly k results come back sorted by distance"""
+        rows, distances = self.index.nearest(37.75, -122.45, 5)
+        assert len(rows) == 5
+        assert list(distances) == sorted(distances)
+
+    def test_within_matches_brute_force(self):
+        """Test radius search returns exactly the rows within the radius"""
+        for latitude, longitude, radius_km in [(37.7749, -122.4194, 0.5), (37.7749, -122.4194, 5.0), (5.0, 179.9, 100.0), (0.0, 0.0, 1.0)]:
+            rows, distances = self.index.within(latitude, longitude, radius_km)
+            all_distances = haversine_distances(latitude, longitude, self.lat_rad, self.lon_rad)
+            expected_rows, _ = top_k(self.rows[all_distances <= radius_km], all_distances[all_distances <= radius_km], None)
+            assert list(rows) == list(expected_rows)
+            assert all(distances <= radius_km)
+
+    def test_within_respects_limit(self):
+        """Test radius search caps results to the nearest rows"""
+        rows, distances = self.index.within(37.7749, -122.4194, 5.0, limit=3)
+        all_rows, all_distances = self.index.within(37.7749, -122.4194, 5.0)
+        assert list(rows) == list(all_rows[:3])
+
+    def test_nearest_scans_small_allowed_rows(self):
+        """Test a small partition is scanned directly and gives the same answer"""
+        allowed_rows = np.array([5, 50, 500, 2100, 2510])
+        allowed = np.zeros(len(self.rows), dtype=bool)
+        allowed[allowed_rows] = True
+        rows, _ = self.index.nearest(37.7749, -122.4194, 3, allowed, allowed_rows)
+        expected_rows, _ = self._brute_force(37.7749, -122.4194, 3, allowed)
+        assert list(rows) == list(expected_rows)
+
+    def test_count_within_bounds_radius_matches(self):
+        """Test the cell-based radius estimate never undercounts the rows within the radius"""
+        for latitude, longitude, radius_km in [(37.7749, -122.4194, 0.5), (37.7749, -122.4194, 5.0), (5.0, 179.9, 100.0), (-80.0, 0.0, 1.0)]:
+            count = self.index.count_within(latitude, longitude, radius_km)
+            assert len(self.index.within(latitude, longitude, radius_km)[0]) <= count <= len(self.rows)
+
+    def test_top_k_selects_smallest(self):
+        """Test top-k selection sorts only the smallest distances"""
+        rows, distances = top_k(np.array([10, 11, 12, 13]), np.array([3.0, 1.0, 2.0, 1.0]), 3)
+        assert list(rows) == [11, 13, 12]
+        assert list(distances) == [1.0, 1.0, 2.0]
+
+
+class TestTextIndex:
+    def setup_method(self):
+        """Set up a column with repeats, missing values and mixed case"""
+        self.values = pd.Series([
+            'Philz Coffee', 'Taco Truck', np.nan, 'PHILZ COFFEE', 'Coffee Cart', 'El Taco Loco', None, 'Taco Truck'
+        ])
+        self.index = TrigramIndex(self.values)
+
+    def _scan(self, term):
+        return list(np.flatnonzero(self.values.str.contains(term, case=False, na=False).to_numpy(dtype=bool)))
+
+    def test_search_matches_str_contains(self):
+        """Test index lookups agree with a case-insensitive substring scan"""
+        for term in ['coffee', 'TACO', 'z co', 'ruck', 'Loco', 'missing', 'co', 'e']:
+            assert list(self.index.search(term)) == self._scan(term)
+
+    def test_search_groups_repeated_values(self):
+        """Test repeated values are indexed once but every row is returned"""
+        assert len(self.index.values) == 4
+        assert list(self.index.search('taco truck')) == [1, 7]
+
+    def test_contains_rows_regex_falls_back_to_scan(self):
+        """Test terms with regex syntax keep pandas str.contains semantics"""
+        assert list(contains_rows(self.values, 'taco.*loco', self.index)) == [5]
+        assert list(contains_rows(self.values, '^coffee', self.index)) == [4]
+
+    def test_estimate_and_filter_rows(self):
+        """Test estimates bound the matches and candidate filtering agrees with lookups"""
+        for term in ['coffee', 'TACO', 'z co', 'missing', 'e']:
+            assert len(self.index.search(term)) <= self.index.estimate(term)
+            assert list(self.index.filter_rows(np.array([7, 3, 2, 1, 0]), term)) == [row for row in [7, 3, 2, 1, 0] if row in self._scan(term)]
+        assert self.index.estimate('missing') == 0
+
+    def test_categorical_column_matches_text_column(self):
+        """Test an index built from categorical codes answers like one built from strings"""
+        index = TrigramIndex(self.values.astype('category'))
+        assert len(index.values) == 4
+        for term in ['coffee', 'TACO', 'z co', 'missing', 'e']:
+            assert list(index.search(term)) == list(self.index.search(term))
+
+    def test_index_built_from_previous_matches_fresh_build(self):
+        """Test reusing an earlier index's postings gives the same index as building from scratch"""
+        changed = pd.Series(['Crepe Cart', 'Taco Truck', 'philz coffee', None, 'Burger Joint', 'Taco Truck'])
+        
+        reused = TrigramIndex(changed, previous=self.index)
+        fresh = TrigramIndex(changed)
+        
+        for name in ['values', 'value_rows', 'grams', 'gram_offsets', 'gram_values', 'gram_rows']:
+            np.testing.assert_array_equal(getattr(reused, name), getattr(fresh, name))
+        assert list(reused.search('coffee')) == [2]
+        assert list(reused.search('loco')) == []
+
+    def test_similar_ranks_typo_matches(self):
+        """Test fuzzy lookups tolerate typos, rank by similarity and keep exact matches first"""
+        rows, scores = self.index.similar('Phils Cofee')
+        assert list(rows) == [0, 3]
+        assert list(scores) == pytest.approx([1 - 2 / 11] * 2)
+        rows, scores = self.index.similar('coffee c')
+        assert list(rows) == [4, 0, 3]
+        assert list(scores) == pytest.approx([1, 0.75, 0.75])
+        assert len(self.index.similar('sushi')[0]) == 0
+        assert substring_edit_distance('phils', 'philz coffee') == 1
+        assert substring_edit_distance('coffee', 'philz coffee') == 0
+
+    def test_similar_keeps_every_exact_match(self):
+        """Test fuzzy lookups return every exact match even beyond the shortlist, ahead of typo matches"""
+        names = pd.Series([f'Taco Stand {number}' for number in range(2 * FUZZY_SHORTLIST)] + ['Tako Stand'])
+        index = TrigramIndex(names)
+        
+        rows, scores = index.similar('Taco Stand')
+        
+        assert set(index.search('Taco Stand')) <= set(rows)
+        assert len(rows) == len(names)
+        assert list(scores[:-1]) == [1] * 2 * FUZZY_SHORTLIST
+        assert rows[-1] == 2 * FUZZY_SHORTLIST and scores[-1] == pytest.approx(0.9)
+
+    def test_token_index_matches_all_or_any_terms(self):
+        """Test item lookups normalize plurals and combine terms with AND or OR"""
+        index = TokenIndex(pd.Series([
+            'Tacos: Burritos', 'Hot Dogs: Sandwiches', np.nan, 'Taco Plates: Hot Chocolate', 'Candies: Sodas', 'Tacos: Burritos'
+        ]).astype('category'))
+        assert parse_terms('Tacos, hot dogs;') == [['taco'], ['hot', 'dog']]
+        assert list(index.match(parse_terms('taco'))) == [0, 3, 5]
+        assert list(index.match(parse_terms('tacos, burrito'))) == [0, 5]
+        assert list(index.match(parse_terms('hot dogs'))) == [1]
+        assert list(index.match(parse_terms('hot dogs, candy'), match_all=False)) == [1, 4]
+        assert list(index.match(parse_terms('sandwich, sushi'), match_all=False)) == [1]
+        assert len(index.match(parse_terms('sushi'))) == 0
+        assert index.estimate(parse_terms('taco, burrito')) == 2
+        
+        treats = TokenIndex(pd.Series(['Cookies: Veggie Wraps', 'Cookie: Veggies', 'Pies: Candy', 'Smoothies']))
+        assert list(treats.match(parse_terms('cookie'))) == list(treats.match(parse_terms('cookies'))) == [0, 1]
+        assert list(treats.match(parse_terms('veggie'))) == list(treats.match(parse_terms('veggies'))) == [0, 1]
+        assert list(treats.match(parse_terms('pie, candies'))) == [2]
+        assert list(treats.match(parse_terms('smoothie'))) == [3]
+        assert index.estimate(parse_terms('taco, candy'), match_all=False) == 4
+
+
+class TestValuePartitions:
+    def setup_method(self):
+        """Set up partitions over a status column with a missing value"""
+        self.partitions = ValuePartitions(pd.Series(['APPROVED', 'EXPIRED', np.nan, 'APPROVED', 'REQUESTED']))
+
+    def test_rows_and_masks(self):
+        """Test each value's rows and bitmap agree"""
+        assert list(self.partitions.rows('APPROVED')) == [0, 3]
+        assert list(self.partitions.mask('APPROVED')) == [True, False, False, True, False]
+        assert self.partitions.count('EXPIRED') == 1
+
+    def test_all_rows_when_no_value(self):
+        """Test that no value selects every row, including missing ones"""
+        assert list(self.partitions.rows()) == [0, 1, 2, 3, 4]
+        assert self.partitions.mask().all()
+
+    def test_unknown_value_is_empty(self):
+        """Test that a value absent from the data selects nothing"""
+        assert len(self.partitions.rows('SUSPEND')) == 0
+        assert not self.partitions.mask('SUSPEND').any()
+
+    def test_partitions_are_read_only(self):
+        """Test that shared partitions cannot be modified by a request"""
+        with pytest.raises(ValueError):
+            self.partitions.mask('APPROVED')[1] = True
+
 
 class TestSearchUtils:
     def setup_method(self):
@@ -94,6 +359,12 @@ class TestSearchUtils:
         results = search_by_name(self.test_data, 'Nonexistent')
         assert len(results) == 0
 
+    def test_search_by_name_with_snapshot(self):
+        """Test name search over a prebuilt snapshot uses the trigram index"""
+        snapshot = DataSnapshot.build(self.test_data)
+        results = search_by_name(snapshot, 'truck 2')
+        assert list(results['locationid']) == [2]
+
     def test_search_by_name_missing_applicant(self):
         """Test name search with missing applicant"""
         with pytest.raises(ValueError, match="Applicant name required"):
@@ -121,11 +392,47 @@ class TestSearchUtils:
         results = search_by_street(self.test_data, 'Nonexistent')
         assert len(results) == 0
 
+    def test_search_by_street_with_snapshot(self):
+        """Test street search over a prebuilt snapshot with a status filter"""
+        snapshot = DataSnapshot.build(self.test_data)
+        results = search_by_street(snapshot, 'st', StatusType.APPROVED)
+        assert list(results['locationid']) == [1, 3]
+
     def test_search_by_street_missing_street(self):
         """Test street search with missing street"""
         with pytest.raises(ValueError, match="Street name required"):
             search_by_street(self.test_data, '')
 
+    def test_search_by_food_items(self):
+        """Test food item search with all or any items and a status filter"""
+        assert list(search_by_food_items(self.test_data, 'taco')['locationid']) == [1, 2]
+        assert list(search_by_food_items(self.test_data, 'tacos, burritos')['locationid']) == [1]
+        assert list(search_by_food_items(self.test_data, 'burrito, pizza', TermMatch.ANY)['locationid']) == [1, 4]
+        assert list(search_by_food_items(self.test_data, 'tacos', status=StatusType.REQUESTED)['locationid']) == [2]
+        with pytest.raises(ValueError, match="Food items required"):
+            search_by_food_items(self.test_data, ' , ')
+
+    def test_compound_search_runs_most_selective_predicate_first(self):
+        """Test compound predicates are ordered by estimated rows and intersected"""
+        snapshot = DataSnapshot.build(self.test_data)
+        request = SearchRequest(query_type=SearchType.COMPOUND, applicant='taco', food_items='quesadillas', facility_type='push cart')
+        plan = plan_compound(snapshot, compound_predicates(request))
+        with profiling(SearchProfile()) as profile:
+            rows, distances = run_compound(snapshot, plan)
+        assert [step["predicate"] for step in profile.steps] == ['food_items', 'facility_type', 'applicant']
+        assert [step["candidates"] for step in profile.steps] == [1, 1, 1]
+        assert [step["mode"] for step in profile.steps] == ['lookup', 'filter', 'filter']
+        assert list(rows) == [1] and distances is None
+
+        nearby = SearchRequest(query_type=SearchType.COMPOUND, street='st', status=StatusType.APPROVED, latitude=37.7649,
+                               longitude=-122.4294, radius_km=5)
+        hits = execute_search(snapshot, nearby, 10)
+        assert list(hits.rows) == [2, 0]
+        assert list(hits.distances) == sorted(hits.distances)
+        assert len(execute_search(snapshot, nearby.model_copy(update={"radius_km": 1}), 10).rows) == 1
+        with pytest.raises(ValueError, match="Compound search requires"):
+            execute_search(snapshot, SearchRequest(query_type=SearchType.COMPOUND, latitude=37.7, longitude=-122.4), 10)
+
     def test_search_by_proximity_valid(self):
         """Test proximity search with valid coordinates"""
         results = search_by_proximity(self.test_data, 37.7749, -122.4194)
@@ -140,6 +447,20 @@ class TestSearchUtils:
         assert len(results) == 2
         assert all(results['Status'] == 'APPROVED')
 
+    def test_search_by_proximity_with_radius(self):
+        """Test radius search returns only trucks within the radius"""
+        results = search_by_proximity(self.test_data, 37.7749, -122.4194, None, radius_km=1.5)
+        assert sorted(results['locationid']) == [1, 2, 3]
+        assert all(results['Distance'] <= 1.5)
+        
+        results = search_by_proximity(self.test_data, 37.7749, -122.4194, None, radius_km=1.0)
+        assert list(results['locationid']) == [1]
+
+    def test_search_by_proximity_invalid_radius(self):
+        """Test radius search rejects a non-positive radius"""
+        with pytest.raises(ValueError, match="Radius must be positive"):
+            search_by_proximity(self.test_data, 37.7749, -122.4194, None, radius_km=0)
+
     def test_search_by_proximity_missing_coordinates(self):
         """Test proximity search with missing coordinates"""
         with pytest.raises(ValueError, match="Latitude and longitude required"):
@@ -162,6 +483,267 @@ class TestSearchUtils:
         # First result should have distance 0 (same coordinates)
         assert results.iloc[0]['Distance'] == 0.0
 
+    def test_search_by_proximity_with_snapshot(self):
+        """Test proximity search over a prebuilt snapshot matches the DataFrame path"""
+        snapshot = DataSnapshot.build(self.test_data)
+        from_snapshot = search_by_proximity(snapshot, 37.7749, -122.4194, None)
+        from_frame = search_by_proximity(self.test_data, 37.7749, -122.4194, None)
+        assert list(from_snapshot['locationid']) == list(from_frame['locationid'])
+        assert list(from_snapshot['Distance']) == sorted(from_snapshot['Distance'])
+
+    def test_search_by_proximity_with_limit(self):
+        """Test that a limit returns only the nearest rows, in order"""
+        full = search_by_proximity(self.test_data, 37.7749, -122.4194, None)
+        limited = search_by_proximity(self.test_data, 37.7749, -122.4194, None, limit=2)
+        assert list(limited['locationid']) == list(full['locationid'][:2])
+
+    def test_execute_search_returns_row_positions(self):
+        """Test that the pipeline returns row positions without copying data"""
+        snapshot = DataSnapshot.build(self.test_data)
+        request = SearchRequest(query_type=SearchType.NAME, applicant='Taco')
+        hits = execute_search(snapshot, request, result_limit(request))
+        assert isinstance(hits, SearchHits)
+        assert list(hits.rows) == [0, 1]
+        assert hits.distances is None
+
+    def test_execute_search_applies_limit(self):
+        """Test that the pipeline returns at most limit hits, nearest first"""
+        snapshot = DataSnapshot.build(self.test_data)
+        request = SearchRequest(query_type=SearchType.PROXIMITY, latitude=37.7749, longitude=-122.4194, limit=2)
+        hits = execute_search(snapshot, request, result_limit(request))
+        assert len(hits.rows) == 2
+        assert list(hits.distances) == sorted(hits.distances)
+
+    def test_find_nearest_batch_matches_single_queries(self, monkeypatch):
+        """Test batched nearest-neighbour search against one query at a time, for both strategies"""
+        snapshot = DataSnapshot.build(self.test_data)
+        latitudes = [37.7749, 37.79, 37.76]
+        longitudes = [-122.4194, -122.40, -122.43]
+        limits = [1, 2, 4]
+        for max_rows in (search_utils.BATCH_MATRIX_MAX_ROWS, 1):
+            monkeypatch.setattr(search_utils, 'BATCH_MATRIX_MAX_ROWS', max_rows)
+            for status in (None, StatusType.APPROVED):
+                batch = find_nearest_batch(snapshot, latitudes, longitudes, status, limits)
+                for hits, lat, lon, limit in zip(batch, latitudes, longitudes, limits):
+                    single = find_by_proximity(snapshot, lat, lon, status, limit)
+                    assert np.array_equal(hits.rows, single.rows)
+                    assert np.array_equal(hits.distances, single.distances)
+
+    def test_execute_batch_keeps_order_and_errors(self):
+        """Test batch execution returns hits in request order and isolates failing requests"""
+        snapshot = DataSnapshot.build(self.test_data)
+        requests = [
+            SearchRequest(query_type=SearchType.PROXIMITY, latitude=37.7949, longitude=-122.3994, limit=1),
+            SearchRequest(query_type=SearchType.NAME, applicant=''),
+            SearchRequest(query_type=SearchType.STREET, street='Castro'),
+            SearchRequest(query_type=SearchType.PROXIMITY, latitude=37.7749, longitude=-122.4194, limit=1)
+        ]
+        results = execute_batch(snapshot, requests, [result_limit(r) for r in requests])
+        assert list(results[0].rows) == [3]
+        assert isinstance(results[1], ValueError)
+        assert list(results[2].rows) == [2]
+        assert list(results[3].rows) == [0]
+
+    def test_sharded_search_matches_single_snapshot(self):
+        """Test that searching shards gives the hits of one snapshot holding all their rows"""
+        single = DataSnapshot.build(self.test_data)
+        sharded = ShardedSnapshot([
+            ('north', DataSnapshot.build(self.test_data.iloc[:2].reset_index(drop=True))),
+            ('south', DataSnapshot.build(self.test_data.iloc[2:].reset_index(drop=True)))
+        ])
+        requests = [
+            SearchRequest(query_type=SearchType.NAME, applicant='a', limit=3),
+            SearchRequest(query_type=SearchType.NAME, applicant='Tako Truk', fuzzy=True, limit=3),
+            SearchRequest(query_type=SearchType.STREET, street='St', status=StatusType.APPROVED),
+            SearchRequest(query_type=SearchType.FOOD_ITEMS, food_items='tacos, pizza', match=TermMatch.ANY, limit=3),
+            SearchRequest(query_type=SearchType.COMPOUND, food_items='tacos, pizza', match=TermMatch.ANY, facility_type='truck'),
+            SearchRequest(query_type=SearchType.COMPOUND, street='st', latitude=37.7949, longitude=-122.3994, limit=2),
+            SearchRequest(query_type=SearchType.PROXIMITY, latitude=37.7649, longitude=-122.4294, status=None, limit=3),
+            SearchRequest(query_type=SearchType.PROXIMITY, latitude=37.7949, longitude=-122.3994, radius_km=2, status=None)
+        ]
+        for request in requests:
+            expected = execute_search(single, request, result_limit(request))
+            hits = execute_search(sharded, request, result_limit(request))
+            assert list(hits.rows) == list(expected.rows)
+            assert sharded.truck_fragments(hits.rows) == single.truck_fragments(expected.rows)
+            assert list(materialize(sharded, hits)['locationid']) == list(materialize(single, expected)['locationid'])
+        assert isinstance(execute_batch(sharded, [SearchRequest(query_type=SearchType.NAME, applicant='')], [10])[0], ValueError)
+
+    def test_sharded_proximity_skips_distant_shards(self, monkeypatch):
+        """Test that nearest-neighbour routing never searches a shard farther than the hits found"""
+        near = DataSnapshot.build(self.test_data)
+        far = DataSnapshot.build(self.test_data.assign(Latitude=40.7, Longitude=-74.0))  # New York
+        sharded = ShardedSnapshot([('far', far), ('near', near)])
+        searched = []
+        find = search_utils.find_by_proximity
+        monkeypatch.setattr(search_utils, 'find_by_proximity', lambda snapshot, *args: searched.append(snapshot) or find(snapshot, *args))
+        request = SearchRequest(query_type=SearchType.PROXIMITY, latitude=37.7749, longitude=-122.4194, status=None, limit=2)
+        hits = execute_search(sharded, request, 2)
+        assert searched == [near]
+        assert list(hits.rows) == [4, 5]
+
+    def test_result_limit_defaults(self):
+        """Test default result limits per search type"""
+        assert result_limit(SearchRequest(query_type=SearchType.NAME, applicant='Taco', limit=None)) == 10
+        assert result_limit(SearchRequest(query_type=SearchType.PROXIMITY, latitude=37.7, longitude=-122.4, limit=None)) == 5
+        assert result_limit(SearchRequest(query_type=SearchType.NAME, applicant='Taco', limit=20)) == 20
+        radius = SearchRequest(query_type=SearchType.PROXIMITY, latitude=37.7, longitude=-122.4, radius_km=1)
+        assert result_limit(radius) == MAX_RADIUS_RESULTS
+
+    def test_materialize_leaves_snapshot_untouched(self):
+        """Test that materializing hits copies only those rows and never modifies the snapshot"""
+        snapshot = DataSnapshot.build(self.test_data)
+        hits = find_by_proximity(snapshot, 37.7749, -122.4194, None, limit=1)
+        df = materialize(snapshot, hits)
+        assert list(df['locationid']) == [1]
+        assert df.iloc[0]['Distance'] == 0.0
+        assert 'Distance' not in snapshot.data.columns
+
+
+class TestResultCache:
+    def setup_method(self):
+        """Set up a cache with a controllable clock"""
+        self.now = 0.0
+        self.cache = ResultCache(max_entries=2, ttl_seconds=10, clock=lambda: self.now)
+        self.snapshot = DataSnapshot(pd.DataFrame({'locationid': [1]}), version=1)
+
+    def test_hit_and_miss(self):
+        """Test that a cached result is returned and counted"""
+        assert self.cache.get(self.snapshot, 'a') is None
+        self.cache.put(self.snapshot, 'a', 'result')
+        assert self.cache.get(self.snapshot, 'a') == 'result'
+        stats = self.cache.stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+
+    def test_least_recently_used_is_evicted(self):
+        """Test LRU eviction when the cache is full"""
+        self.cache.put(self.snapshot, 'a', 1)
+        self.cache.put(self.snapshot, 'b', 2)
+        self.cache.get(self.snapshot, 'a')
+        self.cache.put(self.snapshot, 'c', 3)
+        assert self.cache.get(self.snapshot, 'b') is None
+        assert self.cache.get(self.snapshot, 'a') == 1
+        assert self.cache.stats()['evictions'] == 1
+
+    def test_entries_expire(self):
+        """Test that entries are dropped after their time-to-live"""
+        self.cache.put(self.snapshot, 'a', 1)
+        self.now = 10
+        assert self.cache.get(self.snapshot, 'a') is None
+        assert self.cache.stats()['expirations'] == 1
+
+    def test_new_snapshot_invalidates(self):
+        """Test that publishing a new snapshot drops every cached result"""
+        self.cache.put(self.snapshot, 'a', 1)
+        reloaded = DataSnapshot(self.snapshot.data, version=2)
+        assert self.cache.get(reloaded, 'a') is None
+        stats = self.cache.stats()
+        assert stats['size'] == 0
+        assert stats['invalidations'] == 1
+
+    def test_disabled_cache_stores_nothing(self):
+        """Test that a zero-sized cache never stores results"""
+        cache = ResultCache(max_entries=0, ttl_seconds=10)
+        cache.put(self.snapshot, 'a', 1)
+        assert cache.get(self.snapshot, 'a') is None
+
+    def test_request_cache_key_quantizes_coordinates(self):
+        """Test that nearby coordinates share a key and distant ones do not"""
+        first = SearchRequest(query_type=SearchType.PROXIMITY, latitude=37.77491, longitude=-122.41942)
+        nearby = SearchRequest(query_type=SearchType.PROXIMITY, latitude=37.77489, longitude=-122.41938)
+        distant = SearchRequest(query_type=SearchType.PROXIMITY, latitude=37.7849, longitude=-122.4194)
+        assert request_cache_key(first, 5, 4) == request_cache_key(nearby, 5, 4)
+        assert request_cache_key(first, 5, 4) != request_cache_key(distant, 5, 4)
+        assert request_cache_key(first, 5, 4) != request_cache_key(first, 10, 4)
+
+    def test_request_cache_key_ignores_case_of_literal_terms(self):
+        """Test that literal search terms are normalized to lower case"""
+        upper = SearchRequest(query_type=SearchType.NAME, applicant='TACO')
+        lower = SearchRequest(query_type=SearchType.NAME, applicant='taco')
+        street = SearchRequest(query_type=SearchType.STREET, street='taco')
+        assert request_cache_key(upper, 5, 4) == request_cache_key(lower, 5, 4)
+        assert request_cache_key(lower, 5, 4) != request_cache_key(street, 5, 4)
+
+    def test_request_cache_key_normalizes_food_items(self):
+        """Test that food item searches for the same items in any order and form share a key"""
+        first = SearchRequest(query_type=SearchType.FOOD_ITEMS, food_items='Tacos, Hot Dogs')
+        second = SearchRequest(query_type=SearchType.FOOD_ITEMS, food_items='hot dog: taco')
+        either = SearchRequest(query_type=SearchType.FOOD_ITEMS, food_items='tacos, hot dogs', match=TermMatch.ANY)
+        assert request_cache_key(first, 10, 4) == request_cache_key(second, 10, 4)
+        assert request_cache_key(first, 10, 4) != request_cache_key(either, 10, 4)
+        compound = SearchRequest(query_type=SearchType.COMPOUND, food_items='Tacos', facility_type='Truck', street='MISSION')
+        same = SearchRequest(query_type=SearchType.COMPOUND, food_items='taco', facility_type='truck', street='mission')
+        assert request_cache_key(compound, 10, 4) == request_cache_key(same, 10, 4)
+        assert request_cache_key(compound, 10, 4) != request_cache_key(compound.model_copy(update={"status": StatusType.APPROVED}), 10, 4)
+
+    def test_cursor_round_trip_and_rejection(self):
+        """Test that cursors decode only for the search and snapshot version they were issued for"""
+        key = ('name', 'taco', None, 10000)
+        cursor = encode_cursor(3, key, 20)
+        assert decode_cursor(cursor, 3, key) == 20
+        for bad_cursor, version, bad_key in [('not a cursor', 3, key), (cursor, 4, key), (cursor, 3, ('name', 'burger', None, 10000))]:
+            with pytest.raises(CursorError):
+                decode_cursor(bad_cursor, version, bad_key)
+
+
+class TestSearchProfile:
+    def test_nested_stages_are_timed_exclusively(self):
+        """Test time in a nested stage is not counted again in the enclosing one"""
+        ticks = iter([0.0, 1.0, 3.0, 4.0, 6.0, 10.0])
+        profile = SearchProfile(clock=lambda: next(ticks))
+        with profiling(profile):
+            with profile_stage('filter'):
+                with profile_stage('distance'):
+                    pass
+            record_step('status', 'status_partitions', 3, estimate=5)
+        explain = profile.to_dict()
+        assert explain["timings_ms"]["filter"] == 4000.0
+        assert explain["timings_ms"]["distance"] == 1000.0
+        assert explain["plan"] == [{"predicate": "status", "index": "status_partitions", "candidates": 3, "estimate": 5}]
+        assert explain["total_ms"] == 10000.0
+
+    def test_nothing_is_recorded_without_active_profile(self):
+        """Test the reporting helpers are no-ops outside an explained search"""
+        profile = SearchProfile()
+        with profile_stage('filter'):
+            record_step('status', 'status_partitions', 3)
+        assert profile.steps == [] and profile.timings["filter"] == 0.0
+
+
+class TestWorkerPool:
+    def test_run_returns_result(self):
+        """Test that a job's result is returned to the caller"""
+        pool = WorkerPool(max_workers=2, max_queue=2)
+        assert asyncio.run(pool.run(sum, [1, 2, 3])) == 6
+        stats = pool.stats()
+        assert stats['completed'] == 1
+        assert stats['pending'] == 0
+
+    def test_run_reraises_errors(self):
+        """Test that a job's exception reaches the caller and frees its slot"""
+        pool = WorkerPool(max_workers=1, max_queue=0)
+        with pytest.raises(ValueError):
+            asyncio.run(pool.run(int, 'not a number'))
+        assert pool.stats()['pending'] == 0
+
+    def test_saturated_pool_rejects(self):
+        """Test that jobs beyond workers plus queue depth are rejected immediately"""
+        pool = WorkerPool(max_workers=1, max_queue=1)
+        release = threading.Event()
+
+        async def submit_three():
+            first = asyncio.ensure_future(pool.run(release.wait))
+            second = asyncio.ensure_future(pool.run(release.wait))
+            await asyncio.sleep(0)
+            with pytest.raises(PoolSaturatedError):
+                await pool.run(release.wait)
+            release.set()
+            return await asyncio.gather(first, second)
+
+        assert asyncio.run(submit_three()) == [True, True]
+        assert pool.stats()['rejected'] == 1
+
 
 class TestMappers:
     def setup_method(self):
@@ -197,6 +779,38 @@ class TestMappers:
         assert food_trucks[0].food_items is None
         assert food_trucks[1].facility_type is None
 
+    def test_serialize_food_trucks(self):
+        """Test pre-serialized trucks match the FoodTruck model's JSON"""
+        fragments = serialize_food_trucks(self.test_data)
+        assert set(fragments) == {1, 2}
+        expected = convert_to_food_trucks(self.test_data)[0].model_dump(mode='json', by_alias=True)
+        assert json.loads(fragments[1]) == expected
+
+    def test_serialize_food_trucks_skips_invalid_rows(self):
+        """Test that rows failing validation get no cached fragment"""
+        invalid = self.test_data.copy()
+        invalid.loc[1, 'permit'] = np.nan
+        assert set(serialize_food_trucks(invalid)) == {1}
+
+    def test_assemble_search_response(self):
+        """Test assembling a response body from fragments"""
+        fragments = serialize_food_trucks(self.test_data)
+        body = assemble_search_response("Found 2 results.", [fragments[2], fragments[1]], {"limit": 2})
+        response = json.loads(body)
+        assert response["success"] is True
+        assert response["message"] == "Found 2 results."
+        assert [truck["locationid"] for truck in response["data"]] == [2, 1]
+        assert response["metadata"] == {"limit": 2}
+
+    def test_stream_search_response_matches_assembled_body(self):
+        """Test that a streamed body equals the assembled one however the fragments are blocked"""
+        fragments = serialize_food_trucks(self.test_data)
+        blocks = [[fragments[2]], [], [fragments[1]]]
+        streamed = b"".join(stream_search_response("Found 2 results.", iter(blocks), {"limit": 2}))
+        assert streamed == assemble_search_response("Found 2 results.", [fragments[2], fragments[1]], {"limit": 2})
+        assert b"".join(stream_search_response("Found 0 results.", [], {})) == assemble_search_response("Found 0 results.", [], {})
+        assert b"".join(stream_ndjson(blocks)) == fragments[2] + b"\n" + fragments[1] + b"\n"
+
     def test_create_search_metadata_name_search(self):
         """Test metadata creation for name search"""
         metadata = create_search_metadata(
@@ -223,6 +837,19 @@ class TestMappers:
         assert metadata['limit'] == 5
         assert metadata['search_coordinates']['latitude'] == 37.7749
         assert metadata['search_coordinates']['longitude'] == -122.4194
+        assert 'radius_km' not in metadata
+
+    def test_create_search_metadata_radius_search(self):
+        """Test metadata creation for radius-bounded proximity search"""
+        metadata = create_search_metadata(
+            SearchType.PROXIMITY,
+            None,
+            1000,
+            latitude=37.7749,
+            longitude=-122.4194,
+            radius_km=0.5
+        )
+        assert metadata['radius_km'] == 0.5
 
     def test_create_search_metadata_no_status(self):
         """Test metadata creation without status filter"""